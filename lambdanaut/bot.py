@@ -1,12 +1,13 @@
 from collections import defaultdict
-import copy
 import itertools
+import logging
 import math
 import os
 from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 import lib.sc2 as sc2
 import lib.sc2.constants as const
+from lib.sc2.cache import property_cache_once_per_frame_no_copy
 from lib.sc2.position import Point2, Point3
 from lib.sc2.pixel_map import PixelMap
 from lib.sc2.unit import Unit
@@ -17,6 +18,8 @@ from lambdanaut import VERSION, DEBUG, CREATE_DEBUG_UNITS
 import lambdanaut.builds as builds
 import lambdanaut.const2 as const2
 import lambdanaut.clustering as clustering
+from lambdanaut.combat_estimation import CombatEstimator
+from lambdanaut.distance_fields import DistanceFields
 from lambdanaut.managers import Manager
 from lambdanaut.managers.build import BuildManager
 from lambdanaut.managers.defense import DefenseManager
@@ -25,20 +28,29 @@ from lambdanaut.managers.intel import IntelManager
 from lambdanaut.managers.micro import MicroManager
 from lambdanaut.managers.overlord import OverlordManager
 from lambdanaut.managers.resource import ResourceManager
+from lambdanaut.path_cache import MISSING, PathCache
 from lambdanaut.pathfinding import Pathfinder
+from lambdanaut.pathfinding_service import PathfindingService, PathRequest
+from lambdanaut.threat_maps import ThreatMap, ThreatMaps
 import lambdanaut.unit_cache as unit_cache
 import lambdanaut.utils as utils
 
 from lambdanaut.const2 import Messages
 from lambdanaut.builds import Builds
 
+logger = logging.getLogger(__name__)
+
 
 BUILD = Builds.OPENER_DEFAULT
 
 
 class Lambdanaut(sc2.BotAI):
 
-    distance_calculation_method = 0
+    distance_calculation_method = 4
+
+    # Keep army clusters stable across frames and only reassign units that moved, see clustering.IncrementalClustering
+    # If False, the clusters are recalculated from scratch on every update
+    incremental_clustering = True
 
     def __init__(self, **kwargs):
         """
@@ -101,6 +113,10 @@ class Lambdanaut(sc2.BotAI):
         self.army_clusters: List[clustering.Cluster] = None
         self.enemy_clusters: List[clustering.Cluster] = None
 
+        # Incremental updaters of the clusters above if `incremental_clustering` is set
+        self.army_clustering: clustering.IncrementalClustering = None
+        self.enemy_clustering: clustering.IncrementalClustering = None
+
         # Fastest path to the enemy start location
         self.shortest_path_to_enemy_start_location: List[Tuple[int, int]] = None
 
@@ -114,6 +130,31 @@ class Lambdanaut(sc2.BotAI):
         # TODO: Update this to include new structures we see
         self.mobility_grid: PixelMap = None
 
+        # Ground distance fields over self.pathing_grid towards key locations
+        self.distance_fields: DistanceFields = None
+
+        # Paths found on our pixel maps, invalidated when a map changes
+        self.path_cache: PathCache = PathCache()
+
+        # Lanchester strengths of groups of units, memoized per frame. See `relative_army_strength`
+        self.combat_estimator: CombatEstimator = CombatEstimator(self)
+
+        # Air ranges of enemy units last drawn by get_path_around_ranges
+        self.air_range_grid: PixelMap = None
+
+        # Searches paths in worker processes, off the event loop
+        self.pathfinding_service: PathfindingService = PathfindingService()
+
+        # Background path requests whose results go into self.path_cache once they're done.
+        # List of (pixel map, its version when submitted, start, goal, request)
+        self._uncached_path_requests: List[Tuple[PixelMap, int, Tuple[int, int], Tuple[int, int], PathRequest]] = []
+
+        # Scratch threat map of get_path_around_ranges
+        self.path_threat_map: ThreatMap = None
+
+        # Ground and air threat of remembered enemy units. See self.threat_maps.
+        self._threat_maps: ThreatMaps = None
+
         # Sorted list of points that designate high-priority attack points. Sorted from high->low.
         # High priority usually means lots of workers to kill.
         self.priority_spaces: List[Point2] = []
@@ -125,6 +166,10 @@ class Lambdanaut(sc2.BotAI):
         # except AttributeError:
         #     self.enemy_race = sc2.data.Race.Zerg
 
+    async def on_start(self):
+        # Fork the path search workers before the game steps, not on the first request mid-game
+        self.pathfinding_service.start()
+
     async def on_step(self, iteration):
         self.iteration = iteration
 
@@ -137,6 +182,10 @@ class Lambdanaut(sc2.BotAI):
             self.enemy_clusters = clustering.get_fresh_clusters(
                 [], k=7, center_around=self.game_info.map_center)
 
+            if self.incremental_clustering:
+                self.army_clustering = clustering.IncrementalClustering(self.army_clusters)
+                self.enemy_clustering = clustering.IncrementalClustering(self.enemy_clusters)
+
             # Update the default builds based on the enemy's race
             builds.update_default_builds(self.enemy_race)
 
@@ -150,6 +199,13 @@ class Lambdanaut(sc2.BotAI):
             # Update our local copies of different pixel maps (pathing_grid, blank_pixel_map, etc...)
             self.update_pixel_maps()
 
+            # Set up the threat maps
+            self.path_threat_map = ThreatMap(self.pathing_grid.width, self.pathing_grid.height, air=True)
+            self._threat_maps = ThreatMaps(self.pathing_grid.width, self.pathing_grid.height)
+
+            # Set up the distance fields towards static locations
+            self.update_distance_fields()
+
             # Update the pathing variables
             self.update_shortest_path_to_enemy_start_location()
 
@@ -196,6 +252,9 @@ class Lambdanaut(sc2.BotAI):
         # Update the unit cache with remembered friendly and enemy units
         self.update_unit_caches()
 
+        # Collect finished background path searches and drop stale ones
+        self.update_pathfinding_service()
+
         await self.intel_manager.run()  # Run before all other managers
 
         await self.resource_manager.run()
@@ -220,6 +279,14 @@ class Lambdanaut(sc2.BotAI):
         # Update high priority spaces we should favor attacking
         self.update_priority_spaces()
 
+    async def on_end(self, game_result):
+        self.pathfinding_service.shutdown()
+
+        logger.info("Step time in ms (min, avg, max, last): %s", self.step_time)
+        logger.info("Pathing grid (steps without refetch, refetches, footprints patched, "
+                    "avg refetch ms, avg update ms): %s", self.pathing_grid_stats)
+        logger.info("Path cache (hits, misses, evictions, bytes): %s", self.path_cache_stats)
+
     async def on_unit_created(self, unit):
         self.publish(None, Messages.UNIT_CREATED, unit)
 
@@ -238,10 +305,16 @@ class Lambdanaut(sc2.BotAI):
     async def on_building_construction_complete(self, unit: Unit):
         self.publish(None, Messages.STRUCTURE_COMPLETE, unit)
 
-    @property
+    @property_cache_once_per_frame_no_copy
     def _units(self):
         return self.units | self.structures
 
+    @property_cache_once_per_frame_no_copy
+    def threat_maps(self) -> ThreatMaps:
+        """Ground and air threat maps of the enemy units we remember, updated once per frame"""
+        self._threat_maps.update(u.snapshot for u in self.enemy_cache.values())
+        return self._threat_maps
+
     @property
     def start_location(self) -> Point2:
         """Set start location to map center if there is not one"""
@@ -371,6 +444,12 @@ class Lambdanaut(sc2.BotAI):
         our_army = [u for u in self.unit_cache.values() if u.type_id not in types_to_exclude]
         enemy_army = [u for u in self.enemy_cache.values() if u.type_id not in types_to_exclude]
 
+        if self.incremental_clustering:
+            # Empty armies are passed on as well, so the clusters of a dead army are emptied
+            self.army_clustering.update(our_army)
+            self.enemy_clustering.update(enemy_army)
+            return
+
         if our_army:
             clustering.k_means_update(self.army_clusters, our_army)
 
@@ -418,17 +497,18 @@ class Lambdanaut(sc2.BotAI):
 
             if cluster:
 
+                type_counts = cluster.stats.type_counts
+
                 # Get counts of cluster workers.
-                worker_count = sum(1 for u in cluster if u.type_id in const2.WORKERS) + 1
-                townhalls = [u for u in cluster if u.type_id in const2.TOWNHALLS]
-                if townhalls \
-                        and self.game_loop_to_seconds(self.state.game_loop - townhalls[0].last_seen) > 30 \
-                        and worker_count < 10:
-                    # If we haven't seen the townhall in a while, assume additional workers
-                    worker_count += 8
+                worker_count = sum(type_counts[t] for t in const2.WORKERS) + 1
+                if worker_count < 10 and any(type_counts[t] for t in const2.TOWNHALLS):
+                    townhall = next(u for u in cluster if u.type_id in const2.TOWNHALLS)
+                    if self.game_loop_to_seconds(self.state.game_loop - townhall.last_seen) > 30:
+                        # If we haven't seen the townhall in a while, assume additional workers
+                        worker_count += 8
 
                 # Get static defense count
-                static_defense_count = sum(1 for u in cluster if u.type_id in const2.DEFENSIVE_STRUCTURES) + 1
+                static_defense_count = sum(type_counts[t] for t in const2.DEFENSIVE_STRUCTURES) + 1
 
                 # Distance from their start location. Further == better
                 # Divide by 15 so it's not such a powerful weight
@@ -515,37 +595,51 @@ class Lambdanaut(sc2.BotAI):
         """
 
         # Update Blank Pixel Map
-        blank_pixel_map = copy.deepcopy(self.game_info.pathing_grid)
-
-        utils.blank_out_pixel_map(blank_pixel_map)
-
-        self.blank_pixel_map = blank_pixel_map
+        self.blank_pixel_map = PixelMap.zeros_like(self.game_info.pathing_grid)
 
         # Update Pathing Grid
-        pathing_grid = copy.deepcopy(self.game_info.pathing_grid)
+        pathing_grid = self.game_info.pathing_grid.clone()
 
         start_locations = [self.start_location] + self.enemy_start_locations
         start_locations = [loc.rounded for loc in start_locations]
 
         # Flood fill the start locations to eliminate the structures pathing block
         for start_location in start_locations:
-            for p in pathing_grid.flood_fill(start_location, lambda x: x == 0):
-                pathing_grid[p] = 1
+            pathing_grid.set_where(pathing_grid.flood_fill_mask(start_location, lambda x: x == 0), 1)
 
         self.pathing_grid = pathing_grid
 
         # Update Mobility Grid
-        self.mobility_grid = copy.deepcopy(self.game_info.pathing_grid)
+        self.mobility_grid = self.game_info.pathing_grid.clone()
+
+    def update_distance_fields(self):
+        """
+        Creates the distance fields over self.pathing_grid and registers the key locations
+        whose ground distances don't change during the game.
+
+        Meant to be called on the first iteration of the game, after update_pixel_maps.
+        """
+
+        distance_fields = DistanceFields(self.pathing_grid)
+
+        key_locations = [self.start_location, self.pathable_start_location] + self.enemy_start_locations
+        key_locations += list(self.expansion_locations.keys())
+        key_locations += [ramp.top_center for ramp in self._game_info.map_ramps]
+
+        for location in key_locations:
+            if location is not None:
+                distance_fields.add_key_location(location)
+
+        self.distance_fields = distance_fields
 
     def update_shortest_path_to_enemy_start_location(self):
         """
         Updates the stored shortest path to the enemy start location
         """
 
-        pathfinder = Pathfinder(self.pathing_grid)
-
-        shortest_path = pathfinder.find_path(
-            self.start_location.rounded, self.enemy_start_location.rounded)
+        # Enemy start locations are key locations, so read the path off the distance field
+        field = self.distance_fields.field(self.enemy_start_location)
+        shortest_path = field.path(self.start_location)
 
         if shortest_path is None:
             self.shortest_path_to_enemy_start_location = None
@@ -603,21 +697,13 @@ class Lambdanaut(sc2.BotAI):
         """
         Gets a path to `point` avoiding `units`
 
-        TODO: This doesn't use `units` right now, and only works on enemies that attack air
+        TODO: This only works on enemies that attack air
         """
 
-        # Make a copy of a blank pixel map to draw on
-        pixel_map = copy.deepcopy(self.blank_pixel_map)
-
-        # Get enemy units that can attack air
-        enemy_units = [u.snapshot for u in self.enemy_cache.values() if u.can_attack_air]
-
-        # Flood fill the pixel map with unit ranges
-        utils.draw_unit_ranges(pixel_map, units)
+        pixel_map = self.update_air_range_grid(units)
 
         # Find the path
-        pathfinder = Pathfinder(pixel_map)
-        path = pathfinder.find_path(point1, point2)
+        path = self.find_path_cached(Pathfinder, point1, point2, pixel_map)
 
         if not path:
             return None
@@ -627,6 +713,107 @@ class Lambdanaut(sc2.BotAI):
 
         return path
 
+    def request_path_around_ranges(self, units, point1: Point2, point2: Point2,
+                                   deadline: Optional[int] = None) -> PathRequest:
+        """
+        Like get_path_around_ranges, but searches in the background with self.pathfinding_service.
+        The result is an (n, 2) array of every cell of the path.
+
+        :param deadline: Game loop after which the request is dropped if it isn't done
+        """
+
+        pixel_map = self.update_air_range_grid(units)
+
+        # The service searches with Pathfinder
+        path = self.path_cache.get(pixel_map, point1, point2, Pathfinder)
+        if path is not MISSING:
+            return PathfindingService.completed(path)
+
+        request = self.pathfinding_service.submit(pixel_map, point1, point2, deadline)
+        self._uncached_path_requests.append((pixel_map, pixel_map.version, point1, point2, request))
+
+        return request
+
+    def update_pathfinding_service(self):
+        """
+        Caches the results of finished background path requests and drops the ones past their deadline
+        """
+
+        self.pathfinding_service.expire(self.state.game_loop)
+
+        pending = []
+        for pixel_map, version, start, goal, request in self._uncached_path_requests:
+            if not request.done():
+                pending.append((pixel_map, version, start, goal, request))
+            elif not request.cancelled() and request.exception() is None and pixel_map.version == version:
+                self.path_cache.put(pixel_map, start, goal, Pathfinder, request.result())
+        self._uncached_path_requests = pending
+
+    def update_air_range_grid(self, units) -> PixelMap:
+        """
+        Draws the air ranges of `units` into self.air_range_grid and returns it.
+        Set cells are in range.
+        """
+
+        # Stamp the air ranges of the units
+        threat_map = self.path_threat_map
+        threat_map.clear()
+        threat_map.add_units(units)
+        in_range = threat_map.threatened()
+
+        # Keep one grid of air ranges, so its cached paths are reused while the ranges don't change
+        if self.air_range_grid is None:
+            self.air_range_grid = PixelMap.zeros_like(self.blank_pixel_map)
+        if not numpy.array_equal(self.air_range_grid.data_numpy != 0, in_range):
+            self.air_range_grid.fill(0)
+            self.air_range_grid.set_where(in_range, 0xFF)
+
+        return self.air_range_grid
+
+    def find_path_cached(self, pathfinder: Union[Pathfinder, Callable],
+                         start: Tuple[int, int], goal: Tuple[int, int],
+                         pixel_map: PixelMap = None) -> Optional[List[Point2]]:
+        """
+        Finds a path from start to goal through self.path_cache
+
+        :param pathfinder: Pathfinder to search with, or a function creating one from `pixel_map`.
+                           Passing a function avoids creating the pathfinder when the path is cached.
+        :param start: Start cell
+        :param goal: Goal cell
+        :param pixel_map: Pixel map the path is found on. Defaults to the pixel map of `pathfinder`.
+        """
+
+        if pixel_map is None:
+            pixel_map = pathfinder.pixel_map
+
+        # Paths are cached per pathfinder class, as pathfinders read the same pixel map differently
+        kind = pathfinder if callable(pathfinder) else type(pathfinder)
+
+        path = self.path_cache.get(pixel_map, start, goal, kind)
+
+        if path is MISSING:
+            if callable(pathfinder):
+                pathfinder = pathfinder(pixel_map)
+            path = pathfinder.find_path_array(start, goal)
+            self.path_cache.put(pixel_map, start, goal, kind, path)
+
+        if path is None:
+            return None
+
+        return [Point2(p) for p in map(tuple, path.tolist())]
+
+    @property
+    def path_cache_stats(self) -> Tuple[int, int, int, int]:
+        """
+        Returns a tuple of path cache statistics, complementing self.step_time.
+        First value is the amount of paths found in the cache
+        Second value is the amount of paths that had to be searched
+        Third value is the amount of paths evicted to stay within the memory bound
+        Fourth value is the estimated memory used by the cached paths in bytes
+        """
+        cache = self.path_cache
+        return cache.hits, cache.misses, cache.evictions, cache.bytes
+
     async def get_open_expansions(self) -> List[Point2]:
         """Gets a sorted list of open expansions from the start location"""
 
@@ -648,9 +835,14 @@ class Lambdanaut(sc2.BotAI):
                 # already taken
                 continue
 
-            d = await self._client.query_pathing(start_p, el)
-            if d is None:
-                continue
+            if self.distance_fields.is_key_location(start_p):
+                d = self.distance_fields.field(start_p).distance(el)
+                if d == math.inf:
+                    continue
+            else:
+                d = await self._client.query_pathing(start_p, el)
+                if d is None:
+                    continue
 
             expansions.append(el)
 
@@ -665,6 +857,14 @@ class Lambdanaut(sc2.BotAI):
         :param end_p: Point/Unit to sort distances of each item in `l` from
         """
 
+        if self.distance_fields is not None and self.distance_fields.is_key_location(end_p):
+            # Static target: read the distances off its distance field instead of asking the server
+            l = list(l)
+            distances = self.distance_fields.field(end_p).distances_of(l)
+            order = numpy.argsort(distances, kind='stable')
+
+            return [l[i] for i in order]
+
         # Zip the list together with the start point
         zipped_list = [[start_p, end_p] for start_p in l]
 
@@ -689,12 +889,15 @@ class Lambdanaut(sc2.BotAI):
                 [(distance, dy) for dy in range(-distance, distance + 1, placement_step)]
             )]
 
-            try:
-                positions = [position for position in possible_positions
-                             if self.in_pathing_grid(position)]
-            except AssertionError:
+            # Check all positions of the ring in one lookup
+            cells = [position.rounded for position in possible_positions]
+            pathing_grid = self._game_info.pathing_grid
+            if not pathing_grid.contains_many(cells).all():
                 return None
 
+            pathable = pathing_grid.sample(cells) == 1
+            positions = [position for position, is_pathable in zip(possible_positions, pathable) if is_pathable]
+
             if positions:
                 return min(positions, key=lambda p: p.distance_to(near))
             else:
@@ -792,7 +995,7 @@ class Lambdanaut(sc2.BotAI):
             or unit.weapon_cooldown > 0
 
     def is_melee(self, unit: Unit) -> bool:
-        return unit.ground_range < 1.5 and unit.can_attack_ground
+        return utils.is_melee(unit)
 
     def health_percentage_adjusted(self, unit: Unit) -> float:
         """
@@ -881,15 +1084,8 @@ class Lambdanaut(sc2.BotAI):
         """
         Counts the number of units1 that are in attack range of at least one unit in units2
         """
-        count = 0
-        for unit1 in units1:
-            if ranged_only and self.is_melee(unit1):
-                continue
-            for unit2 in units2:
-                if unit1.target_in_range(unit2):
-                    count += 1
-                    break
-        return count
+        return clustering.get_stats(units1).count_in_attack_range_of(
+            clustering.get_stats(units2), ranged_only=ranged_only)
 
     def closest_and_most_damaged(self, unit_group, unit, priorities=None, can_attack=True):
         """
@@ -936,17 +1132,21 @@ class Lambdanaut(sc2.BotAI):
         """
         Returns the calculated standalone estimated strength of a unit
         """
-
-        if unit.ground_dps > 0 and unit.air_dps <= 0:
-            strength = unit.ground_dps
-        elif unit.air_dps > 0 and unit.ground_dps <= 0:
-            strength = unit.air_dps
+        table = self.unit_type_table
+        index = table.index(unit._proto.unit_type)
+        ground_dps = float(table.ground_dps[index])
+        air_dps = float(table.air_dps[index])
+
+        if ground_dps > 0 and air_dps <= 0:
+            strength = ground_dps
+        elif air_dps > 0 and ground_dps <= 0:
+            strength = air_dps
         else:
-            strength = (unit.ground_dps + unit.air_dps) / 2
+            strength = (ground_dps + air_dps) / 2
 
         # Arbitrarily multiply strength by 2 if they are ranged
         # TODO: Make this better
-        if unit.ground_range > 1 or unit.air_range > 1:
+        if table.ground_range[index] > 1 or table.air_range[index] > 1:
             strength *= 2
 
         return strength
@@ -956,19 +1156,7 @@ class Lambdanaut(sc2.BotAI):
         Gets an average of a unit's dps, and returns alternative values if the
         unit doesn't have dps, but still does damage (like banelings)
         """
-
-        default_dps = const2.DEFAULT_DPS_MAP.get(unit.type_id)
-        if default_dps is not None:
-            return default_dps
-
-        if unit.ground_dps > 0 >= unit.air_dps:
-            dps = unit.ground_dps
-        elif unit.air_dps > 0 >= unit.ground_dps:
-            dps = unit.air_dps
-        else:
-            dps = (unit.ground_dps + unit.air_dps) / 2
-
-        return dps
+        return utils.adjusted_dps(unit)
 
     def relative_army_strength(
             self,
@@ -983,117 +1171,10 @@ class Lambdanaut(sc2.BotAI):
 
         Uses Lanchester's Law
         https://en.wikipedia.org/wiki/Lanchester%27s_laws
+        Evaluated and memoized for the rest of the frame by `self.combat_estimator`
         """
-
-        # Filter out structures that can't attack
-        # Also filter out structures that can attack if `ignore_defensive_structures` is true
-        # Also filter out workers if ignore_workers is True
-        u1 = [u for u in units_1
-              if (not u.is_structure or u.can_attack_ground or u.can_attack_air)
-              and (not ignore_defensive_structures or u not in const2.DEFENSIVE_STRUCTURES)
-              and (ignore_workers or u.type_id not in const2.WORKERS)
-              and u not in const2.RELATIVE_ARMY_STRENGTH_TO_IGNORE]
-        u2 = [u for u in units_2
-              if (not u.is_structure or u.can_attack_ground or u.can_attack_air)
-              and (not ignore_defensive_structures or u not in const2.DEFENSIVE_STRUCTURES)
-              and (ignore_workers or u.type_id not in const2.WORKERS)
-              and u not in const2.RELATIVE_ARMY_STRENGTH_TO_IGNORE]
-
-        u1_melee = []
-        u1_ranged = []
-        for u in u1:
-            if self.is_melee(u):
-                # Melee
-                u1_melee.append(u)
-            elif u.type_id in const2.DEFAULT_DPS_MAP:
-                # Spellcasters
-                u1_ranged.append(u)
-            else:
-                # Ranged
-                u1_ranged.append(u)
-
-        u2_melee = []
-        u2_ranged = []
-        for u in u2:
-            if self.is_melee(u):
-                # Melee
-                u2_melee.append(u)
-            elif u.type_id in const2.DEFAULT_DPS_MAP:
-                # Spellcasters
-                u2_ranged.append(u)
-            else:
-                # Ranged
-                u2_ranged.append(u)
-
-        u1_melee_dps = sum(self.adjusted_dps(u) for u in u1_melee)
-        u1_ranged_dps = sum(self.adjusted_dps(u) for u in u1_ranged)
-
-        u2_melee_dps = sum(self.adjusted_dps(u) for u in u2_melee)
-        u2_ranged_dps = sum(self.adjusted_dps(u) for u in u2_ranged)
-
-        if u1_melee_dps == 0 and u1_ranged_dps == 0 and u2_melee_dps == 0 and u2_ranged_dps == 0:
-            # Return 0 if there are no units with dps
-            return 0
-
-        def calc_health(u: Unit) -> int:
-            return u.health + u.shield
-
-        u1_health = sum(calc_health(u) for u in u1)
-        u2_health = sum(calc_health(u) for u in u2)
-
-        if u1_health == 0 and u2_health == 0:
-            return 0
-        if u1_health == 0 or not u1:
-            return -len(u2)
-        elif u2_health == 0 or not u2:
-            return len(u1)
-
-        u1_avg_health = u1_health / len(u1)
-        u2_avg_health = u2_health / len(u2)
-
-        u1_melee_avg_dps = u1_melee_dps / len(u1_melee) if u1_melee_dps else 0
-        u1_ranged_avg_dps = u1_ranged_dps / len(u1_ranged) if u1_ranged else 0
-
-        u2_melee_avg_dps = u2_melee_dps / len(u2_melee) if u2_melee_dps else 0
-        u2_ranged_avg_dps = u2_ranged_dps / len(u2_ranged) if u2_ranged else 0
-
-        if not ignore_height_difference:
-            u1_avg_height = sum(u.position3d.z for u in u1) / len(u1)
-            u2_avg_height = sum(u.position3d.z for u in u2) / len(u2)
-
-            # Simulate high ground advantage with 1.5x ranged DPS
-            if u1_avg_height * 0.85 > u2_avg_height:
-                u1_ranged_avg_dps *= 1.5
-            elif u2_avg_height * 0.85 > u1_avg_height:
-                u2_ranged_avg_dps *= 1.5
-
-        # How many enemy units are destroyed per second
-        u1_loss_rate = (u1_melee_avg_dps + u1_ranged_avg_dps) / u2_avg_health
-        u2_loss_rate = (u2_melee_avg_dps + u2_ranged_avg_dps) / u1_avg_health
-
-        # Lanchesters law calls for an exponent of 2.
-        # Use 1.2 to bias towards the linear law for melee
-        # Use 1.6 for ranged
-        power_m = 1.2
-        power_r = 1.6
-
-        u1_melee_powered = len(u1_melee) ** power_m
-        u1_ranged_powered = len(u1_ranged) ** power_r
-
-        u2_melee_powered = len(u2_melee) ** power_m
-        u2_ranged_powered = len(u2_ranged) ** power_r
-
-        u1_term = u1_loss_rate * (u1_melee_powered + u1_ranged_powered)
-        u2_term = u2_loss_rate * (u2_melee_powered + u2_ranged_powered)
-
-        if u1_term > u2_term:
-            result = math.sqrt((u1_melee_powered + u1_ranged_powered) - u2_loss_rate / u1_loss_rate * (u2_melee_powered + u2_ranged_powered))
-            return result
-        elif u2_term > u1_term:
-            result = math.sqrt((u2_melee_powered + u2_ranged_powered) - u1_loss_rate / u2_loss_rate * (u1_melee_powered + u1_ranged_powered))
-            return -result
-
-        return 0
+        return self.combat_estimator.relative_strength(
+            units_1, units_2, ignore_workers, ignore_defensive_structures, ignore_height_difference)
 
     def moving_closer_to(self, unit, cache, point) -> bool:
         """
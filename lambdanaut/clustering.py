@@ -1,10 +1,164 @@
+from collections import Counter
 from functools import reduce
 import random
-from typing import List, Union
+from typing import Dict, List, Optional, Tuple, Union
 
+import numpy as np
+
+import lib.sc2.constants as const
 from lib.sc2.units import Units
 from lib.sc2.position import Point2
 
+import lambdanaut.const2 as const2
+import lambdanaut.utils as utils
+
+# Maximum assignment passes of k_means_update. Warm started clusters usually converge in two or three
+K_MEANS_MAX_ITERATIONS = 20
+
+# Clusters with centers closer than this are merged at the end of k_means_update
+MERGE_DISTANCE = 9
+
+# IncrementalClustering only reassigns units that moved further than this since their last assignment
+MOVE_THRESHOLD = 2
+
+# IncrementalClustering seeds an empty cluster on a reassigned unit that is further than this from every cluster
+NEW_CLUSTER_DISTANCE = 15
+
+# IncrementalClustering runs a full k_means_update every this many updates to correct drift
+FULL_UPDATE_INTERVAL = 20
+
+
+class ClusterStats(object):
+    """
+    Columnar aggregate of a group of units. Clusters compute it once per cluster
+    update (see `Cluster.stats`), so its values reflect the units at that time.
+
+    The per-unit columns are numpy arrays in the order of the units. Aggregates
+    that depend on which units are counted are memoized per filter.
+    """
+
+    def __init__(self, units, center: Optional[Point2] = None):
+        units = list(units)
+        n = len(units)
+
+        self.count = n
+        self.type_counts: Counter = Counter(u.type_id for u in units)
+
+        positions3d = [u.position3d for u in units]
+        self.positions = np.array([(p.x, p.y) for p in positions3d], dtype=float).reshape((-1, 2))
+        self.heights = np.fromiter((p.z for p in positions3d), dtype=float, count=n)
+        self.radii = np.fromiter((u.radius for u in units), dtype=float, count=n)
+
+        # Static per-type columns are gathered from the unit type table
+        type_ids = np.fromiter((u._proto.unit_type for u in units), dtype=np.int32, count=n)
+        if n:
+            table = units[0]._bot_object.unit_type_table
+            type_indices = table.indices(type_ids)
+            self.ground_range = table.ground_range[type_indices]
+            self.air_range = table.air_range[type_indices]
+            self.can_attack_ground = table.can_attack_ground[type_indices]
+            self.can_attack_air = table.can_attack_air[type_indices]
+            self.is_melee = table.is_melee[type_indices]
+            self.dps = utils.adjusted_dps_column(table)[type_indices]
+        else:
+            self.ground_range = self.air_range = self.dps = np.zeros(0, dtype=float)
+            self.can_attack_ground = self.can_attack_air = self.is_melee = np.zeros(0, dtype=bool)
+        self.is_flying = np.fromiter((u.is_flying for u in units), dtype=bool, count=n)
+        self.is_colossus = type_ids == const.COLOSSUS.value
+        self.health = np.fromiter((u.health + u.shield for u in units), dtype=float, count=n)
+
+        self.is_worker = np.fromiter((u.type_id in const2.WORKERS for u in units), dtype=bool, count=n)
+        # Units that count towards army strength: anything except structures that can't attack
+        self.can_fight = np.fromiter(
+            (not u.is_structure or u.can_attack_ground or u.can_attack_air for u in units), dtype=bool, count=n)
+
+        if n:
+            self.average_height = float(self.heights.mean())
+            minimum = self.positions.min(axis=0)
+            maximum = self.positions.max(axis=0)
+            # (min x, min y, max x, max y)
+            self.bounding_box: Tuple[float, float, float, float] = \
+                (float(minimum[0]), float(minimum[1]), float(maximum[0]), float(maximum[1]))
+
+            center_array = np.array(center if center is not None else self.positions.mean(axis=0), dtype=float)
+            self.radius = float(np.sqrt(((self.positions - center_array[:2]) ** 2).sum(axis=1).max()))
+        else:
+            self.average_height = 0
+            self.bounding_box = None
+            self.radius = 0
+
+        # (ignore_workers, ignore_defensive_structures) -> strength terms
+        self._strength_terms: Dict[Tuple[bool, bool], Tuple[int, int, float, float, float, float]] = {}
+
+    def strength_terms(self, ignore_workers=False, ignore_defensive_structures=False) \
+            -> Tuple[int, int, float, float, float, float]:
+        """
+        Returns the terms `Lambdanaut.relative_army_strength` needs for the units that count towards army strength:
+        (melee count, ranged count, melee dps, ranged dps, health + shield, average height)
+        """
+        key = (ignore_workers, ignore_defensive_structures)
+        terms = self._strength_terms.get(key)
+
+        if terms is None:
+            # The same filters as the per-unit implementation of `relative_army_strength` this replaced.
+            # It compared units, not their type ids, with DEFENSIVE_STRUCTURES and RELATIVE_ARMY_STRENGTH_TO_IGNORE,
+            # so those never matched, and it only counted workers with `ignore_workers`.
+            selected = self.can_fight.copy()
+            if not ignore_workers:
+                selected &= ~self.is_worker
+
+            melee = selected & self.is_melee
+            ranged = selected & ~self.is_melee
+            count = int(selected.sum())
+
+            # Summed in unit order like the per-unit implementation, so the results are identical
+            terms = (
+                int(melee.sum()),
+                int(ranged.sum()),
+                float(sum(self.dps[melee].tolist())),
+                float(sum(self.dps[ranged].tolist())),
+                float(sum(self.health[selected].tolist())),
+                sum(self.heights[selected].tolist()) / count if count else 0,
+            )
+            self._strength_terms[key] = terms
+
+        return terms
+
+    def count_in_attack_range_of(self, other: 'ClusterStats', ranged_only=False) -> int:
+        """
+        Counts the units that have at least one unit of `other` in attack range.
+        Same rules as `Unit.target_in_range`
+        """
+        if not self.count or not other.count:
+            return 0
+
+        attacks_ground = self.can_attack_ground[:, np.newaxis] & ~other.is_flying[np.newaxis, :]
+        attacks_air = ~attacks_ground \
+            & self.can_attack_air[:, np.newaxis] \
+            & (other.is_flying | other.is_colossus)[np.newaxis, :]
+        attack_range = np.where(
+            attacks_ground, self.ground_range[:, np.newaxis], self.air_range[:, np.newaxis])
+        reach = self.radii[:, np.newaxis] + other.radii[np.newaxis, :] + attack_range
+
+        difference = self.positions[:, np.newaxis, :] - other.positions[np.newaxis, :, :]
+        distances_squared = np.einsum("ijk,ijk->ij", difference, difference)
+
+        in_range = ((attacks_ground | attacks_air) & (distances_squared <= reach ** 2)).any(axis=1)
+        if ranged_only:
+            in_range &= ~self.is_melee
+
+        return int(in_range.sum())
+
+
+def get_stats(units) -> ClusterStats:
+    """
+    Returns the cached stats of a cluster, or computes them for any other group of units
+    """
+    stats = getattr(units, 'stats', None)
+    if isinstance(stats, ClusterStats):
+        return stats
+    return ClusterStats(units)
+
 
 class Cluster(list):
     def __init__(self, position: Point2, *args: Union[Units, List[Point2], List[Units]]):
@@ -13,16 +167,36 @@ class Cluster(list):
 
         self.position = position
 
+        # Stable identifier of the cluster across frames. Set by `get_fresh_clusters`
+        self.id: int = None
+
+        # Cached by `self.stats`
+        self._stats: ClusterStats = None
+
+    @property
+    def stats(self) -> ClusterStats:
+        """
+        Aggregate statistics of the units in this cluster, computed once per cluster update
+        """
+        if self._stats is None or self._stats.count != len(self):
+            self._stats = ClusterStats(self, self.position)
+        return self._stats
+
+    def invalidate_stats(self):
+        self._stats = None
+
     @property
     def radius(self):
         """
         Returns the distance to the furthest unit within the cluster from
         the cluster's center
         """
-        if self:
-            return self.position.distance_to_furthest(self)
-        else:
+        if not self:
             return 0
+        # Clusters of plain points have no unit columns to build stats from
+        if isinstance(self[0], Point2):
+            return self.position.distance_to_furthest(self)
+        return self.stats.radius
 
     @property
     def center(self):
@@ -48,6 +222,7 @@ class Cluster(list):
 
         # Update position with new position
         self.position = new_position
+        self.invalidate_stats()
 
         return position_changed
 
@@ -64,6 +239,7 @@ class Cluster(list):
 
         self.clear()
         self.position = centroid.position
+        self.invalidate_stats()
 
     def merge(self, cluster2):
         """
@@ -115,38 +291,268 @@ def get_fresh_clusters(data, k=4, center_around: Point2=None) -> List[Cluster]:
         # Otherwise choose k random data points from data to be our centers
         centroids = random.sample(data, k)
 
-    return [Cluster(centroid.position, data) for centroid in centroids]
+    clusters = [Cluster(centroid.position, data) for centroid in centroids]
+    for i, cluster in enumerate(clusters):
+        cluster.id = i
+
+    return clusters
 
 
-def k_means_update(clusters: List[Cluster], data):
+def k_means_update(clusters: List[Cluster], data, max_iterations: int = K_MEANS_MAX_ITERATIONS):
     """
     Given clusters and data, mutably update the cluster's positions based on
     the data positions
 
+    The clusters are warm started from their current positions, so calling this
+    every few frames on slowly moving units only takes a couple of iterations.
+    Empty clusters are reseeded on random data points.
+
     :param clusters: Clusters to update with new data
     :param data: Units or points to cluster on
+    :param max_iterations: Maximum assignment passes before giving up on convergence
     """
 
-    for cluster in clusters:
-        cluster.refresh()
+    if not clusters:
+        return
 
-    while True:
+    data = list(data)
+    k = len(clusters)
 
+    if not data:
         for cluster in clusters:
-            cluster.clear()
+            cluster.refresh()
+        return
+
+    points = np.array([d.position for d in data], dtype=float).reshape((-1, 2))
+
+    centroids = np.array([cluster.position for cluster in clusters], dtype=float).reshape((-1, 2))
+    for i, cluster in enumerate(clusters):
+        if not cluster:
+            centroids[i] = points[random.randrange(len(points))]
 
-        for d in data:
-            closest = d.position.closest(clusters)
-            closest.append(d)
+    labels = None
+    for _ in range(max_iterations):
+        # Squared distance of every point to every centroid, shape (len(data), k)
+        difference = points[:, np.newaxis, :] - centroids[np.newaxis, :, :]
+        new_labels = np.einsum("ijk,ijk->ij", difference, difference).argmin(axis=1)
 
-        if not any([cluster.update_position() for cluster in clusters]):
+        converged = labels is not None and np.array_equal(labels, new_labels)
+        labels = new_labels
+        centroids = _centroids_of(points, labels, centroids)
+
+        if converged:
             break
 
-    # Merge clusters that are very close to each other
-    for cluster in clusters:
-        clusters_excluding_this_cluster = [c for c in clusters if c.position != cluster.position]
-        nearest_cluster = cluster.position.closest(clusters_excluding_this_cluster)
+    labels, reseed_positions = _merge_close_clusters(points, labels, centroids)
+    centroids = _centroids_of(points, labels, centroids)
+    for i, position in reseed_positions.items():
+        centroids[i] = position
+
+    # Write the result back into the clusters, keeping the data order within each cluster
+    order = np.argsort(labels, kind="stable")
+    bounds = np.cumsum(np.bincount(labels, minlength=k))
+    start = 0
+    for i, cluster in enumerate(clusters):
+        end = bounds[i]
+        cluster[:] = [data[index] for index in order[start:end].tolist()]
+        cluster.position = Point2(centroids[i].tolist())
+        cluster.invalidate_stats()
+        start = end
+
+
+def _centroids_of(points: np.ndarray, labels: np.ndarray, previous_centroids: np.ndarray) -> np.ndarray:
+    """
+    Returns the mean position of each cluster's points.
+    Clusters without points keep their previous centroid.
+    """
+    k = len(previous_centroids)
+    counts = np.bincount(labels, minlength=k)
+    sums = np.stack(
+        (np.bincount(labels, weights=points[:, 0], minlength=k), np.bincount(labels, weights=points[:, 1], minlength=k)),
+        axis=1)
+
+    centroids = previous_centroids.copy()
+    filled = counts > 0
+    centroids[filled] = sums[filled] / counts[filled, np.newaxis]
+    return centroids
+
+
+def _merge_close_clusters(points: np.ndarray, labels: np.ndarray, centroids: np.ndarray):
+    """
+    Merges each non-empty cluster with its nearest other cluster if they are
+    closer than MERGE_DISTANCE. Pairwise distances are computed once.
+
+    :returns Tuple of the new labels and a dict of {cluster index: new position}
+    for the clusters that were merged away and need a new position
+    """
+    k = len(centroids)
+    counts = np.bincount(labels, minlength=k)
+
+    difference = centroids[:, np.newaxis, :] - centroids[np.newaxis, :, :]
+    distances = np.sqrt(np.einsum("ijk,ijk->ij", difference, difference))
+    np.fill_diagonal(distances, np.inf)
+
+    labels = labels.copy()
+    reseed_positions = {}
+    merged_away = np.zeros(k, dtype=bool)
+    for i in range(k):
+        if merged_away[i] or not counts[i]:
+            continue
+
+        row = np.where(merged_away, np.inf, distances[i])
+        nearest = int(row.argmin())
+
+        if row[nearest] < MERGE_DISTANCE:
+            members = np.flatnonzero(labels == nearest)
+            labels[members] = i
+            counts[i] += len(members)
+            counts[nearest] = 0
+            merged_away[nearest] = True
+
+            # Like Cluster.refresh, continue from a random point of the merged data
+            if len(members):
+                reseed_positions[nearest] = points[random.choice(members)]
+
+    return labels, reseed_positions
+
+
+class IncrementalClustering(object):
+    """
+    Keeps a list of clusters up to date across frames without reclustering everything.
+
+    Units keep their cluster until they moved more than `move_threshold` since
+    they were last assigned. Only new units and moved units are assigned to
+    their nearest cluster, far away ones seed empty clusters. Cluster centers
+    are the mean of their units' positions at the time of assignment, so they
+    only move with the reassigned mini-batch. Every `full_update_interval`
+    updates, a full `k_means_update` corrects any drift.
+
+    The clusters stay in the same list in the same order, so `cluster.id` and
+    the cluster objects themselves are stable across frames.
+    """
+
+    def __init__(self, clusters: List[Cluster],
+                 move_threshold: float = MOVE_THRESHOLD,
+                 full_update_interval: int = FULL_UPDATE_INTERVAL):
+        self.clusters = clusters
+        self.move_threshold = move_threshold
+        self.full_update_interval = full_update_interval
+
+        # Unit tag -> (cluster index, x, y) of its position at assignment
+        self._assignments: Dict[int, Tuple[int, float, float]] = {}
+
+        self.updates = 0
+
+        # Amount of units that were reassigned in the last update
+        self.reassigned = 0
+
+    def update(self, data):
+        """
+        Mutably updates the clusters with the current units
+
+        :param data: Units or UnitCached objects to cluster on
+        """
+
+        data = list(data)
+
+        if self.updates % self.full_update_interval == 0:
+            self._full_update(data)
+        else:
+            self._incremental_update(data)
+
+        self.updates += 1
+
+    def _full_update(self, data):
+        k_means_update(self.clusters, data)
+
+        self._assignments = {
+            unit.tag: (i, unit.position.x, unit.position.y)
+            for i, cluster in enumerate(self.clusters)
+            for unit in cluster}
+        self.reassigned = len(data)
+
+    def _incremental_update(self, data):
+        clusters = self.clusters
+        k = len(clusters)
+        n = len(data)
+
+        if not n:
+            for cluster in clusters:
+                cluster.clear()
+            self._assignments = {}
+            self.reassigned = 0
+            return
+
+        points = np.array([d.position for d in data], dtype=float).reshape((-1, 2))
+
+        previous = [self._assignments.get(d.tag) for d in data]
+        labels = np.fromiter((p[0] if p else -1 for p in previous), dtype=int, count=n)
+        recorded = np.array([(p[1], p[2]) if p else (np.nan, np.nan) for p in previous], dtype=float).reshape((-1, 2))
+
+        # New units have a NaN recorded position, which never compares as close
+        moved_squared = ((points - recorded) ** 2).sum(axis=1)
+        reassign = ~(moved_squared <= self.move_threshold ** 2)
+        labels[reassign] = -1
+
+        kept = labels >= 0
+        centroids = np.array([cluster.position for cluster in clusters], dtype=float).reshape((-1, 2))
+        centroids = _centroids_of(recorded[kept], labels[kept], centroids)
+
+        batch = np.flatnonzero(reassign)
+        if len(batch):
+            occupied = np.bincount(labels[kept], minlength=k) > 0
+            batch_labels = self._assign(points[batch], centroids, occupied)
+            labels[batch] = batch_labels
+            recorded[batch] = points[batch]
+            centroids = _centroids_of(recorded, labels, centroids)
+
+        labels, reseed_positions = _merge_close_clusters(recorded, labels, centroids)
+        centroids = _centroids_of(recorded, labels, centroids)
+        for i, position in reseed_positions.items():
+            centroids[i] = position
+
+        self._assignments = {
+            d.tag: (label, x, y)
+            for d, label, (x, y) in zip(data, labels.tolist(), recorded.tolist())}
+        self.reassigned = len(batch)
+
+        order = np.argsort(labels, kind="stable")
+        bounds = np.cumsum(np.bincount(labels, minlength=k))
+        start = 0
+        for i, cluster in enumerate(clusters):
+            end = bounds[i]
+            cluster[:] = [data[index] for index in order[start:end].tolist()]
+            cluster.position = Point2(centroids[i].tolist())
+            cluster.invalidate_stats()
+            start = end
+
+    @staticmethod
+    def _assign(points: np.ndarray, centroids: np.ndarray, occupied: np.ndarray) -> np.ndarray:
+        """
+        Returns the index of the nearest cluster of each point. Points that are far
+        away from all occupied clusters are used to seed empty clusters.
+
+        Mutates `centroids` and `occupied` for the seeded clusters.
+        """
+        def nearest(among: np.ndarray):
+            difference = points[:, np.newaxis, :] - centroids[np.newaxis, :, :]
+            distances_squared = np.einsum("ijk,ijk->ij", difference, difference)
+            distances_squared[:, ~among] = np.inf
+            return distances_squared.argmin(axis=1), distances_squared.min(axis=1)
+
+        if occupied.any():
+            empty = list(np.flatnonzero(~occupied))
+            labels, distances_squared = nearest(occupied)
+
+            for i in np.flatnonzero(distances_squared > NEW_CLUSTER_DISTANCE ** 2):
+                if not empty:
+                    break
+                # An earlier seeded cluster may already be close enough
+                if ((centroids[occupied] - points[i]) ** 2).sum(axis=1).min() <= NEW_CLUSTER_DISTANCE ** 2:
+                    continue
+                seed = empty.pop(0)
+                centroids[seed] = points[i]
+                occupied[seed] = True
+
+        return nearest(occupied if occupied.any() else np.ones(len(centroids), dtype=bool))[0]
 
-        if cluster and nearest_cluster and \
-                cluster.position.distance_to(nearest_cluster.position) < 9:
-            cluster.merge(nearest_cluster)
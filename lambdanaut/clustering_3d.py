@@ -14,6 +14,7 @@ from lib.sc2.units import Units
 from lib.sc2.position import Point2, Point3
 
 import lambdanaut.const2 as const2
+from lambdanaut.clustering import ClusterStats
 
 
 class Cluster(list):
@@ -27,20 +28,32 @@ class Cluster(list):
         # `z` is a special value used to break apart unit groups by unit type
         self._position: Point3 = position.to3
 
+        # Cached by `self.stats`
+        self._stats: ClusterStats = None
+
     @property
     def position(self):
         return self._position.to2
 
+    @property
+    def stats(self) -> ClusterStats:
+        """
+        Aggregate statistics of the units in this cluster, computed once per cluster update
+        """
+        if self._stats is None or self._stats.count != len(self):
+            self._stats = ClusterStats(self, self.position)
+        return self._stats
+
+    def invalidate_stats(self):
+        self._stats = None
+
     @property
     def radius(self):
         """
         Returns the distance to the furthest unit within the cluster from
         the cluster's center
         """
-        if self:
-            return self.position.distance_to_furthest(self)
-        else:
-            return 0
+        return self.stats.radius
 
     @property
     def center(self):
@@ -68,6 +81,7 @@ class Cluster(list):
 
         # Update position with new position
         self._position = new_position
+        self.invalidate_stats()
 
         return position_changed
 
@@ -84,6 +98,7 @@ class Cluster(list):
 
         self.clear()
         self._position = centroid.position
+        self.invalidate_stats()
 
     def merge(self, cluster2):
         """
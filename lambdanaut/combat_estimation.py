@@ -0,0 +1,168 @@
+from typing import Dict, Iterable, Sequence
+
+import numpy as np
+
+import lambdanaut.clustering as clustering
+import lambdanaut.combat_simulation as combat_simulation
+
+# Lanchester's law calls for an exponent of 2.
+# Use 1.2 to bias towards the linear law for melee
+# Use 1.6 for ranged
+MELEE_POWER = 1.2
+RANGED_POWER = 1.6
+
+# Simulate high ground advantage with 1.5x ranged DPS
+HIGH_GROUND_DPS_FACTOR = 1.5
+
+# A side is on the high ground if this share of its average height is above the other side's average height
+HIGH_GROUND_HEIGHT_RATIO = 0.85
+
+# Columns of strength term arrays, in the order of `ClusterStats.strength_terms`
+MELEE_COUNT, RANGED_COUNT, MELEE_DPS, RANGED_DPS, HEALTH, HEIGHT = range(6)
+
+
+def lanchester(terms_1: np.ndarray, terms_2: np.ndarray, ignore_height_difference=True) -> np.ndarray:
+    """
+    Returns the (n, m) matrix of the relative strength of every group of side 1 against every group of side 2.
+    Positive values mean the group of side 1 is stronger, see `Lambdanaut.relative_army_strength`.
+
+    :param terms_1: (n, 6) array of the strength terms of the groups of side 1
+    :param terms_2: (m, 6) array of the strength terms of the groups of side 2
+    """
+    terms_1 = np.asarray(terms_1, dtype=float).reshape((-1, 6))[:, np.newaxis, :]
+    terms_2 = np.asarray(terms_2, dtype=float).reshape((-1, 6))[np.newaxis, :, :]
+
+    melee_count_1, ranged_count_1, melee_dps_1, ranged_dps_1, health_1, height_1 = np.moveaxis(terms_1, -1, 0)
+    melee_count_2, ranged_count_2, melee_dps_2, ranged_dps_2, health_2, height_2 = np.moveaxis(terms_2, -1, 0)
+    count_1 = melee_count_1 + ranged_count_1
+    count_2 = melee_count_2 + ranged_count_2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_health_1 = health_1 / count_1
+        avg_health_2 = health_2 / count_2
+
+        melee_avg_dps_1 = np.where(melee_dps_1 != 0, melee_dps_1 / melee_count_1, 0)
+        ranged_avg_dps_1 = np.where(ranged_count_1 != 0, ranged_dps_1 / ranged_count_1, 0)
+        melee_avg_dps_2 = np.where(melee_dps_2 != 0, melee_dps_2 / melee_count_2, 0)
+        ranged_avg_dps_2 = np.where(ranged_count_2 != 0, ranged_dps_2 / ranged_count_2, 0)
+
+        if not ignore_height_difference:
+            high_ground_1 = height_1 * HIGH_GROUND_HEIGHT_RATIO > height_2
+            high_ground_2 = ~high_ground_1 & (height_2 * HIGH_GROUND_HEIGHT_RATIO > height_1)
+            ranged_avg_dps_1 = np.where(high_ground_1, ranged_avg_dps_1 * HIGH_GROUND_DPS_FACTOR, ranged_avg_dps_1)
+            ranged_avg_dps_2 = np.where(high_ground_2, ranged_avg_dps_2 * HIGH_GROUND_DPS_FACTOR, ranged_avg_dps_2)
+
+        # How many enemy units are destroyed per second
+        loss_rate_1 = (melee_avg_dps_1 + ranged_avg_dps_1) / avg_health_2
+        loss_rate_2 = (melee_avg_dps_2 + ranged_avg_dps_2) / avg_health_1
+
+        powered_1 = melee_count_1 ** MELEE_POWER + ranged_count_1 ** RANGED_POWER
+        powered_2 = melee_count_2 ** MELEE_POWER + ranged_count_2 ** RANGED_POWER
+
+        term_1 = loss_rate_1 * powered_1
+        term_2 = loss_rate_2 * powered_2
+
+        strength = np.where(
+            term_1 > term_2,
+            np.sqrt(powered_1 - loss_rate_2 / loss_rate_1 * powered_2),
+            np.where(term_2 > term_1, -np.sqrt(powered_2 - loss_rate_1 / loss_rate_2 * powered_1), 0))
+
+    no_dps = (melee_dps_1 == 0) & (ranged_dps_1 == 0) & (melee_dps_2 == 0) & (ranged_dps_2 == 0)
+    return np.select(
+        [no_dps, (health_1 == 0) & (health_2 == 0), (health_1 == 0) | (count_1 == 0), (health_2 == 0) | (count_2 == 0)],
+        [0, 0, -count_2, count_1],
+        strength)
+
+
+def strength_terms(stats: Iterable[clustering.ClusterStats], ignore_workers=False,
+                   ignore_defensive_structures=False) -> np.ndarray:
+    """
+    Returns the (n, 6) array of the strength terms of n groups, given their stats (see `clustering.get_stats`)
+    """
+    rows = [group_stats.strength_terms(ignore_workers, ignore_defensive_structures) for group_stats in stats]
+    return np.array(rows, dtype=float).reshape((-1, 6))
+
+
+class CombatEstimator(object):
+    """
+    Evaluates Lanchester strengths of many pairs of unit groups at once
+
+    Results are memoized for the rest of the frame, so every manager asking about the same clusters in one frame
+    gets the same numbers. Clusters are keyed by their cached stats (see `clustering.Cluster.stats`), which are
+    renewed when the cluster changes. Other groups, like Units, are keyed by the group object itself: they only hit
+    the memo when the same object is passed again in the frame, and must not be changed in place in between.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+
+        # (key ids of side 1, key ids of side 2, flags) -> (keys of side 1, keys of side 2, strength matrix)
+        # The keys are kept so their ids can't be reused within the frame, see _memo_key
+        self._memo: Dict[tuple, tuple] = {}
+        self._memo_game_loop = -1
+
+        # Statistics
+        self.evaluations = 0
+        self.memo_hits = 0
+
+    def strength_matrix(
+            self,
+            groups_1: Sequence,
+            groups_2: Sequence,
+            ignore_workers=False,
+            ignore_defensive_structures=False,
+            ignore_height_difference=True) -> np.ndarray:
+        """
+        Returns the read-only (len(groups_1), len(groups_2)) matrix of the relative strength of each pair of groups,
+        see `Lambdanaut.relative_army_strength`
+        """
+        game_loop = self.bot.state.game_loop
+        if game_loop != self._memo_game_loop:
+            self._memo = {}
+            self._memo_game_loop = game_loop
+
+        keys_1 = tuple(map(self._memo_key, groups_1))
+        keys_2 = tuple(map(self._memo_key, groups_2))
+        key = (tuple(map(id, keys_1)), tuple(map(id, keys_2)),
+               ignore_workers, ignore_defensive_structures, ignore_height_difference)
+
+        entry = self._memo.get(key)
+        if entry is not None:
+            self.memo_hits += 1
+            return entry[2]
+
+        stats_1 = tuple(clustering.get_stats(group) for group in groups_1)
+        stats_2 = tuple(clustering.get_stats(group) for group in groups_2)
+        matrix = lanchester(
+            strength_terms(stats_1, ignore_workers, ignore_defensive_structures),
+            strength_terms(stats_2, ignore_workers, ignore_defensive_structures),
+            ignore_height_difference)
+        matrix.flags.writeable = False
+
+        self._memo[key] = (keys_1, keys_2, matrix)
+        self.evaluations += 1
+
+        return matrix
+
+    @staticmethod
+    def _memo_key(group):
+        """
+        Returns the object a group is memoized by: the cached stats of clusters, the group itself otherwise
+        """
+        stats = getattr(group, 'stats', None)
+        return stats if isinstance(stats, clustering.ClusterStats) else group
+
+    def relative_strength(self, units_1, units_2, ignore_workers=False, ignore_defensive_structures=False,
+                          ignore_height_difference=True) -> float:
+        """
+        Relative strength of a single pair of groups
+        """
+        return float(self.strength_matrix(
+            (units_1,), (units_2,), ignore_workers, ignore_defensive_structures, ignore_height_difference)[0, 0])
+
+    def simulate(self, units_1, units_2, **simulator_kwargs) -> combat_simulation.SimulationResult:
+        """
+        Simulates a fight between the bot's units_1 and the enemy's units_2 step by step,
+        for close calls where the Lanchester estimate isn't precise enough. See `combat_simulation`.
+        """
+        return combat_simulation.simulate_units(self.bot, units_1, units_2, side_1_own=True, **simulator_kwargs)
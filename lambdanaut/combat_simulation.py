@@ -0,0 +1,386 @@
+"""
+Discrete-time simulation of fights between groups of units, vectorized over many fights at once
+
+Every fight has up to S slots per side, each holding one unit type, the number of its units alive
+and their pooled health and shields. Units of a slot focus fire: they all attack the same enemy slot,
+the one they kill fastest, so the pooled damage kills the slot's units one after another.
+Splash is approximated by multiplying the damage of splash units with the number of units they hit,
+limited by the number of units in the target slot.
+Both armies start `start_distance` apart and walk towards each other until their attackers are in range.
+
+The per-type numbers come from a `CombatTables`, built in game from the unit type table and the damage
+engine, or loaded from a snapshot saved by a game, so fights can also be simulated without a client.
+"""
+
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import lib.sc2.constants as const
+from lib.sc2.damage_matrix import LAYER_AIR, LAYER_GROUND, DamageMatrix
+from lib.sc2.unit import Unit
+
+# Seconds per simulation step
+DEFAULT_TIME_STEP = 0.25
+
+# Fights still going after this many seconds are draws
+DEFAULT_MAX_TIME = 60
+
+# Distance between the armies at the start of a fight
+DEFAULT_START_DISTANCE = 12
+
+# Units attack once the distance between the armies is at most their range plus this, for the unit radii
+ENGAGE_MARGIN = 1
+
+# Average number of units hit by an attack of splash units
+SPLASH_TARGETS = {
+    const.BANELING: 4,
+    const.SIEGETANKSIEGED: 3,
+    const.COLOSSUS: 3,
+    const.LURKERMPBURROWED: 3,
+    const.HELLION: 2.5,
+    const.HELLIONTANK: 2,
+    const.ARCHON: 2,
+    const.THOR: 1.5,
+    const.MUTALISK: 1.5,
+}
+
+# Result of CombatSimulator.simulate, all arrays have one row per fight:
+#  winner: 0 for a draw, 1 or 2 for the winning side
+#  win_ratio: share of the winner's units still alive, 1 for draws
+#  remaining_1, remaining_2: (B, S) units still alive per slot
+#  duration: seconds the fight took
+SimulationResult = namedtuple('SimulationResult', ['winner', 'win_ratio', 'remaining_1', 'remaining_2', 'duration'])
+
+
+class CombatTables(object):
+    """
+    Per-type numbers of a fixed list of unit types, indexed by the position of the type in `type_ids`.
+    `dps_1[a, t]` is the dps of type a of side 1 against the health of type t, `shield_dps_1` against its shields,
+    and the same for side 2, so both sides can have different upgrades.
+    """
+
+    # Names of the arrays saved in snapshots
+    ARRAYS = ('type_ids', 'health', 'shield', 'flying', 'speed', 'range', 'splash',
+              'dps_1', 'shield_dps_1', 'dps_2', 'shield_dps_2')
+
+    def __init__(self, **arrays: np.ndarray):
+        self.type_ids: np.ndarray = arrays['type_ids']
+        self.health: np.ndarray = arrays['health']
+        self.shield: np.ndarray = arrays['shield']
+        self.flying: np.ndarray = arrays['flying']
+        self.speed: np.ndarray = arrays['speed']
+        self.range: np.ndarray = arrays['range']
+        self.splash: np.ndarray = arrays['splash']
+        self.dps_1: np.ndarray = arrays['dps_1']
+        self.shield_dps_1: np.ndarray = arrays['shield_dps_1']
+        self.dps_2: np.ndarray = arrays['dps_2']
+        self.shield_dps_2: np.ndarray = arrays['shield_dps_2']
+
+        self._index_of_type: Dict[int, int] = {type_id: i for i, type_id in enumerate(self.type_ids.tolist())}
+
+    def __len__(self):
+        return len(self.type_ids)
+
+    @classmethod
+    def from_units(cls, bot, units: Iterable[Unit], side_1_own=True) -> 'CombatTables':
+        """
+        Builds the tables of every unit type among `units` from the bot's unit type table and damage engine.
+        Health, shields and whether the type flies are taken from the first unit of each type.
+
+        :param side_1_own: Whether side 1 are the bot's units, whose upgrades apply
+        """
+        first_of_type: Dict[int, Unit] = {}
+        for unit in units:
+            first_of_type.setdefault(unit._proto.unit_type, unit)
+        type_ids = np.array(sorted(first_of_type), dtype=np.int32)
+        samples = [first_of_type[type_id] for type_id in type_ids.tolist()]
+
+        table = bot.unit_type_table
+        splash_of_type = {unit_type.value: targets for unit_type, targets in SPLASH_TARGETS.items()}
+        flying = np.array([unit.is_flying for unit in samples], dtype=bool)
+        arrays = {
+            'type_ids': type_ids,
+            'health': np.array([unit.health_max for unit in samples], dtype=float),
+            'shield': np.array([unit.shield_max for unit in samples], dtype=float),
+            'flying': flying,
+            'speed': table.gather('movement_speed', type_ids),
+            'range': np.maximum(table.gather('ground_range', type_ids), table.gather('air_range', type_ids)),
+            'splash': np.array([splash_of_type.get(type_id, 1) for type_id in type_ids.tolist()], dtype=float),
+        }
+
+        engine = bot.damage_engine
+        for side, matrix in ((1, engine.own if side_1_own else engine.enemy),
+                             (2, engine.enemy if side_1_own else engine.own)):
+            arrays['dps_{}'.format(side)], arrays['shield_dps_{}'.format(side)] = \
+                cls._dps_of(matrix, type_ids, flying)
+
+        return cls(**arrays)
+
+    @staticmethod
+    def _dps_of(matrix: DamageMatrix, type_ids: np.ndarray, flying: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the (K, K) dps of every type against the health and against the shields of every type,
+        without upgrade levels
+        """
+        attackers = matrix.attacker_indices(type_ids)[:, np.newaxis]
+        targets = matrix.table.indices(type_ids)[np.newaxis, :]
+        layers = np.where(flying, LAYER_AIR, LAYER_GROUND)[np.newaxis, :]
+        colossus = (type_ids == const.COLOSSUS.value)[np.newaxis, :]
+
+        dps = matrix.dps[attackers, targets, layers, 0, 0]
+        shield_dps = matrix.attacks[attackers, targets, layers] \
+            * np.maximum(0.5, matrix.hit[attackers, targets, layers, 0]) / matrix.cooldown[attackers, targets, layers]
+        shield_dps = np.where(matrix.attacks[attackers, targets, layers] > 0, shield_dps, 0)
+
+        # Colossi can be hit by ground and air attacks
+        air_dps = matrix.dps[attackers, targets, LAYER_AIR, 0, 0]
+        air_shield_dps = matrix.attacks[attackers, targets, LAYER_AIR] \
+            * np.maximum(0.5, matrix.hit[attackers, targets, LAYER_AIR, 0]) / matrix.cooldown[attackers, targets, LAYER_AIR]
+        dps = np.where(colossus, np.maximum(dps, air_dps), dps)
+        shield_dps = np.where(colossus, np.maximum(shield_dps, air_shield_dps), shield_dps)
+
+        return dps.astype(float), shield_dps.astype(float)
+
+    def save(self, filepath: str):
+        np.savez(filepath, **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, filepath: str) -> 'CombatTables':
+        with np.load(filepath) as data:
+            return cls(**{name: data[name] for name in cls.ARRAYS})
+
+    def indices(self, type_ids: Iterable[int]) -> np.ndarray:
+        """
+        Returns the positions of raw type ids in the tables. Raises KeyError for types that aren't in the tables.
+        """
+        return np.array([self._index_of_type[int(type_id)] for type_id in type_ids], dtype=np.intp)
+
+    def slots(self, armies: Sequence[Dict[int, int]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Converts armies given as {raw type id: count} to the (B, S) slot arrays of CombatSimulator.simulate:
+        the table positions of the types, -1 for empty slots, and the counts
+        """
+        width = max([len(army) for army in armies] + [1])
+        types = np.full((len(armies), width), -1, dtype=np.intp)
+        counts = np.zeros((len(armies), width), dtype=float)
+        for i, army in enumerate(armies):
+            if army:
+                types[i, :len(army)] = self.indices(army.keys())
+                counts[i, :len(army)] = list(army.values())
+        return types, counts
+
+
+class CombatSimulator(object):
+    """
+    Simulates batches of fights, see the module docstring
+    """
+
+    def __init__(self, tables: CombatTables, time_step=DEFAULT_TIME_STEP, max_time=DEFAULT_MAX_TIME,
+                 start_distance=DEFAULT_START_DISTANCE):
+        self.tables = tables
+        self.time_step = time_step
+        self.max_time = max_time
+        self.start_distance = start_distance
+
+    def simulate(self, types_1: np.ndarray, counts_1: np.ndarray, types_2: np.ndarray, counts_2: np.ndarray,
+                 health_1: Optional[np.ndarray] = None, shield_1: Optional[np.ndarray] = None,
+                 health_2: Optional[np.ndarray] = None, shield_2: Optional[np.ndarray] = None) -> SimulationResult:
+        """
+        Simulates B fights at once
+
+        :param types_1: (B, S1) table positions of the unit types of side 1, -1 for empty slots
+        :param counts_1: (B, S1) number of units per slot of side 1
+        :param types_2: (B, S2) same for side 2
+        :param counts_2: (B, S2) same for side 2
+        :param health_1: (B, S1) pooled health per slot of side 1. Defaults to full health.
+        :param shield_1: (B, S1) pooled shields per slot of side 1. Defaults to full shields.
+        :param health_2: Same for side 2
+        :param shield_2: Same for side 2
+        """
+        tables = self.tables
+        sides = [_Side(tables, np.asarray(types_1), np.asarray(counts_1, dtype=float), health_1, shield_1),
+                 _Side(tables, np.asarray(types_2), np.asarray(counts_2, dtype=float), health_2, shield_2)]
+        fights = len(sides[0].types)
+
+        # (B, S_attacker, S_target) dps of each side's slots against the other side's slots
+        for attacker, target, dps, shield_dps in ((sides[0], sides[1], tables.dps_1, tables.shield_dps_1),
+                                                  (sides[1], sides[0], tables.dps_2, tables.shield_dps_2)):
+            pair = (attacker.table_types[:, :, np.newaxis], target.table_types[:, np.newaxis, :])
+            occupied = attacker.occupied[:, :, np.newaxis] & target.occupied[:, np.newaxis, :]
+            attacker.dps = np.where(occupied, dps[pair], 0)
+            attacker.shield_dps = np.where(occupied, shield_dps[pair], 0)
+            # Focus fire on the slot that dies fastest to this attacker
+            target_toughness = tables.health[target.table_types] + tables.shield[target.table_types]
+            attacker.preference = np.where(
+                attacker.dps > 0, attacker.dps / np.maximum(target_toughness, 1)[:, np.newaxis, :], -1)
+
+        distance = np.full(fights, float(self.start_distance))
+        duration = np.zeros(fights)
+        running = np.ones(fights, dtype=bool)
+        fight_rows = np.arange(fights)[:, np.newaxis]
+
+        time = 0
+        while time < self.max_time and running.any():
+            alive = [side.alive() for side in sides]
+            running &= alive[0].any(axis=1) & alive[1].any(axis=1)
+            if not running.any():
+                break
+
+            damage_dealt = np.zeros(fights)
+            walked = np.zeros(fights)
+            damages = []
+            for side, other, side_alive, other_alive in ((sides[0], sides[1], alive[0], alive[1]),
+                                                         (sides[1], sides[0], alive[1], alive[0])):
+                preference = np.where(other_alive[:, np.newaxis, :], side.preference, -1)
+                targets = preference.argmax(axis=2)
+                can_attack = np.take_along_axis(preference, targets[:, :, np.newaxis], axis=2)[:, :, 0] > 0
+
+                in_range = distance[:, np.newaxis] <= side.range + ENGAGE_MARGIN
+                attacking = can_attack & in_range & (side_alive > 0) & running[:, np.newaxis]
+
+                target_alive = other_alive[fight_rows, targets]
+                splash = np.minimum(side.splash, np.maximum(target_alive, 1))
+                target_has_shield = other.front_shield[fight_rows, targets] > 0
+                dps = np.where(target_has_shield,
+                               np.take_along_axis(side.shield_dps, targets[:, :, np.newaxis], axis=2)[:, :, 0],
+                               np.take_along_axis(side.dps, targets[:, :, np.newaxis], axis=2)[:, :, 0])
+                damage = np.where(attacking, side_alive * dps * splash * self.time_step, 0)
+                damages.append((other, targets, damage))
+                damage_dealt += damage.sum(axis=1)
+
+                # Walk closer while attackers that could fight are out of range
+                walking = can_attack & ~in_range & (side_alive > 0) & (side.speed > 0)
+                speed = np.where(walking, side.speed, np.inf).min(axis=1)
+                walked += np.where(np.isfinite(speed) & running, speed, 0) * self.time_step
+
+            # Both sides attack and walk at the same time
+            for other, targets, damage in damages:
+                other.take_damage(targets, damage)
+            distance -= walked
+
+            distance = np.maximum(distance, 0)
+            # Fights where nobody can reach anyone anymore are draws
+            stalled = (damage_dealt == 0) & (distance <= 0)
+            running &= ~stalled
+            duration = np.where(running, duration + self.time_step, duration)
+            time += self.time_step
+
+        remaining_1 = sides[0].alive()
+        remaining_2 = sides[1].alive()
+        alive_1 = remaining_1.sum(axis=1) > 0
+        alive_2 = remaining_2.sum(axis=1) > 0
+        winner = np.where(alive_1 & ~alive_2, 1, np.where(alive_2 & ~alive_1, 2, 0))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio_1 = remaining_1.sum(axis=1) / sides[0].counts.sum(axis=1)
+            ratio_2 = remaining_2.sum(axis=1) / sides[1].counts.sum(axis=1)
+        win_ratio = np.where(winner == 1, ratio_1, np.where(winner == 2, ratio_2, 1.0))
+
+        return SimulationResult(winner, win_ratio, remaining_1, remaining_2, duration)
+
+
+class _Side(object):
+    """
+    State of one side of a batch of fights
+    """
+
+    def __init__(self, tables: CombatTables, types: np.ndarray, counts: np.ndarray,
+                 health: Optional[np.ndarray], shield: Optional[np.ndarray]):
+        self.types = types
+        self.counts = np.where(types >= 0, counts, 0)
+        self.occupied = (types >= 0) & (self.counts > 0)
+        # Empty slots read the tables at position 0, their values are masked out
+        self.table_types = np.maximum(types, 0)
+
+        max_health = np.maximum(tables.health[self.table_types], 1)
+        self.health_pool = np.where(self.occupied, self.counts * max_health if health is None else health, 0)
+        unit_shield = tables.shield[self.table_types]
+        self.shield_pool = np.where(self.occupied, self.counts * unit_shield if shield is None else shield, 0)
+
+        # Units alive per slot, only lowered by kills
+        self.alive_counts = np.where(self.occupied, self.counts, 0)
+        # Health and shields of each unit of a slot, the averages of the pools, so damaged units aren't counted as dead
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.unit_health = np.where(self.occupied, self.health_pool / self.counts, 1)
+            self.unit_shield = np.where(self.occupied, self.shield_pool / self.counts, 0)
+        self.unit_health = np.maximum(self.unit_health, 1e-9)
+        # Health and shields left of the unit that is focused. The other units of the slot are untouched.
+        self.front_health = np.where(self.occupied, self.unit_health, 0)
+        self.front_shield = np.where(self.occupied, self.unit_shield, 0)
+
+        self.range = np.where(self.occupied, tables.range[self.table_types], 0)
+        self.speed = np.where(self.occupied, tables.speed[self.table_types], 0)
+        self.splash = tables.splash[self.table_types]
+
+        # Set by CombatSimulator.simulate
+        self.dps: np.ndarray = None
+        self.shield_dps: np.ndarray = None
+        self.preference: np.ndarray = None
+
+    def alive(self) -> np.ndarray:
+        """
+        Returns the (B, S) number of units alive per slot
+        """
+        return self.alive_counts
+
+    def take_damage(self, targets: np.ndarray, damage: np.ndarray):
+        """
+        Applies the damage each attacking slot deals to its target slot, shields first
+        """
+        fights, slots = self.health_pool.shape
+        flat_targets = (np.arange(fights)[:, np.newaxis] * slots + targets).ravel()
+        total = np.bincount(flat_targets, weights=damage.ravel(), minlength=fights * slots).reshape((fights, slots))
+
+        # Damage is focused: it hits the shields and then the health of the focused unit, then kills whole units
+        # one after another, and the rest hurts the shields and health of the next unit
+        health_damage = total - np.minimum(self.front_shield, total)
+        overkill = health_damage - self.front_health
+        unit_total = self.unit_shield + self.unit_health
+        extra_kills = np.floor(np.maximum(overkill, 0) / unit_total + 1e-9)
+        kills = np.where(overkill >= -1e-9, 1 + extra_kills, 0)
+        leftover = np.maximum(overkill, 0) - extra_kills * unit_total
+
+        killed = kills > 0
+        self.front_shield = np.where(killed, self.unit_shield - np.minimum(leftover, self.unit_shield),
+                                     np.maximum(self.front_shield - total, 0))
+        self.front_health = np.where(killed, self.unit_health - np.maximum(leftover - self.unit_shield, 0),
+                                     self.front_health - health_damage)
+
+        self.alive_counts = np.maximum(self.alive_counts - kills, 0)
+        alive = self.alive_counts > 0
+        self.front_shield = np.where(alive, self.front_shield, 0)
+        self.front_health = np.where(alive, self.front_health, 0)
+        # The units behind the focused one are untouched
+        behind = np.maximum(self.alive_counts - 1, 0)
+        self.shield_pool = np.where(alive, behind * self.unit_shield + self.front_shield, 0)
+        self.health_pool = np.where(alive, behind * self.unit_health + self.front_health, 0)
+
+def simulate_units(bot, units_1: Iterable[Unit], units_2: Iterable[Unit], side_1_own=True,
+                   **simulator_kwargs) -> SimulationResult:
+    """
+    Simulates a single fight between two groups of units with their current health and shields
+
+    :param side_1_own: Whether units_1 are the bot's units, whose upgrades apply
+    """
+    units_1 = list(units_1)
+    units_2 = list(units_2)
+    tables = CombatTables.from_units(bot, units_1 + units_2, side_1_own)
+    simulator = CombatSimulator(tables, **simulator_kwargs)
+
+    slot_arrays = []
+    for units in (units_1, units_2):
+        pools: Dict[int, List[float]] = {}
+        for unit in units:
+            pool = pools.setdefault(unit._proto.unit_type, [0, 0, 0])
+            pool[0] += 1
+            pool[1] += unit.health
+            pool[2] += unit.shield
+        types = tables.indices(pools.keys()).reshape((1, -1)) if pools else np.full((1, 1), -1, dtype=np.intp)
+        values = np.array(list(pools.values()), dtype=float).reshape((-1, 3)) if pools else np.zeros((1, 3))
+        slot_arrays.append((types, values[:, 0].reshape((1, -1)), values[:, 1].reshape((1, -1)),
+                            values[:, 2].reshape((1, -1))))
+
+    (types_1, counts_1, health_1, shield_1), (types_2, counts_2, health_2, shield_2) = slot_arrays
+    return simulator.simulate(types_1, counts_1, types_2, counts_2, health_1, shield_1, health_2, shield_2)
@@ -0,0 +1,223 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from lib.sc2.pixel_map import PixelMap
+from lib.sc2.position import Point2
+from lib.sc2.unit import Unit
+
+from lambdanaut.pathfinding import DIAGONAL_COST
+
+# (dx, dy) of each direction code in DistanceField.directions
+DIRECTIONS: Tuple[Tuple[int, int], ...] = (
+    (0, -1), (0, 1), (-1, 0), (1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1))
+
+# Code of cells without a next step: the target itself and unreachable cells
+NO_DIRECTION = -1
+
+# How far an unpathable target is moved to find a pathable cell
+MAX_TARGET_SNAP_DISTANCE = 10
+
+
+class DistanceField(object):
+    """
+    Ground distances from every cell of the map to one target, and the direction
+    of the next step towards it. All lookups are O(1).
+    """
+
+    def __init__(self, target: Point2, distances: np.ndarray, directions: np.ndarray):
+        self.target = target
+
+        # distances[y, x]: Ground distance to the target, infinity if unreachable
+        self.distances: np.ndarray = distances
+
+        # directions[y, x]: Index into DIRECTIONS of the next step towards the target, or NO_DIRECTION
+        self.directions: np.ndarray = directions
+
+    def distance(self, point: Union[Point2, Unit]) -> float:
+        """
+        Returns the ground distance from `point` to the target. Infinity if unreachable or off the map
+        """
+        x, y = point.position.rounded
+        height, width = self.distances.shape
+        if not (0 <= x < width and 0 <= y < height):
+            return np.inf
+        return float(self.distances[y, x])
+
+    def distances_of(self, points: Iterable[Union[Point2, Unit]]) -> np.ndarray:
+        """
+        Returns the ground distances from many points to the target at once
+        """
+        cells = np.array([p.position.rounded for p in points], dtype=int).reshape((-1, 2))
+        height, width = self.distances.shape
+        on_map = (cells[:, 0] >= 0) & (cells[:, 0] < width) & (cells[:, 1] >= 0) & (cells[:, 1] < height)
+
+        result = np.full(len(cells), np.inf)
+        result[on_map] = self.distances[cells[on_map, 1], cells[on_map, 0]]
+        return result
+
+    def next_step(self, point: Union[Point2, Unit]) -> Optional[Point2]:
+        """
+        Returns the next cell towards the target, or None if `point` is the target or can't reach it
+        """
+        x, y = point.position.rounded
+        height, width = self.directions.shape
+        if not (0 <= x < width and 0 <= y < height):
+            return None
+
+        direction = self.directions[y, x]
+        if direction == NO_DIRECTION:
+            return None
+
+        dx, dy = DIRECTIONS[direction]
+        return Point2((x + dx, y + dy))
+
+    def path(self, point: Union[Point2, Unit]) -> Optional[List[Point2]]:
+        """
+        Returns the path of cells from `point` to the target, including both. None if unreachable
+        """
+        start = point.position.rounded
+        if self.distance(start) == np.inf:
+            return None
+
+        path = [start]
+        step = self.next_step(start)
+        while step is not None:
+            path.append(step)
+            step = self.next_step(step)
+
+        return path
+
+
+class DistanceFields(object):
+    """
+    Computes and caches a DistanceField per key location over a static pathing grid.
+
+    Key locations are the handful of places most movement goes to (start locations,
+    expansions, ramps). Their fields are computed on first use with one Dijkstra run
+    over the whole grid each.
+    """
+
+    def __init__(self, pathing_grid: PixelMap):
+        # Pathable cells are set in the pathing grid
+        self.pathable: np.ndarray = pathing_grid.data_numpy != 0
+
+        self._key_locations: Set[Tuple[int, int]] = set()
+        self._fields: Dict[Tuple[int, int], DistanceField] = {}
+
+        # Built on first use
+        self._graph = None
+
+    def add_key_location(self, point: Union[Point2, Unit]):
+        self._key_locations.add(tuple(point.position.rounded))
+
+    def is_key_location(self, point: Union[Point2, Unit]) -> bool:
+        return tuple(point.position.rounded) in self._key_locations
+
+    def field(self, target: Union[Point2, Unit]) -> DistanceField:
+        """
+        Returns the distance field towards `target`, computing it if it isn't cached yet
+        """
+        key = tuple(target.position.rounded)
+
+        distance_field = self._fields.get(key)
+        if distance_field is None:
+            distance_field = self._compute_field(Point2(key))
+            self._fields[key] = distance_field
+
+        return distance_field
+
+    def _compute_field(self, target: Point2) -> DistanceField:
+        height, width = self.pathable.shape
+        distances = np.full((height, width), np.inf, dtype=np.float32)
+        directions = np.full((height, width), NO_DIRECTION, dtype=np.int8)
+
+        target_cell = self._nearest_pathable_cell(target)
+        if target_cell is None:
+            return DistanceField(target, distances, directions)
+
+        if self._graph is None:
+            self._graph = grid_graph(self.pathable)
+        graph, cell_of_node, node_of_cell = self._graph
+
+        source = node_of_cell[target_cell[1], target_cell[0]]
+        node_distances, predecessors = dijkstra(
+            graph, directed=False, indices=source, return_predecessors=True)
+
+        ys, xs = np.divmod(cell_of_node, width)
+        distances[ys, xs] = node_distances
+
+        # On an undirected graph, the predecessor of a cell on the shortest path from
+        # the target is the next step from that cell towards the target
+        has_next = predecessors >= 0
+        next_ys, next_xs = np.divmod(cell_of_node[predecessors[has_next]], width)
+        step_codes = _direction_codes(next_xs - xs[has_next], next_ys - ys[has_next])
+        directions[ys[has_next], xs[has_next]] = step_codes
+
+        return DistanceField(target, distances, directions)
+
+    def _nearest_pathable_cell(self, point: Point2) -> Optional[Tuple[int, int]]:
+        x, y = int(point.x), int(point.y)
+        height, width = self.pathable.shape
+
+        for distance in range(MAX_TARGET_SNAP_DISTANCE + 1):
+            x0, x1 = max(0, x - distance), min(width, x + distance + 1)
+            y0, y1 = max(0, y - distance), min(height, y + distance + 1)
+            window = self.pathable[y0:y1, x0:x1]
+
+            if window.any():
+                window_ys, window_xs = np.nonzero(window)
+                squared = (window_xs + x0 - x) ** 2 + (window_ys + y0 - y) ** 2
+                closest = squared.argmin()
+                return int(window_xs[closest] + x0), int(window_ys[closest] + y0)
+
+        return None
+
+
+def grid_graph(pathable: np.ndarray):
+    """
+    Returns the 8-connected graph of the pathable cells of a (height, width) boolean array as an
+    undirected sparse matrix, the flat cell index of each node and a (height, width) array of the
+    node of each cell (-1 for cells that aren't pathable)
+    """
+
+    height, width = pathable.shape
+
+    cell_of_node = np.flatnonzero(pathable)
+    node_of_cell = np.full(height * width, -1, dtype=np.int64)
+    node_of_cell[cell_of_node] = np.arange(len(cell_of_node))
+    node_of_cell = node_of_cell.reshape((height, width))
+
+    rows = []
+    columns = []
+    costs = []
+    # Each undirected edge once: right, up, up-right and up-left
+    for dx, dy, cost in ((1, 0, 1), (0, 1, 1), (1, 1, DIAGONAL_COST), (-1, 1, DIAGONAL_COST)):
+        x0, x1 = max(0, -dx), width - max(0, dx)
+        y1 = height - dy
+        here = pathable[0:y1, x0:x1]
+        there = pathable[dy:y1 + dy, x0 + dx:x1 + dx]
+        connected = here & there
+
+        rows.append(node_of_cell[0:y1, x0:x1][connected])
+        columns.append(node_of_cell[dy:y1 + dy, x0 + dx:x1 + dx][connected])
+        costs.append(np.full(int(connected.sum()), cost, dtype=float))
+
+    nodes = len(cell_of_node)
+    graph = coo_matrix(
+        (np.concatenate(costs), (np.concatenate(rows), np.concatenate(columns))),
+        shape=(nodes, nodes)).tocsr()
+
+    return graph, cell_of_node, node_of_cell
+
+
+def _direction_codes(dx: np.ndarray, dy: np.ndarray) -> np.ndarray:
+    """
+    Converts arrays of unit steps into indices of DIRECTIONS
+    """
+    lookup = np.full((3, 3), NO_DIRECTION, dtype=np.int8)
+    for code, (step_x, step_y) in enumerate(DIRECTIONS):
+        lookup[step_y + 1, step_x + 1] = code
+    return lookup[dy + 1, dx + 1]
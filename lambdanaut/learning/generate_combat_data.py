@@ -12,6 +12,8 @@ from lib.sc2.unit import Unit
 from lib.sc2.position import Point2
 import lib.sc2.constants as const
 
+from lambdanaut.combat_simulation import CombatTables
+
 datetime_str = datetime.datetime.now().strftime("%Y-%m-%d-%H:%M")
 
 
@@ -28,6 +30,9 @@ SAVE_FILE_TRAINING = os.path.join(DATA_DIR, 'combat_save.json')
 DATA_FILE_TESTING = os.path.join(DATA_DIR, 'combat_testing.json')
 SAVE_FILE_TESTING = os.path.join(DATA_DIR, 'combat_testing_save.json')
 
+# Per-type tables of the units seen during training, so fights can be simulated without a client
+TABLES_FILE = os.path.join(DATA_DIR, 'combat_tables.npz')
+
 DATA_FILE = DATA_FILE_TRAINING if TRAINING_MODE else DATA_FILE_TESTING
 SAVE_FILE = SAVE_FILE_TRAINING if TRAINING_MODE else SAVE_FILE_TESTING
 
@@ -111,6 +116,13 @@ class TrainingBot(sc2.BotAI):
         # Record combat
         self.combat_record = []
 
+        # One unit of every type seen, to build the combat tables from
+        self.observed_units = {}
+        # The tables are saved as soon as every type of the builds was seen, so a partial run is enough to
+        # simulate the rest with simulate_combat_data.py
+        self.types_to_observe = {unit.value for set_1, set_2 in BUILDS_TO_GENERATE for unit in set_1 + set_2}
+        self.tables_saved = False
+
     async def on_step(self, iteration):
         # Load from a save file
         if iteration == 0:
@@ -122,6 +134,13 @@ class TrainingBot(sc2.BotAI):
         units = self.units()
         enemy = self.enemy_units()
 
+        for unit in units | enemy:
+            self.observed_units.setdefault(unit.type_id.value, unit)
+
+        if not self.tables_saved and self.types_to_observe.issubset(self.observed_units):
+            self.save_tables(TABLES_FILE)
+            self.tables_saved = True
+
         if self.training_loop < len(self.training_set):
             if not units or not enemy:
                 self.record_result()
@@ -186,6 +205,8 @@ class TrainingBot(sc2.BotAI):
 
                 # Save data
                 self.save_training_data(DATA_FILE)
+                if not self.tables_saved:
+                    self.save_tables(TABLES_FILE)
 
                 # Reset save file
                 self.save_save_file(SAVE_FILE, training_loop=0, build_i=0)
@@ -238,7 +259,9 @@ class TrainingBot(sc2.BotAI):
     def get_training_set(self):
         return self.training_set[self.training_loop]
 
-    def create_training_set(self, unit_types1, unit_types2) -> List[Tuple[Tuple[Tuple[Unit, int]]]]:
+    @staticmethod
+    def create_training_set(unit_types1, unit_types2, rng: random.Random = random) \
+            -> List[Tuple[Tuple[Tuple[Unit, int]]]]:
         # Get unit counts
         unit_counts = UNIT_COUNT_EXPLICIT
 
@@ -251,8 +274,8 @@ class TrainingBot(sc2.BotAI):
 
         # Permute the lists of units together and flatten it
         # [ ( (Z, 0), (B, 0), ), ( (Z, 1), (B, 0 ) )... ( (Z, 10), (B, 10) ) ... ]
-        training_set_builds1: List[Tuple[Tuple[Unit, int]]] = self.to_training_set_builds(training_set_counts1)
-        training_set_builds2: List[Tuple[Tuple[Unit, int]]] = self.to_training_set_builds(training_set_counts2)
+        training_set_builds1: List[Tuple[Tuple[Unit, int]]] = TrainingBot.to_training_set_builds(training_set_counts1)
+        training_set_builds2: List[Tuple[Tuple[Unit, int]]] = TrainingBot.to_training_set_builds(training_set_counts2)
 
         def is_viable(build: Tuple[Tuple[Unit, int]]) -> bool:
             """
@@ -295,13 +318,14 @@ class TrainingBot(sc2.BotAI):
         ]
 
         # Mutate the unit counts to be exponential variants
-        training_set = [tuple(tuple((u, max(1, round(random.expovariate(count)))) for u, count in build)
+        training_set = [tuple(tuple((u, max(1, round(rng.expovariate(count)))) for u, count in build)
                               for build in matchup)
                         for matchup in training_set]
 
         return training_set
 
-    def to_training_set_builds(self, training_set_counts: List[List[Tuple[Unit, int]]])\
+    @staticmethod
+    def to_training_set_builds(training_set_counts: List[List[Tuple[Unit, int]]])\
             -> List[Tuple[Tuple[Unit, int]]]:
         """
         Permute the lists of units together and flatten it
@@ -365,19 +389,7 @@ class TrainingBot(sc2.BotAI):
         self.combat_record.append(result)
 
     def randomize_results(self):
-        """Randomize combat results so it doesn't look like the same player won every match. """
-
-        for record in self.combat_record:
-            if random.randint(0, 1):
-                result = record['result']
-
-                if result != 0:
-                    p1 = record['1']
-                    p2 = record['2']
-
-                    record['result'] = 1 if result == 2 else 2
-                    record['1'] = p2
-                    record['2'] = p1
+        randomize_results(self.combat_record)
 
     def save_training_data(self, filepath):
 
@@ -389,6 +401,11 @@ class TrainingBot(sc2.BotAI):
             with open(filepath, 'w') as f:
                 f.write(json_combat_record)
 
+    def save_tables(self, filepath):
+        if self.observed_units:
+            print("Saving combat tables to `{}`".format(filepath))
+            CombatTables.from_units(self, self.observed_units.values()).save(filepath)
+
     def save_save_file(self, filepath, training_loop=None, build_i=None):
         training_loop = self.training_loop if training_loop is None else training_loop
         build_i = self.build_i if build_i is None else build_i
@@ -420,6 +437,22 @@ class TrainingBot(sc2.BotAI):
             self.combat_record = loaded
 
 
+def randomize_results(combat_record, rng: random.Random = random):
+    """Randomize combat results so it doesn't look like the same player won every match. """
+
+    for record in combat_record:
+        if rng.randint(0, 1):
+            result = record['result']
+
+            if result != 0:
+                p1 = record['1']
+                p2 = record['2']
+
+                record['result'] = 1 if result == 2 else 2
+                record['1'] = p2
+                record['2'] = p1
+
+
 def combine_data(filepaths, out_filepath):
     data = []
 
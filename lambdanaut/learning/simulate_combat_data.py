@@ -0,0 +1,174 @@
+"""
+Generates the combat data of generate_combat_data.py with the combat simulator instead of a live client
+
+The matchups of every build in BUILDS_TO_GENERATE are split into shards that are simulated by a pool of worker
+processes. Every shard is written to its own checkpoint file as soon as it's done, so an interrupted run continues
+with the missing shards. The matchups and the randomized sides of every shard are seeded from SEED, the build and
+the shard, so a run gives the same data no matter how many workers it uses or how often it was resumed.
+
+Needs the combat tables saved by TrainingBot, see generate_combat_data.TABLES_FILE. TrainingBot saves them
+as soon as it has seen every unit type of BUILDS_TO_GENERATE, so a live run can be stopped after that.
+
+Usage:
+    python -m lambdanaut.learning.simulate_combat_data [--workers N] [--seed N] [--restart]
+"""
+
+from collections import Counter
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from typing import List, Optional, Tuple
+
+from lambdanaut.combat_simulation import CombatSimulator, CombatTables
+from lambdanaut.learning.generate_combat_data import BUILDS_TO_GENERATE, DATA_DIR, DATA_FILE, TABLES_FILE, \
+    TRAINING_MODE, TrainingBot, randomize_results
+
+# Directory of the checkpoint files of every shard
+SHARDS_DIR = os.path.join(DATA_DIR, 'combat_shards' if TRAINING_MODE else 'combat_testing_shards')
+
+# Matchups per shard. Shards are also the batches of the simulator.
+SHARD_SIZE = 2000
+
+SEED = 0
+
+# Set in every worker process by init_worker
+_simulator: Optional[CombatSimulator] = None
+
+
+def shard_seed(seed, build_i, shard_i=None) -> str:
+    """
+    Seed of the random numbers of a build, or of a shard of a build. Strings seed random.Random deterministically.
+    """
+    return '{}-{}'.format(seed, build_i) if shard_i is None else '{}-{}-{}'.format(seed, build_i, shard_i)
+
+
+def create_shards(seed) -> List[Tuple[int, int, list]]:
+    """
+    Returns (build index, shard index, matchups) of every shard of every build
+    """
+    shards = []
+    for build_i, (unit_types1, unit_types2) in enumerate(BUILDS_TO_GENERATE):
+        training_set = TrainingBot.create_training_set(
+            unit_types1, unit_types2, random.Random(shard_seed(seed, build_i)))
+        for shard_i, start in enumerate(range(0, len(training_set), SHARD_SIZE)):
+            shards.append((build_i, shard_i, training_set[start:start + SHARD_SIZE]))
+    return shards
+
+
+def shard_filepath(build_i, shard_i) -> str:
+    return os.path.join(SHARDS_DIR, 'build_{}_shard_{}.json'.format(build_i, shard_i))
+
+
+def init_worker(tables_filepath):
+    global _simulator
+    _simulator = CombatSimulator(CombatTables.load(tables_filepath))
+
+
+def simulate_shard(shard: Tuple[int, int, list], seed) -> int:
+    """
+    Simulates every matchup of a shard and writes the records to the shard's checkpoint file.
+    Returns the number of matchups simulated.
+    """
+    build_i, shard_i, training_set = shard
+
+    # {type value: count} of both players of every matchup
+    armies_1 = []
+    armies_2 = []
+    for p1_units, p2_units in training_set:
+        for units, armies in ((p1_units, armies_1), (p2_units, armies_2)):
+            army = Counter()
+            for unit, unit_count in units:
+                army[unit.value] += unit_count
+            armies.append(army)
+
+    types_1, counts_1 = _simulator.tables.slots(armies_1)
+    types_2, counts_2 = _simulator.tables.slots(armies_2)
+    result = _simulator.simulate(types_1, counts_1, types_2, counts_2)
+
+    combat_record = []
+    for i in range(len(training_set)):
+        winner = int(result.winner[i])
+        both_dead = not result.remaining_1[i].any() and not result.remaining_2[i].any()
+
+        # Like TrainingBot, don't record fights in which neither player can kill the other
+        if winner == 0 and not both_dead:
+            continue
+
+        combat_record.append({'1': armies_1[i], '2': armies_2[i], 'result': winner,
+                              'win_ratio': min(1.0, float(result.win_ratio[i]))})
+
+    randomize_results(combat_record, random.Random(shard_seed(seed, build_i, shard_i)))
+
+    # Write to a temporary file first so interrupted runs don't leave partial shards
+    filepath = shard_filepath(build_i, shard_i)
+    with open(filepath + '.tmp', 'w') as f:
+        f.write(json.dumps(combat_record))
+    os.replace(filepath + '.tmp', filepath)
+
+    return len(training_set)
+
+
+def _simulate_shard(args) -> int:
+    return simulate_shard(*args)
+
+
+def merge_shards(shards, out_filepath):
+    """
+    Concatenates the records of all shards in build and shard order
+    """
+    data = []
+    for build_i, shard_i, _ in shards:
+        with open(shard_filepath(build_i, shard_i), 'r') as f:
+            data += json.loads(f.read())
+
+    with open(out_filepath, 'w') as f:
+        f.write(json.dumps(data))
+
+    return len(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate combat training data')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--restart', action='store_true', help='Simulate all shards, even checkpointed ones')
+    parser.add_argument('--out', default=DATA_FILE)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(TABLES_FILE):
+        print("No combat tables at `{}`. Run generate_combat_data.py until it saves them.".format(TABLES_FILE))
+        sys.exit(1)
+
+    tables = CombatTables.load(TABLES_FILE)
+    missing = {unit.name for unit_types1, unit_types2 in BUILDS_TO_GENERATE for unit in unit_types1 + unit_types2
+               if unit.value not in tables.type_ids}
+    if missing:
+        print("Unit types missing from the combat tables: {}".format(', '.join(sorted(missing))))
+        sys.exit(1)
+
+    os.makedirs(SHARDS_DIR, exist_ok=True)
+
+    shards = create_shards(args.seed)
+    pending = [shard for shard in shards
+               if args.restart or not os.path.exists(shard_filepath(shard[0], shard[1]))]
+    print("Simulating {} of {} shards with {} workers".format(len(pending), len(shards), args.workers))
+
+    start_time = time.perf_counter()
+    matchups = 0
+    with multiprocessing.Pool(args.workers, initializer=init_worker, initargs=(TABLES_FILE,)) as pool:
+        for shard_matchups in pool.imap_unordered(_simulate_shard, [(shard, args.seed) for shard in pending]):
+            matchups += shard_matchups
+            elapsed = time.perf_counter() - start_time
+            print("{} matchups in {:.1f}s. {:.0f} matchups per second".format(
+                matchups, elapsed, matchups / max(elapsed, 1e-9)))
+
+    records = merge_shards(shards, args.out)
+    print("Saved {} records to `{}`".format(records, args.out))
+
+
+if __name__ == '__main__':
+    main()
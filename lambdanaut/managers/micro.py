@@ -1,7 +1,6 @@
-import copy
 import math
 import random
-from typing import Iterable, List, Tuple, Union
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
 
 import lib.sc2 as sc2
 from lib.sc2.position import Point2
@@ -14,7 +13,7 @@ import lambdanaut.const2 as const2
 from lambdanaut.const2 import Messages
 from lambdanaut.expiringlist import ExpiringList
 from lambdanaut.managers import Manager
-from lambdanaut.pathfinding import Pathfinder
+from lambdanaut.pathfinding_service import PathRequest
 from lambdanaut.unit_cache import UnitCached
 import lambdanaut.utils as utils
 
@@ -61,6 +60,12 @@ class MicroManager(Manager):
         self._performing_zergling_runby = ExpiringList()
         self.has_performed_zergling_runby = False
 
+        # Background path searches of mutalisks. Mutalisk tag -> (path request, priority to attack at its end)
+        self.mutalisk_path_requests: Dict[int, Tuple[PathRequest, Unit]] = {}
+
+        # Game loops a mutalisk waits for its path before the request is dropped
+        self.mutalisk_path_deadline = round(const2.FPS * 2)
+
     def perform_surround_micro(self,
                                unit: Unit,
                                nearby_units: Units,
@@ -669,12 +674,17 @@ class MicroManager(Manager):
           * AND priority is further than Mutalisk attack range
           * AND No nearby ranged air units can hit us
         * Generate pixelmap of air-ranged enemy units
-        * Get path to priority around air-ranged enemy units
-        * Queue up path to priority and follow it
+        * Request path to priority around air-ranged enemy units
+        * Once the path is found (usually on a later frame), queue it up and follow it
         *
         """
         mutalisks = self.bot._units(const.MUTALISK)
 
+        # Drop path requests of dead mutalisks
+        for tag in set(self.mutalisk_path_requests) - mutalisks.tags:
+            request, _ = self.mutalisk_path_requests.pop(tag)
+            request.cancel()
+
         if mutalisks:
             attack_priorities = const2.WORKERS | {
                 const.SIEGETANK, const.SIEGETANKSIEGED, const.MEDIVAC,
@@ -682,9 +692,6 @@ class MicroManager(Manager):
                 const.BROODLORD,
             }
 
-            # Make a copy of a blank pixel map to draw on
-            pixel_map = copy.deepcopy(self.bot.blank_pixel_map)
-
             # Get enemy units that can attack air
             enemy_units = [u.snapshot for u in self.bot.enemy_cache.values() if u.can_attack_air]
 
@@ -697,36 +704,59 @@ class MicroManager(Manager):
 
             if enemy_priorities:
 
-                # Flood fill the pixel map with enemy unit ranges
-                utils.draw_unit_ranges(enemy_units)
-
                 # Get mutalisks that are in range of enemy units.
                 mutalisks_in_range_of_enemy = [mu for mu in mutalisks
                                                if any(u.target_in_range(mu) for u in enemy_units)]
 
                 for mutalisk in mutalisks:
-                    if not mutalisk.is_attacking and not mutalisk.is_moving \
-                            or mutalisks_in_range_of_enemy:
+                    if mutalisk.tag not in self.mutalisk_path_requests and \
+                            (not mutalisk.is_attacking and not mutalisk.is_moving
+                             or mutalisks_in_range_of_enemy):
                         nearest_priority = mutalisk.position.closest(enemy_priorities)
 
                         mutalisk_pos = mutalisk.position.rounded
                         priority_pos = nearest_priority.position.rounded
 
-                        pathfinder = Pathfinder(pixel_map)
+                        # Request a path around the enemy ranges
+                        request = self.bot.request_path_around_ranges(
+                            enemy_units, mutalisk_pos, priority_pos,
+                            deadline=self.bot.state.game_loop + self.mutalisk_path_deadline)
 
-                        path = pathfinder.find_path(mutalisk_pos, priority_pos)
+                        self.mutalisk_path_requests[mutalisk.tag] = (request, nearest_priority)
 
-                        if not path:
-                            continue
+                    self.follow_mutalisk_path(mutalisk)
+
+            else:
+                # Nothing to path to anymore
+                for request, _ in self.mutalisk_path_requests.values():
+                    request.cancel()
+                self.mutalisk_path_requests.clear()
 
-                        # Convert path to list and use only every 3rd step
-                        path: List[Point2] = [p for p in path][::3]
+    def follow_mutalisk_path(self, mutalisk: Unit):
+        """
+        Queues up the path of `mutalisk` once its path request is done
+        """
+        if mutalisk.tag not in self.mutalisk_path_requests:
+            return
+
+        request, priority = self.mutalisk_path_requests[mutalisk.tag]
+        if not request.done():
+            return
+
+        del self.mutalisk_path_requests[mutalisk.tag]
 
-                        # Issue move commands
-                        for p in path[1:-1]:
-                            self.bot.do(mutalisk.move(p, queue=True))
+        path = request.result()
+        if path is None:
+            return
 
-                        self.bot.do(mutalisk.attack(nearest_priority, queue=True))
+        # Use only every 3rd step
+        path: List[Point2] = [Point2(p) for p in map(tuple, path[::3].tolist())]
+
+        # Issue move commands
+        for p in path[1:-1]:
+            self.bot.do(mutalisk.move(p, queue=True))
+
+        self.bot.do(mutalisk.attack(priority, queue=True))
 
     async def manage_corruptors(self):
         corruptors = self.bot._units(const.CORRUPTOR)
@@ -919,8 +949,12 @@ class MicroManager(Manager):
         townhalls = self.bot.townhalls
         highest_priority_space = self.bot.priority_spaces[0]
 
+        # Relative strength of every (army cluster, enemy cluster) pair, evaluated at once on first use
+        army_strengths = None
+        enemy_cluster_indices = {id(cluster): i for i, cluster in enumerate(self.bot.enemy_clusters)}
+
         # enemy_cached = self.bot.enemy_cache.values()
-        for army_cluster in self.bot.army_clusters:
+        for army_cluster_index, army_cluster in enumerate(self.bot.army_clusters):
             army_center = army_cluster.position
 
             nearest_enemy_cluster = army_center.closest(self.bot.enemy_clusters)
@@ -930,8 +964,11 @@ class MicroManager(Manager):
             if army_center.distance_to(enemy_army_center) < 20:
                 # Micro against enemy clusters
                 if nearby_army and nearest_enemy_cluster:
-                    army_strength = self.bot.relative_army_strength(
-                        army_cluster, nearest_enemy_cluster, ignore_height_difference=False)
+                    if army_strengths is None:
+                        army_strengths = self.bot.combat_estimator.strength_matrix(
+                            self.bot.army_clusters, self.bot.enemy_clusters, ignore_height_difference=False)
+                    army_strength = float(
+                        army_strengths[army_cluster_index, enemy_cluster_indices[id(nearest_enemy_cluster)]])
 
                     ranged_units_in_attack_range_count = self.bot.count_units_in_attack_range(
                         nearby_army, nearest_enemy_cluster, ranged_only=True)
@@ -941,6 +978,11 @@ class MicroManager(Manager):
                     #     u.snapshot for u in enemy_cached
                     #     if u.type_id in const2.WORKERS and u.distance_to(army_center) < 35]
 
+                    # Moves whose target still has to be checked against the pathing grid, checked together
+                    # after the loop. List of (unit to move, target, fallback target, position to attack after)
+                    pending_moves: List[Tuple[
+                        Unit, Point2, Union[Point2, Callable[[], Point2], None], Optional[Point2]]] = []
+
                     for unit in nearby_army:
                         # Only micro movable units and workers that are currently defending
                         if unit.movement_speed > 0 \
@@ -994,16 +1036,10 @@ class MicroManager(Manager):
                                 towards_priority_target = unit.position.towards(
                                     highest_priority_space, distance_to_move)
 
-                                pathable = not self.bot.game_info.pathing_grid.is_set(towards_priority_target.rounded)
-                                if pathable:
-                                    # We can move there. It's pathable.
-                                    target = towards_priority_target
-                                else:
-                                    # We can't move there. Attempt to move further
-                                    target = unit.position.towards(
-                                        highest_priority_space, 7)
+                                # If we can't move there, attempt to move further
+                                further_target = unit.position.towards(highest_priority_space, 7)
 
-                                self.bot.do(unit.snapshot.move(target))
+                                pending_moves.append((unit.snapshot, towards_priority_target, further_target, None))
 
                             # Close the distance if our cluster isn't in range
                             elif unit_is_combatant and ranged_units_in_attack_range_ratio < 0.8 \
@@ -1029,21 +1065,19 @@ class MicroManager(Manager):
 
                                 away_from_enemy = unit.position.towards(nearest_enemy_unit, -distance_to_move)
 
-                                pathable = not self.bot.game_info.pathing_grid.is_set(away_from_enemy.rounded)
-                                if pathable:
-                                    # We can move backwards. It's pathable.
-                                    target = away_from_enemy
+                                # If we can't move backwards, attempt to retreat to a townhall away from the enemy,
+                                # or in the least threatened direction without townhalls.
+                                # The target is only looked up if the move backwards turns out to be blocked.
+                                if townhalls:
+                                    further_away_from_enemy = unit.position.towards(
+                                        nearest_enemy_unit.position, distance=-8)
+                                    retreat_target = lambda townhalls=townhalls, position=further_away_from_enemy: \
+                                        townhalls.closest_to(position).position
                                 else:
-                                    # We can't move backwards. Attempt to retreat to a townhall away from the enemy
-                                    away_from_enemy = unit.position.towards(nearest_enemy_unit.position, distance=-8)
-                                    if townhalls:
-                                        target = townhalls.closest_to(away_from_enemy).position
-                                    else:
-                                        target = None
+                                    retreat_target = lambda unit=unit: self.safest_retreat_position(unit)
 
-                                if target is not None:
-                                    self.bot.do(unit.move(target))
-                                    self.bot.do(unit.attack(nearest_enemy_unit.position, queue=True))
+                                pending_moves.append(
+                                    (unit, away_from_enemy, retreat_target, nearest_enemy_unit.position))
 
                             # Close the distance if our unit's range is lower than the nearest enemy's range
                             elif unit_is_combatant and unit.weapon_cooldown \
@@ -1055,9 +1089,7 @@ class MicroManager(Manager):
 
                                 towards_enemy = unit.position.towards(nearest_enemy_unit, 2)
 
-                                pathable = not self.bot.game_info.pathing_grid.is_set(towards_enemy.rounded)
-                                if pathable:
-                                    self.bot.do(unit.move(towards_enemy))
+                                pending_moves.append((unit, towards_enemy, None, None))
 
                             # Attack the closest worker/townhall if there are no attackable nearby units
                             # elif not any_attackable_non_workers \
@@ -1097,6 +1129,43 @@ class MicroManager(Manager):
                                 }
                                 await self.manage_priority_targeting(unit, attack_priorities=priorities)
 
+                    self.do_pending_moves(pending_moves)
+
+    def safest_retreat_position(self, unit: Unit) -> Point2:
+        """
+        Returns the position 8 away from the unit with the least threat of the enemy units we remember
+        """
+        threat_maps = self.bot.threat_maps
+        threat_map = threat_maps.air if unit.is_flying else threat_maps.ground
+        return threat_map.safest_direction(unit, distance=8)
+
+    def do_pending_moves(self, pending_moves: List[Tuple[
+            Unit, Point2, Union[Point2, Callable[[], Point2], None], Optional[Point2]]]):
+        """
+        Checks the targets of all moves in one pathing grid lookup, then moves each unit to its
+        target if the check passes, or to its fallback target otherwise. Moves without a target are skipped.
+        Fallback targets that are expensive to find can be given as callables, which are only called
+        if the check fails.
+
+        :param pending_moves: List of (unit to move, target, fallback target, position to attack after)
+        """
+        if not pending_moves:
+            return
+
+        targets = [target.rounded for _, target, _, _ in pending_moves]
+
+        # Pixels outside the map count as set, so their moves fall back
+        pathable = self.bot.game_info.pathing_grid.sample(targets, default=1) == 0
+
+        for (unit, target, fallback_target, attack_position), target_pathable in zip(pending_moves, pathable):
+            if not target_pathable:
+                target = fallback_target() if callable(fallback_target) else fallback_target
+
+            if target is not None:
+                self.bot.do(unit.move(target))
+                if attack_position is not None:
+                    self.bot.do(unit.attack(attack_position, queue=True))
+
     async def read_messages(self):
         """
         Reads incoming subscribed messages and performs micro adjustments and actions"""
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from lib.sc2.pixel_map import PixelMap
+
+# Default memory bound of a PathCache in bytes
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+
+# Estimated bytes of an entry besides its path array (key tuple, dict slot, array header)
+ENTRY_OVERHEAD = 250
+
+# Returned by PathCache.get when a path isn't cached. None is a cached "no path".
+MISSING = object()
+
+
+class PathCache(object):
+    """
+    Least recently used cache of paths between grid cells
+
+    Entries are keyed by (start cell, goal cell, grid id, grid version, pathfinder kind), where the grid id and
+    version come from the PixelMap the path was found on. The kind keeps paths of pathfinders that read
+    the same grid differently apart, e.g. HierarchicalPathfinder walks set cells and Pathfinder empty ones.
+    When a grid's version changes, all of its older entries are dropped. The oldest entries are evicted when the paths take more than
+    `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+
+        self._entries: OrderedDict = OrderedDict()
+
+        # Latest version seen of each grid id
+        self._grid_versions: Dict[int, int] = {}
+
+        # Estimated bytes used by the entries
+        self.bytes = 0
+
+        # Statistics, see Lambdanaut.path_cache_stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, grid: PixelMap, start: Tuple[int, int], goal: Tuple[int, int], kind: Hashable):
+        """
+        Returns the cached path from start to goal on `grid` found by a pathfinder of `kind` as an (n, 2) array,
+        None if there is no path, or MISSING if it isn't cached
+        """
+        self._drop_stale(grid)
+
+        key = self._key(grid, start, goal, kind)
+        path = self._entries.get(key, MISSING)
+
+        if path is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+
+        return path
+
+    def put(self, grid: PixelMap, start: Tuple[int, int], goal: Tuple[int, int], kind: Hashable,
+            path: Optional[np.ndarray]):
+        """
+        Caches the path from start to goal on `grid` found by a pathfinder of `kind`. The path array is made read-only.
+        """
+        self._drop_stale(grid)
+
+        if path is not None:
+            path.flags.writeable = False
+
+        key = self._key(grid, start, goal, kind)
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = path
+        self.bytes += self._size(path)
+
+        while self.bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._grid_versions.clear()
+        self.bytes = 0
+
+    def _drop_stale(self, grid: PixelMap):
+        """
+        Drops all entries of older versions of `grid`
+        """
+        last_version = self._grid_versions.get(grid.grid_id)
+        if last_version == grid.version:
+            return
+
+        if last_version is not None:
+            stale_keys = [key for key in self._entries if key[2] == grid.grid_id]
+            for key in stale_keys:
+                self._remove(key)
+
+        self._grid_versions[grid.grid_id] = grid.version
+
+    def _remove(self, key):
+        self.bytes -= self._size(self._entries.pop(key))
+
+    @staticmethod
+    def _key(grid: PixelMap, start: Tuple[int, int], goal: Tuple[int, int], kind: Hashable):
+        return (int(start[0]), int(start[1])), (int(goal[0]), int(goal[1])), grid.grid_id, grid.version, kind
+
+    @staticmethod
+    def _size(path: Optional[np.ndarray]) -> int:
+        return ENTRY_OVERHEAD + (0 if path is None else path.nbytes)
@@ -1,68 +1,156 @@
-from typing import Iterator, List, Tuple
+from heapq import heappush, heappop
+import math
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
 
-from lib.astar import AStar
 from lib.sc2.pixel_map import PixelMap
 from lib.sc2.position import Point2
 
+# Cost of a diagonal step (Hypotenuse of a 1x1 right triangle)
+DIAGONAL_COST = 1.4142
+
+# Values of Pathfinder._cells
+OUTSIDE = 0
+EMPTY = 1
+SET = 2
+
 
-class Pathfinder(AStar):
+class Pathfinder(object):
     """
     Uses a pathfinding algorithm to traverse a pixel map
+
+    A* over the cells of the pixel map's numpy array. Empty cells are traversable.
+    If we're in a cell that's set, act like its neighbors are traversable.
+
+    Cells are addressed by flat integer indices into a copy of the map that has a
+    border of OUTSIDE cells, so neighbors never need bounds checks.
     """
 
     def __init__(self, pixel_map: PixelMap):
-        super(AStar, self).__init__()
-
         # Pixel map to traverse
         self.pixel_map: PixelMap = pixel_map
 
-    def find_path(self, start: Tuple[int, int], goal: Tuple[int, int]) -> Iterator[Tuple[int, int]]:
+        self._load(pixel_map.data_numpy)
+
+    @classmethod
+    def from_array(cls, data: np.ndarray) -> 'Pathfinder':
         """
-        Returns a path from start to goal
+        Returns a Pathfinder over a (height, width) array of pixel map values, without a PixelMap
         """
-        path = self.astar(start, goal)
-        return None if path is None else (Point2(p) for p in path)
+        pathfinder = cls.__new__(cls)
+        pathfinder.pixel_map = None
+        pathfinder._load(data)
+        return pathfinder
 
-    def heuristic_cost_estimate(self, current: Tuple[int, int], goal: Tuple[int, int]):
-        p1 = Point2(current)
-        p2 = Point2(goal)
+    def _load(self, data: np.ndarray):
+        height, width = data.shape
 
-        return p1.distance_to(p2)
+        # Width of the padded map
+        self._width = width + 2
 
-    def distance_between(self, n1: Tuple[int, int], n2: Tuple[int, int]):
-        """
-        Returns the distance between two adjacent nodes
-        """
-        x1, y1 = n1
-        x2, y2 = n2
+        cells = np.full((height + 2, width + 2), OUTSIDE, dtype=np.uint8)
+        cells[1:-1, 1:-1] = np.where(data == 0, EMPTY, SET)
 
-        if x1 == x2 or y1 == y2:
-            # Nodes are adjacent horizontally or vertically. Return 1
-            return 1
-        else:
-            # Nodes are adjacent diagonally. Return 1.4142 (Hypotenuse of a 1x1 right triangle)
-            return 1.4142
+        # Bytes index faster than numpy arrays in the search loop
+        self._cells: bytes = cells.tobytes()
 
-    def neighbors(self, node: Tuple[int, int]):
+        w = self._width
+        # Horizontal, vertical, and diagonal neighbors as (index offset, cost)
+        self._moves: Tuple[Tuple[int, float], ...] = (
+            (-w, 1), (w, 1), (-1, 1), (1, 1),
+            (w + 1, DIAGONAL_COST), (-w + 1, DIAGONAL_COST), (w - 1, DIAGONAL_COST), (-w - 1, DIAGONAL_COST))
+
+    def find_path(self, start: Tuple[int, int], goal: Tuple[int, int]) -> Iterator[Tuple[int, int]]:
         """
-        Gets the nearest neighbors for a node
+        Returns a path from start to goal
+        """
+        path = self.find_path_array(start, goal)
+        return None if path is None else (Point2(p) for p in map(tuple, path.tolist()))
 
-        If we're in a node that's unpathable, act like its neighbors are pathable.
+    def find_path_array(self, start: Tuple[int, int], goal: Tuple[int, int]) -> Optional[np.ndarray]:
         """
-        x, y = node
+        Returns a path from start to goal as an (n, 2) array of (x, y) cells, including start and goal.
+        Returns None if there is no path.
+        """
+        start_index = self._index(start)
+        goal_index = self._index(goal)
+
+        cells = self._cells
+        if not cells[start_index] or not cells[goal_index]:
+            return None
 
-        # Horizontal, vertical, and diagonal neighbors
-        nodes = [(x, y-1), (x, y+1), (x-1, y), (x+1, y),
-                          (x+1, y+1), (x+1, y-1), (x-1, y+1), (x-1, y-1)]
+        if start_index == goal_index:
+            return self._to_points([start_index])
 
-        if self.pixel_map.is_empty(node):
-            # Filter for nodes that aren't set
-            nodes = [(nx, ny) for nx, ny in nodes
-                     if 0 <= nx < self.pixel_map.width
-                     and 0 <= ny < self.pixel_map.height
-                     and self.pixel_map.is_empty((nx, ny))]
+        w = self._width
+        moves = self._moves
+        goal_y, goal_x = divmod(goal_index, w)
+        octile_factor = DIAGONAL_COST - 2
 
-        return nodes
+        g_scores: List[float] = [math.inf] * len(cells)
+        came_from: List[int] = [-1] * len(cells)
+        closed = bytearray(len(cells))
+
+        g_scores[start_index] = 0
+        open_heap: List[Tuple[float, int]] = [(0, start_index)]
+
+        while open_heap:
+            _, current = heappop(open_heap)
+
+            if closed[current]:
+                continue
+
+            if current == goal_index:
+                break
+
+            closed[current] = 1
+
+            current_g = g_scores[current]
+            from_set = cells[current] == SET
+
+            for offset, cost in moves:
+                neighbor = current + offset
+                cell = cells[neighbor]
+
+                if cell == OUTSIDE or closed[neighbor] or (cell == SET and not from_set):
+                    continue
+
+                tentative_g = current_g + cost
+                if tentative_g < g_scores[neighbor]:
+                    g_scores[neighbor] = tentative_g
+                    came_from[neighbor] = current
+
+                    # Octile distance to the goal
+                    y, x = divmod(neighbor, w)
+                    dx = abs(x - goal_x)
+                    dy = abs(y - goal_y)
+                    heuristic = dx + dy + octile_factor * (dx if dx < dy else dy)
+
+                    heappush(open_heap, (tentative_g + heuristic, neighbor))
+        else:
+            return None
+
+        path = [goal_index]
+        while path[-1] != start_index:
+            path.append(came_from[path[-1]])
+        path.reverse()
+
+        return self._to_points(path)
+
+    def _index(self, point: Tuple[int, int]) -> int:
+        """
+        Returns the flat index of a map cell, or the index of a padding cell if it's outside the map
+        """
+        x, y = int(point[0]), int(point[1])
+        height = len(self._cells) // self._width - 2
+        if not (0 <= x < self._width - 2 and 0 <= y < height):
+            return 0
+        return (y + 1) * self._width + x + 1
+
+    def _to_points(self, indices: List[int]) -> np.ndarray:
+        ys, xs = np.divmod(np.array(indices, dtype=int), self._width)
+        return np.stack((xs - 1, ys - 1), axis=1)
 
     def print_path(self, path: List[Tuple[int, int]]):
         """
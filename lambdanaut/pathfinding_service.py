@@ -0,0 +1,286 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+import multiprocessing
+from multiprocessing import shared_memory
+from multiprocessing.synchronize import Barrier
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from lib.sc2.pixel_map import PixelMap
+
+from lambdanaut.pathfinding import Pathfinder
+
+# Amount of worker processes
+DEFAULT_WORKERS = 2
+
+# Seconds start() waits for the workers to start
+WARM_UP_TIMEOUT = 10
+
+# Shared grids each worker keeps attached, least recently used are closed first
+WORKER_GRID_CACHE_SIZE = 8
+
+# Grids attached by this worker process: shared memory name -> (shared memory, pathfinder over it)
+_worker_grids: OrderedDict = OrderedDict()
+
+
+def _worker_find_path(name: str, shape: Tuple[int, int],
+                      start: Tuple[int, int], goal: Tuple[int, int]) -> Optional[np.ndarray]:
+    """
+    Runs in a worker process. Finds a path on the shared grid called `name`.
+    """
+    entry = _worker_grids.get(name)
+    if entry is None:
+        memory = shared_memory.SharedMemory(name=name)
+        data = np.ndarray(shape, dtype=np.uint8, buffer=memory.buf)
+        entry = (memory, Pathfinder.from_array(data))
+        _worker_grids[name] = entry
+
+        while len(_worker_grids) > WORKER_GRID_CACHE_SIZE:
+            _, (old_memory, _) = _worker_grids.popitem(last=False)
+            old_memory.close()
+    else:
+        _worker_grids.move_to_end(name)
+
+    return entry[1].find_path_array(start, goal)
+
+
+def _worker_warm_up(barrier: Barrier):
+    """
+    Runs in a worker process as the initializer of the pool. Runs a tiny search so the first real request
+    doesn't pay for the worker's setup, then waits for the other workers so no worker takes two warm-up tasks.
+    """
+    Pathfinder.from_array(np.zeros((2, 2), dtype=np.uint8)).find_path_array((0, 0), (1, 1))
+    try:
+        barrier.wait(WARM_UP_TIMEOUT)
+    except threading.BrokenBarrierError:
+        # Some worker didn't start in time. Not waiting is fine, the worker still works.
+        pass
+
+
+def _worker_ready() -> bool:
+    """
+    Runs in a worker process. Returns once the worker finished its initializer.
+    """
+    return True
+
+
+class SharedGrid(object):
+    """
+    Copy of one version of a pixel map in shared memory, readable by the worker processes
+    """
+
+    def __init__(self, pixel_map: PixelMap):
+        self.grid_id: int = pixel_map.grid_id
+        self.version: int = pixel_map.version
+
+        data = pixel_map.data_numpy
+        self.shape: Tuple[int, int] = data.shape
+        self.memory = shared_memory.SharedMemory(create=True, size=max(1, data.size))
+        np.ndarray(data.shape, dtype=np.uint8, buffer=self.memory.buf)[:] = data
+
+        # Requests reading this grid that haven't finished yet
+        self.requests: List['PathRequest'] = []
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    def in_use(self) -> bool:
+        # Cancelled searches that already started still read the grid until they finish
+        self.requests = [request for request in self.requests if not request._future.done()]
+        return bool(self.requests)
+
+    def free(self):
+        self.memory.close()
+        self.memory.unlink()
+
+
+class PathRequest(object):
+    """
+    Handle of a path search running in the background
+
+    Poll it with done() and result() on a later frame, or await it.
+    The result is an (n, 2) array of (x, y) cells like Pathfinder.find_path_array, or None if there's no path.
+    """
+
+    def __init__(self, future: Future, deadline: Optional[int] = None):
+        self._future: Future = future
+
+        # Game loop after which the request is dropped, or None to never drop it
+        self.deadline: Optional[int] = deadline
+
+        # Whether the request was cancelled or dropped. A search that already started
+        # keeps running, but its result is never returned.
+        self._cancelled = False
+
+    def __await__(self):
+        return asyncio.wrap_future(self._future).__await__()
+
+    def done(self) -> bool:
+        """
+        Returns True if the request has a result or was cancelled
+        """
+        return self._cancelled or self._future.done()
+
+    def cancelled(self) -> bool:
+        return self._cancelled or self._future.cancelled()
+
+    def cancel(self):
+        self._cancelled = True
+        self._future.cancel()
+
+    def exception(self) -> Optional[BaseException]:
+        """
+        Returns the error the search raised, if any
+        """
+        if not self._future.done() or self.cancelled():
+            return None
+        return self._future.exception()
+
+    def result(self) -> Optional[np.ndarray]:
+        """
+        Returns the path. Returns None if there is no path, the request was cancelled or failed,
+        or it isn't done yet.
+        """
+        if self.exception() is not None or not self._future.done() or self.cancelled():
+            return None
+        return self._future.result()
+
+
+class PathfindingService(object):
+    """
+    Runs Pathfinder searches in a pool of worker processes, off the event loop
+
+    Grids are copied into shared memory once per version of their pixel map, so
+    requests only send the grid's name and the start and goal cells to the workers.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS):
+        self.max_workers = max_workers
+
+        # Started by start(), or on the first request if it wasn't called
+        self._executor: ProcessPoolExecutor = None
+
+        # Latest shared version of each pixel map by grid id
+        self._grids: Dict[int, SharedGrid] = {}
+
+        # Older versions that still have requests reading them
+        self._retired_grids: List[SharedGrid] = []
+
+        # Requests with a deadline
+        self._deadline_requests: List[PathRequest] = []
+
+        # Statistics
+        self.submitted = 0
+        self.expired = 0
+
+    def submit(self, pixel_map: PixelMap, start: Tuple[int, int], goal: Tuple[int, int],
+               deadline: Optional[int] = None) -> PathRequest:
+        """
+        Starts searching a path from start to goal on `pixel_map`, with the semantics of Pathfinder
+
+        :param pixel_map: Pixel map to search on. Its current version is copied, later changes aren't seen.
+        :param start: Start cell
+        :param goal: Goal cell
+        :param deadline: Game loop after which the request is dropped by expire()
+        """
+        if self._executor is None:
+            self.start()
+
+        grid = self._shared_grid(pixel_map)
+        future = self._executor.submit(
+            _worker_find_path, grid.name, grid.shape,
+            (int(start[0]), int(start[1])), (int(goal[0]), int(goal[1])))
+
+        request = PathRequest(future, deadline)
+        grid.requests.append(request)
+        if deadline is not None:
+            self._deadline_requests.append(request)
+
+        self.submitted += 1
+
+        return request
+
+    def start(self):
+        """
+        Starts the workers and waits up to WARM_UP_TIMEOUT seconds until each of them ran a search,
+        so requests don't have to wait for workers to start. Meant to be called before the game steps,
+        e.g. in on_start.
+        """
+        if self._executor is not None:
+            return
+
+        # The pool starts a worker per task while no worker is idle. The barrier keeps every worker in its
+        # initializer until all of them started, so each of the tasks below starts a worker of its own.
+        barrier = multiprocessing.Barrier(self.max_workers)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers, initializer=_worker_warm_up, initargs=(barrier,))
+        wait([self._executor.submit(_worker_ready) for _ in range(self.max_workers)], timeout=WARM_UP_TIMEOUT)
+
+    @staticmethod
+    def completed(path: Optional[np.ndarray]) -> PathRequest:
+        """
+        Returns a finished request with `path` as its result, e.g. for a path found in a cache
+        """
+        future = Future()
+        future.set_result(path)
+        return PathRequest(future)
+
+    def expire(self, game_loop: int):
+        """
+        Cancels requests that are past their deadline and frees grids no request reads anymore.
+        Meant to be called once per step.
+        """
+        pending = []
+        for request in self._deadline_requests:
+            if request.done():
+                continue
+            if game_loop > request.deadline:
+                request.cancel()
+                self.expired += 1
+            else:
+                pending.append(request)
+        self._deadline_requests = pending
+
+        retired = []
+        for grid in self._retired_grids:
+            if grid.in_use():
+                retired.append(grid)
+            else:
+                grid.free()
+        self._retired_grids = retired
+
+    def shutdown(self):
+        """
+        Stops the workers and frees all shared grids
+        """
+        if self._executor is not None:
+            try:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            except TypeError:
+                # cancel_futures is new in Python 3.9. Queued searches still run, their results are never read.
+                self._executor.shutdown(wait=False)
+            self._executor = None
+
+        for grid in list(self._grids.values()) + self._retired_grids:
+            grid.free()
+        self._grids = {}
+        self._retired_grids = []
+        self._deadline_requests = []
+
+    def _shared_grid(self, pixel_map: PixelMap) -> SharedGrid:
+        """
+        Returns the shared copy of the current version of `pixel_map`, creating it if needed
+        """
+        grid = self._grids.get(pixel_map.grid_id)
+
+        if grid is None or grid.version != pixel_map.version:
+            if grid is not None:
+                self._retired_grids.append(grid)
+            grid = SharedGrid(pixel_map)
+            self._grids[pixel_map.grid_id] = grid
+
+        return grid
@@ -0,0 +1,150 @@
+import math
+from typing import Dict, Iterable, Union
+
+import numpy as np
+
+from lib.sc2.position import Point2
+from lib.sc2.unit import Unit
+
+import lambdanaut.const2 as const2
+
+# Attack ranges are stretched by this factor, to keep a margin around them
+RANGE_MARGIN = 1.15
+
+# DPS of units that can attack but have no known DPS (no weapon data)
+MIN_THREAT_DPS = 1.0
+
+# Directions sampled by ThreatMap.safest_direction
+SAFEST_DIRECTION_SAMPLES = 16
+
+# Disk kernels by radius, see disk_kernel
+_disk_kernels: Dict[int, np.ndarray] = {}
+
+
+def disk_kernel(radius: int) -> np.ndarray:
+    """
+    Returns a (2 * radius + 1, 2 * radius + 1) float array that is 1 inside a disk of `radius` and 0 outside
+    """
+    kernel = _disk_kernels.get(radius)
+    if kernel is None:
+        offsets = np.arange(-radius, radius + 1)
+        squared = offsets[:, None] ** 2 + offsets[None, :] ** 2
+        kernel = (squared <= radius * radius + radius).astype(np.float32)
+        _disk_kernels[radius] = kernel
+    return kernel
+
+
+class ThreatMap(object):
+    """
+    Float grid of the DPS that enemy units deal to each cell of the map, either on the
+    ground or in the air. Every unit is stamped in as a disk of its attack range.
+    """
+
+    def __init__(self, width: int, height: int, air: bool):
+        # Whether this map holds the threat to air units instead of ground units
+        self.air = air
+
+        # grid[y, x]: Summed DPS of the units that can attack the cell
+        self.grid: np.ndarray = np.zeros((height, width), dtype=np.float32)
+
+    def clear(self):
+        self.grid.fill(0)
+
+    def add(self, position: Union[Point2, Unit], radius: int, dps: float):
+        """
+        Adds `dps` to all cells within `radius` of `position`
+        """
+        x, y = position.position.rounded
+        height, width = self.grid.shape
+
+        x0, x1 = max(0, x - radius), min(width, x + radius + 1)
+        y0, y1 = max(0, y - radius), min(height, y + radius + 1)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        kernel = disk_kernel(radius)
+        kernel_x0, kernel_y0 = x0 - (x - radius), y0 - (y - radius)
+        self.grid[y0:y1, x0:x1] += dps * kernel[kernel_y0:kernel_y0 + y1 - y0, kernel_x0:kernel_x0 + x1 - x0]
+
+    def add_units(self, units: Iterable[Unit]):
+        """
+        Adds the threat of every unit that can attack this map's layer
+        """
+        for unit in units:
+            if self.air:
+                if not unit.can_attack_air:
+                    continue
+                dps, attack_range = unit.air_dps, unit.air_range
+            else:
+                if not unit.can_attack_ground:
+                    continue
+                dps, attack_range = unit.ground_dps, unit.ground_range
+
+            dps = dps or const2.DEFAULT_DPS_MAP.get(unit.type_id) or MIN_THREAT_DPS
+            self.add(unit, round(attack_range * RANGE_MARGIN), dps)
+
+    def threat_at(self, point: Union[Point2, Unit]) -> float:
+        """
+        Returns the threat at `point`. Zero outside the map.
+        """
+        x, y = point.position.rounded
+        height, width = self.grid.shape
+        if not (0 <= x < width and 0 <= y < height):
+            return 0.0
+        return float(self.grid[y, x])
+
+    def threats_at(self, points: np.ndarray) -> np.ndarray:
+        """
+        Returns the threat at each point of an (n, 2) array of (x, y) points. Infinity outside the map.
+        """
+        cells = np.floor(np.asarray(points, dtype=float).reshape((-1, 2)) + 0.5).astype(int)
+        height, width = self.grid.shape
+        on_map = (cells[:, 0] >= 0) & (cells[:, 0] < width) & (cells[:, 1] >= 0) & (cells[:, 1] < height)
+
+        threats = np.full(len(cells), np.inf)
+        threats[on_map] = self.grid[cells[on_map, 1], cells[on_map, 0]]
+        return threats
+
+    def safest_direction(self, point: Union[Point2, Unit], distance: float = 4) -> Point2:
+        """
+        Returns the point `distance` away from `point` with the least threat.
+        Ties go to the point where the threat is lowest halfway there.
+        """
+        center = np.array(point.position, dtype=float)
+        angles = np.linspace(0, 2 * math.pi, SAFEST_DIRECTION_SAMPLES, endpoint=False)
+        directions = np.stack((np.cos(angles), np.sin(angles)), axis=1)
+
+        targets = center + directions * distance
+        threats = self.threats_at(targets)
+        halfway_threats = self.threats_at(center + directions * (distance / 2))
+
+        best = np.lexsort((halfway_threats, threats))[0]
+        return Point2(tuple(targets[best].tolist()))
+
+    def threatened(self) -> np.ndarray:
+        """
+        Returns a (height, width) boolean array of the cells that any unit can attack
+        """
+        return self.grid > 0
+
+
+class ThreatMaps(object):
+    """
+    Ground and air threat maps of the same units
+    """
+
+    def __init__(self, width: int, height: int):
+        self.ground: ThreatMap = ThreatMap(width, height, air=False)
+        self.air: ThreatMap = ThreatMap(width, height, air=True)
+
+    def update(self, units: Iterable[Unit]):
+        """
+        Replaces the threats with those of `units`
+        """
+        units = list(units)
+
+        self.ground.clear()
+        self.ground.add_units(units)
+
+        self.air.clear()
+        self.air.add_units(units)
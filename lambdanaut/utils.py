@@ -1,10 +1,51 @@
+from functools import lru_cache
 from typing import Callable, Iterable, List, Set, Tuple, Union
 import math
 
+import numpy as np
+
 from lib.sc2.unit import Unit
+from lib.sc2.unit_type_table import UnitTypeTable
 from lib.sc2.pixel_map import PixelMap
 from lib.sc2.position import Point2
 
+import lambdanaut.const2 as const2
+
+
+def is_melee(unit: Unit) -> bool:
+    table = unit._bot_object.unit_type_table
+    return bool(table.is_melee[table.index(unit._proto.unit_type)])
+
+
+def adjusted_dps(unit: Unit) -> float:
+    """
+    Gets an average of a unit's dps, and returns alternative values if the
+    unit doesn't have dps, but still does damage (like banelings)
+    """
+    table = unit._bot_object.unit_type_table
+    return float(adjusted_dps_column(table)[table.index(unit._proto.unit_type)])
+
+
+@lru_cache(maxsize=1)
+def adjusted_dps_column(table: UnitTypeTable) -> np.ndarray:
+    """
+    Returns `adjusted_dps` of every unit type as a column of `table`. Built once per table.
+    """
+    ground_dps = table.ground_dps
+    air_dps = table.air_dps
+
+    dps = np.where(
+        (ground_dps > 0) & (air_dps <= 0), ground_dps,
+        np.where((air_dps > 0) & (ground_dps <= 0), air_dps, (ground_dps + air_dps) / 2))
+
+    for type_id, default_dps in const2.DEFAULT_DPS_MAP.items():
+        index = table.index(type_id)
+        if index != table.unknown_index:
+            dps[index] = default_dps
+
+    dps.flags.writeable = False
+    return dps
+
 
 def ramp_point_nearest_point(ramps, p):
     # UNUSED RIGHT NOW
@@ -39,9 +80,7 @@ def blank_out_pixel_map(pixel_map: PixelMap, value=0x0):
     :param pixel_map: pixel map to mutate
     :param value: value to flood entire map with
     """
-    for y in range(pixel_map.height):
-        for x in range(pixel_map.width):
-            pixel_map[(x, y)] = value
+    pixel_map.fill(value)
 
 
 def flood_fill_(pixel_map: PixelMap, start_point: Point2, pred: Callable[[int], bool]) -> Set[Point2]:
@@ -22,9 +22,12 @@ from .constants import (
     EQUIVALENTS_FOR_TECH_PROGRESS,
     TERRAN_STRUCTURES_REQUIRE_SCV,
 )
+from .damage_matrix import DamageEngine
 from .data import ActionResult, Alert, Race, Result, Target, race_gas, race_townhalls, race_worker
 from .distances import DistanceCalculation
 from .game_data import AbilityData, GameData
+from .map_state import MapStateDecoder, decode_into
+from .pathing_grid import PathingGridTracker
 
 from .dicts.unit_trained_from import UNIT_TRAINED_FROM
 from .dicts.unit_train_build_abilities import TRAIN_INFO
@@ -39,7 +42,10 @@ from .ids.upgrade_id import UpgradeId
 from .pixel_map import PixelMap
 from .position import Point2, Point3
 from .unit import Unit
+from .unit_pool import UnitPool
 from .units import Units
+from .unit_store import UnitStore
+from .unit_type_table import UnitTypeTable
 from .game_data import Cost
 from .unit_command import UnitCommand
 
@@ -67,6 +73,14 @@ class BotAI(DistanceCalculation):
         # Select distance calculation method, see distances.py: _distances_override_functions function
         if not hasattr(self, "distance_calculation_method"):
             self.distance_calculation_method: int = 2
+        # Game loops between full GameInfo requests that correct the incrementally patched pathing grid, see pathing_grid.py
+        # Set to None or 0 to never request GameInfo again after game start
+        if not hasattr(self, "pathing_grid_refetch_interval"):
+            self.pathing_grid_refetch_interval: int = 448
+        # Reuses the Unit objects of persistent tags across frames, see unit_pool.py
+        self._unit_pool: UnitPool = UnitPool()
+        # Decodes visibility and creep of each step into reused buffers, see map_state.py
+        self._map_state_decoder: MapStateDecoder = MapStateDecoder()
         # This value will be set to True by main.py in self._prepare_start if game is played in realtime (if true, the bot will have limited time per step)
         self.realtime: bool = False
         self.all_units: Units = Units([], self)
@@ -83,6 +97,8 @@ class BotAI(DistanceCalculation):
         self.mineral_field: Units = Units([], self)
         self.vespene_geyser: Units = Units([], self)
         self.larva: Units = Units([], self)
+        # Struct-of-arrays copy of self.all_units, rebuilt every frame, see unit_store.py
+        self._unit_store: UnitStore = UnitStore([], -1)
         self.techlab_tags: Set[int] = set()
         self.reactor_tags: Set[int] = set()
         self.minerals: int = None
@@ -111,6 +127,7 @@ class BotAI(DistanceCalculation):
         self._last_step_step_time: float = 0
         self._total_time_in_on_step: float = 0
         self._total_steps_iterations: int = 0
+        self._pathing_grid_tracker: PathingGridTracker = None
         # Internally used to keep track which units received an action in this frame, so that self.train() function does not give the same larva two orders - cleared every frame
         self.unit_tags_received_action: Set[int] = set()
 
@@ -143,6 +160,28 @@ class BotAI(DistanceCalculation):
             self._last_step_step_time * 1000,
         )
 
+    @property
+    def pathing_grid_stats(self) -> Tuple[int, int, int, float, float]:
+        """ Returns a tuple of pathing grid maintenance statistics, complementing self.step_time.
+        First value is the amount of steps that did not request GameInfo from the server
+        Second value is the amount of full GameInfo requests after game start
+        Third value is the amount of structure footprints that were patched in place
+        Fourth value is the average duration of a full GameInfo request and decode in milliseconds
+        Fifth value is the average duration of an in place pathing grid update in milliseconds
+        The estimated time saved is roughly the first value multiplied by the difference of the fourth and fifth value. """
+        tracker = self._pathing_grid_tracker
+        if tracker is None:
+            return 0, 0, 0, 0, 0
+        avg_refetch_duration = tracker.time_in_refetch / tracker.refetch_count if tracker.refetch_count else 0
+        avg_update_duration = tracker.time_in_update / tracker.updates if tracker.updates else 0
+        return (
+            tracker.refetches_skipped,
+            tracker.refetch_count,
+            tracker.footprints_patched,
+            avg_refetch_duration * 1000,
+            avg_update_duration * 1000,
+        )
+
     @property
     def game_info(self) -> GameInfo:
         """ See game_info.py """
@@ -1520,6 +1559,10 @@ class BotAI(DistanceCalculation):
         self._game_info: GameInfo = game_info
         self._game_data: GameData = game_data
         self.realtime: bool = realtime
+        # Static per-type attributes as arrays, see unit_type_table.py
+        self.unit_type_table: UnitTypeTable = UnitTypeTable(game_data)
+        # Damage of every unit type against every other, rebuilt when an upgrade completes, see damage_matrix.py
+        self.damage_engine: DamageEngine = DamageEngine(game_data, self.unit_type_table)
 
         self.race: Race = Race(self._game_info.player_races[self.player_id])
 
@@ -1527,6 +1570,9 @@ class BotAI(DistanceCalculation):
             self.enemy_race: Race = Race(self._game_info.player_races[3 - self.player_id])
 
         self._distances_override_functions(self.distance_calculation_method)
+        self._pathing_grid_tracker = PathingGridTracker(
+            self._game_info.pathing_grid, refetch_interval=self.pathing_grid_refetch_interval
+        )
 
     def _prepare_first_step(self):
         """First step extra preparations. Must not be called before _prepare_step."""
@@ -1537,17 +1583,26 @@ class BotAI(DistanceCalculation):
         self._game_info.map_ramps, self._game_info.vision_blockers = self._game_info._find_ramps_and_vision_blockers()
         self._time_before_step: float = time.perf_counter()
 
-    def _prepare_step(self, state, proto_game_info):
+    async def _request_game_info_if_due(self, state: GameState):
+        """ Requests GameInfo from the server only if the pathing grid refetch is due, otherwise returns None.
+        Called from main.py before self._prepare_step
+
+        :param state: """
+        if not self._pathing_grid_tracker.refetch_due(state.game_loop):
+            self._pathing_grid_tracker.refetches_skipped += 1
+            return None
+        time_before_request = time.perf_counter()
+        proto_game_info = await self._client._execute(game_info=sc_pb.RequestGameInfo())
+        self._pathing_grid_tracker.time_in_refetch += time.perf_counter() - time_before_request
+        return proto_game_info
+
+    def _prepare_step(self, state, proto_game_info=None):
         """
         :param state:
-        :param proto_game_info:
+        :param proto_game_info: Only given if a full GameInfo request was due, see self._request_game_info_if_due
         """
         # Set attributes from new state before on_step."""
         self.state: GameState = state  # See game_state.py
-        # update pathing grid
-        self._game_info.pathing_grid: PixelMap = PixelMap(
-            proto_game_info.game_info.start_raw.pathing_grid, in_bits=True, mirrored=False
-        )
         # Required for events, needs to be before self.units are initialized so the old units are stored
         self._units_previous_map: Dict = {unit.tag: unit for unit in self.units}
         self._structures_previous_map: Dict = {structure.tag: structure for structure in self.structures}
@@ -1555,6 +1610,7 @@ class BotAI(DistanceCalculation):
         self._enemy_structures_previous_map: Dict = {structure.tag: structure for structure in self.enemy_structures}
 
         self._prepare_units()
+        self._prepare_pathing_grid(proto_game_info)
         self.minerals: int = state.common.minerals
         self.vespene: int = state.common.vespene
         self.supply_army: int = state.common.food_army
@@ -1592,6 +1648,7 @@ class BotAI(DistanceCalculation):
         self.larva: Units = Units([], self)
         self.techlab_tags: Set[int] = set()
         self.reactor_tags: Set[int] = set()
+        self._unit_pool.start_frame()
 
         for unit in self.state.observation_raw.units:
             if unit.is_blip:
@@ -1602,7 +1659,8 @@ class BotAI(DistanceCalculation):
                 if unit_type in FakeEffectID:
                     self.state.effects.add(EffectData(unit, fake=True))
                     continue
-                unit_obj = Unit(unit, self)
+                unit_obj = self._unit_pool.get(unit, self)
+                unit_obj._store_index = len(self.all_units)
                 self.all_units.append(unit_obj)
                 alliance = unit.alliance
                 # Alliance.Neutral.value = 3
@@ -1659,6 +1717,33 @@ class BotAI(DistanceCalculation):
                     else:
                         self.enemy_units.append(unit_obj)
 
+        # Columnar copy of all units for vectorized Units queries, row i belongs to self.all_units[i]
+        self._unit_store = UnitStore(self.all_units, self.state.game_loop)
+
+        # Root collections group their units by type on the first type selection of this frame, see Units._type_index
+        for units in (
+            self.all_units,
+            self.units,
+            self.structures,
+            self.enemy_units,
+            self.enemy_structures,
+            self.mineral_field,
+            self.vespene_geyser,
+            self.resources,
+            self.destructables,
+            self.watchtowers,
+            self.workers,
+            self.townhalls,
+            self.gas_buildings,
+            self.larva,
+        ):
+            units._type_index_enabled = True
+
+        if self.distance_calculation_method == 4:
+            # These collections build a KD-tree on their first distance query of this frame, see spatial_index.py
+            for units in (self.all_units, self.units, self.structures, self.enemy_units, self.enemy_structures):
+                units._spatial_index_enabled = True
+
         # Force distance calculation and caching on all units using scipy pdist or cdist
         if self.distance_calculation_method == 1:
             _ = self._unit_index_dict
@@ -1670,6 +1755,35 @@ class BotAI(DistanceCalculation):
             _ = self._unit_index_dict
             _ = self._cdist
 
+    def _prepare_pathing_grid(self, proto_game_info):
+        """ Decodes the pathing grid if GameInfo was requested this step, otherwise patches the footprints
+        of structures and rocks that appeared or died in place. Must be called after self._prepare_units. """
+        tracker = self._pathing_grid_tracker
+        blockers = itertools.chain(
+            self.structures, self.enemy_structures, self.destructables, self.mineral_field, self.vespene_geyser
+        )
+        time_before_update = time.perf_counter()
+        if proto_game_info is not None:
+            proto_pathing_grid = proto_game_info.game_info.start_raw.pathing_grid
+            pathing_grid = self._game_info.pathing_grid
+            if (
+                pathing_grid.data_numpy.shape == (proto_pathing_grid.size.y, proto_pathing_grid.size.x)
+                and pathing_grid.data_numpy.flags.writeable
+            ):
+                # Refill the current grid in place, so everything referencing it sees the fresh grid
+                decode_into(pathing_grid.data_numpy, proto_pathing_grid, in_bits=True)
+                pathing_grid.mark_changed()
+            else:
+                self._game_info.pathing_grid: PixelMap = PixelMap(proto_pathing_grid, in_bits=True, mirrored=False)
+            tracker.reset(self._game_info.pathing_grid, blockers, self.state.game_loop)
+            tracker.time_in_refetch += time.perf_counter() - time_before_update
+        elif not tracker.initialized:
+            tracker.reset(self._game_info.pathing_grid, blockers, self.state.game_loop)
+        else:
+            dead_unit_tags = self.state.dead_units if self.state.observation_raw.event.dead_units else set()
+            tracker.update(blockers, dead_unit_tags)
+            tracker.time_in_update += time.perf_counter() - time_before_update
+
     async def _after_step(self) -> int:
         """ Executed by main.py after each on_step function. """
         # Keep track of the bot on_step duration
@@ -1698,8 +1812,8 @@ class BotAI(DistanceCalculation):
         # Advance simulation by exactly "steps" frames
         await self.client.step(steps)
         state = await self.client.observation()
-        gs = GameState(state.observation)
-        proto_game_info = await self.client._execute(game_info=sc_pb.RequestGameInfo())
+        gs = GameState(state.observation, self._map_state_decoder)
+        proto_game_info = await self._request_game_info_if_due(gs)
         self._prepare_step(gs, proto_game_info)
         await self.issue_events()
         # await self.on_step(-1)
@@ -1735,7 +1849,12 @@ class BotAI(DistanceCalculation):
                     await self.on_unit_type_changed(unit, previous_frame_unit.type_id)
 
     async def _issue_upgrade_events(self):
+        # Upgrades are never lost, so the set of upgrades only has to be built when their amount changed
+        if len(self.state.observation_raw.player.upgrade_ids) == len(self._previous_upgrades):
+            return
         difference = self.state.upgrades - self._previous_upgrades
+        if difference:
+            self.damage_engine.refresh(self.state.upgrades)
         for upgrade_completed in difference:
             await self.on_upgrade_complete(upgrade_completed)
         self._previous_upgrades = self.state.upgrades
@@ -1793,6 +1912,9 @@ class BotAI(DistanceCalculation):
                     await self.on_enemy_unit_left_vision(enemy_structure_tag)
 
     async def _issue_unit_dead_events(self):
+        # Most steps have no dead units, don't build the set for them
+        if not self.state.observation_raw.event.dead_units:
+            return
         for unit_tag in self.state.dead_units:
             await self.on_unit_destroyed(unit_tag)
 
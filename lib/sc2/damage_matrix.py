@@ -0,0 +1,312 @@
+from __future__ import annotations
+from typing import Iterable, Set, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from .constants import DAMAGE_BONUS_PER_UPGRADE, IS_LIGHT, TARGET_AIR, TARGET_GROUND
+from .ids.unit_typeid import UnitTypeId
+from .ids.upgrade_id import UpgradeId
+
+if TYPE_CHECKING:
+    from .game_data import GameData
+    from .unit import Unit
+    from .unit_type_table import UnitTypeTable
+
+# Attack and armor upgrade levels covered by the matrices, higher levels are clipped
+UPGRADE_LEVELS = 4
+
+# Layer axis of the matrices: the target is on the ground or in the air
+LAYER_GROUND = 0
+LAYER_AIR = 1
+
+# Own attacker type: (upgrade, factor its weapon cooldown is divided by)
+ATTACK_SPEED_UPGRADES = {
+    UnitTypeId.ZERGLING: (UpgradeId.ZERGLINGATTACKSPEED, 1.4),
+    UnitTypeId.ADEPT: (UpgradeId.ADEPTPIERCINGATTACK, 1.45),
+}
+
+# Own attacker type: (upgrade, range it adds)
+RANGE_UPGRADES = {
+    UnitTypeId.HYDRALISK: (UpgradeId.EVOLVEGROOVEDSPINES, 1),
+    UnitTypeId.PHOENIX: (UpgradeId.PHOENIXRANGEUPGRADE, 2),
+    UnitTypeId.PLANETARYFORTRESS: (UpgradeId.HISECAUTOTRACKING, 1),
+    UnitTypeId.MISSILETURRET: (UpgradeId.HISECAUTOTRACKING, 1),
+    UnitTypeId.AUTOTURRET: (UpgradeId.HISECAUTOTRACKING, 1),
+}
+
+# Own target type: (upgrade, armor it adds)
+ARMOR_UPGRADES = {
+    UnitTypeId.ULTRALISK: (UpgradeId.CHITINOUSPLATING, 2),
+    UnitTypeId.ULTRALISKBURROWED: (UpgradeId.CHITINOUSPLATING, 2),
+}
+
+# Damage against light units the hellion's blue flame upgrade adds
+BLUE_FLAME_BONUS = 5
+
+
+class DamageMatrix:
+    """
+    Damage of every unit type that can attack against every unit type, for attackers of one side.
+    Built with the same rules as Unit.calculate_damage_vs_target, minus the effects of buffs (stim, guardian shield,
+    shredder missile), which can be applied afterwards with the per-hit damage.
+
+    Attackers are indexed by attacker_index (the last row is all zeros for units that can't attack),
+    targets by the dense index of UnitTypeTable. The arrays are:
+
+    - hit[attacker, target, layer, attack level]: damage of a single hit before armor, bonuses against the target's
+      attributes included
+    - attacks[attacker, target, layer], cooldown[attacker, target, layer] and range[attacker, target, layer]
+      of the weapon used against the target. Attacks is 0 if the attacker can't hit the layer.
+    - damage[attacker, target, layer, attack level, armor level]: damage of a full attack to health after armor
+    - dps: damage divided by cooldown
+    """
+
+    def __init__(
+        self,
+        game_data: GameData,
+        table: UnitTypeTable,
+        own_attackers: bool,
+        upgrades: Set[UpgradeId] = frozenset(),
+    ):
+        """
+        :param game_data:
+        :param table:
+        :param own_attackers: Whether the attackers are the bot's units and the targets are enemies, or the other way round
+        :param upgrades: The bot's upgrades. They are applied to the attackers if own_attackers, otherwise to the targets.
+        """
+        self.table: UnitTypeTable = table
+        self.own_attackers: bool = own_attackers
+        self.upgrades: Set[UpgradeId] = set(upgrades)
+
+        attacker_types = [
+            type_id
+            for type_id in table.type_ids.tolist()
+            if table.get("can_attack_ground", type_id)
+            or table.get("can_attack_air", type_id)
+            or (not own_attackers and type_id == UnitTypeId.BUNKER.value)
+        ]
+        amount_attackers = len(attacker_types)
+        amount_targets = len(table.type_ids) + 1
+
+        # Raw type id: attacker row, the zero row for types that can't attack
+        self.unknown_attacker: int = amount_attackers
+        self._attacker_index_of_type: np.ndarray = np.full(
+            len(table._index_of_type), self.unknown_attacker, dtype=np.int32
+        )
+        self._attacker_index_of_type[attacker_types] = np.arange(amount_attackers, dtype=np.int32)
+
+        shape = (amount_attackers + 1, amount_targets, 2)
+        self.hit: np.ndarray = np.zeros(shape + (UPGRADE_LEVELS,), dtype=np.float32)
+        self.attacks: np.ndarray = np.zeros(shape, dtype=np.float32)
+        self.cooldown: np.ndarray = np.ones(shape, dtype=np.float32)
+        self.range: np.ndarray = np.zeros(shape, dtype=np.float32)
+
+        target_armor = table.armor.astype(np.float32)
+        if not own_attackers:
+            for type_id, (upgrade, armor) in ARMOR_UPGRADES.items():
+                if upgrade in self.upgrades:
+                    target_armor[table.index(type_id)] += armor
+        self.target_armor: np.ndarray = target_armor
+
+        for attacker, type_id in enumerate(attacker_types):
+            self._fill_attacker(attacker, game_data.units[type_id]._proto)
+
+        levels = np.arange(UPGRADE_LEVELS, dtype=np.float32)
+        armor = target_armor[np.newaxis, :, np.newaxis, np.newaxis, np.newaxis] + levels
+        self.damage: np.ndarray = self.attacks[..., np.newaxis, np.newaxis] * np.maximum(
+            0.5, self.hit[..., np.newaxis] - armor
+        )
+        self.dps: np.ndarray = self.damage / self.cooldown[..., np.newaxis, np.newaxis]
+
+    def _fill_attacker(self, attacker: int, proto):
+        """ Fills the rows of one attacker type from its unit type data.
+
+        :param attacker:
+        :param proto: """
+        type_id = UnitTypeId(proto.unit_id)
+        levels = np.arange(UPGRADE_LEVELS, dtype=np.float32)
+        own_upgrades = self.upgrades if self.own_attackers else set()
+
+        if type_id == UnitTypeId.BATTLECRUISER:
+            # No weapon in the API: 8 damage against ground, 5 against air
+            self.hit[attacker, :, LAYER_GROUND] = 8 + levels
+            self.hit[attacker, :, LAYER_AIR] = 5 + levels
+            self.attacks[attacker] = 1
+            self.cooldown[attacker] = 0.224
+            self.range[attacker] = 6
+            return
+        if type_id == UnitTypeId.BUNKER:
+            # Expect an enemy bunker fully loaded with marines
+            self.hit[attacker] = 6
+            self.attacks[attacker] = 4
+            self.cooldown[attacker] = 0.854
+            self.range[attacker] = 6
+            return
+
+        speed_factor = 1
+        if type_id in ATTACK_SPEED_UPGRADES and ATTACK_SPEED_UPGRADES[type_id][0] in own_upgrades:
+            speed_factor = ATTACK_SPEED_UPGRADES[type_id][1]
+        bonus_range = 0
+        if type_id in RANGE_UPGRADES and RANGE_UPGRADES[type_id][0] in own_upgrades:
+            bonus_range = RANGE_UPGRADES[type_id][1]
+
+        attributes = self.table.attributes
+        upgrade_bonuses = DAMAGE_BONUS_PER_UPGRADE.get(type_id, {})
+        for layer, target_types in ((LAYER_GROUND, TARGET_GROUND), (LAYER_AIR, TARGET_AIR)):
+            best = None
+            for weapon in proto.weapons:
+                if weapon.type not in target_types:
+                    continue
+                per_upgrade = upgrade_bonuses.get(weapon.type, {})
+                # hit[target, attack level]
+                hit = np.repeat((weapon.damage + levels * per_upgrade.get(None, 1))[np.newaxis, :], len(attributes), axis=0)
+                bonus = np.zeros_like(hit)
+                has_bonus = np.zeros(len(attributes), dtype=bool)
+                for damage_bonus in weapon.damage_bonus:
+                    bonus_damage = damage_bonus.bonus + levels * per_upgrade.get(damage_bonus.attribute, 0)
+                    if (
+                        damage_bonus.attribute == IS_LIGHT
+                        and type_id == UnitTypeId.HELLION
+                        and UpgradeId.HIGHCAPACITYBARRELS in own_upgrades
+                    ):
+                        bonus_damage = bonus_damage + BLUE_FLAME_BONUS
+                    applies = (attributes & (1 << damage_bonus.attribute)) != 0
+                    # Only the biggest bonus counts
+                    bonus[applies] = np.where(has_bonus[applies, np.newaxis], np.maximum(bonus[applies], bonus_damage), bonus_damage)
+                    has_bonus |= applies
+                hit += bonus
+                # Damage of a full attack at level 0, to choose the better weapon against each target
+                damage = weapon.attacks * np.maximum(0.5, hit[:, 0] - self.target_armor)
+                if best is None:
+                    better = np.ones(len(attributes), dtype=bool)
+                    best = damage
+                else:
+                    better = damage > best
+                    best = np.maximum(best, damage)
+                self.hit[attacker, better, layer] = hit[better]
+                self.cooldown[attacker, better, layer] = weapon.speed / speed_factor
+                self.range[attacker, better, layer] = weapon.range + bonus_range
+                self.attacks[attacker, better, layer] = weapon.attacks
+
+    def attacker_index(self, type_id: int) -> int:
+        """ Returns the attacker row of a raw type id, unknown_attacker if the type can't attack.
+
+        :param type_id: """
+        if 0 <= type_id < len(self._attacker_index_of_type):
+            return int(self._attacker_index_of_type[type_id])
+        return self.unknown_attacker
+
+    def attacker_indices(self, type_ids: np.ndarray) -> np.ndarray:
+        """ Vectorized attacker_index.
+
+        :param type_ids: """
+        type_ids = np.asarray(type_ids, dtype=np.int64)
+        return self._attacker_index_of_type[np.clip(type_ids, 0, len(self._attacker_index_of_type) - 1)]
+
+    def damage_vs(self, attacker: Unit, target: Unit) -> Tuple[float, float, float]:
+        """ Returns (damage of a full attack, cooldown, range) of attacker against target, or (0, 0, 0) if it can't hit it.
+        Against shields the shield upgrade level is used as armor. Upgrade levels come from the units.
+
+        :param attacker:
+        :param target: """
+        a = self.attacker_index(attacker._proto.unit_type)
+        t = self.table.index(target._proto.unit_type)
+        attack_level = min(attacker._proto.attack_upgrade_level, UPGRADE_LEVELS - 1)
+        if target.type_id == UnitTypeId.COLOSSUS:
+            layers = (LAYER_GROUND, LAYER_AIR)
+        else:
+            layers = (LAYER_AIR,) if target.is_flying else (LAYER_GROUND,)
+
+        best = (0, 0, 0)
+        for layer in layers:
+            attacks = float(self.attacks[a, t, layer])
+            if not attacks:
+                continue
+            if target.shield > 0:
+                armor = target._proto.shield_upgrade_level
+            else:
+                armor = float(self.target_armor[t]) + target._proto.armor_upgrade_level
+            damage = attacks * max(0.5, float(self.hit[a, t, layer, attack_level]) - armor)
+            if damage > best[0]:
+                best = (damage, float(self.cooldown[a, t, layer]), float(self.range[a, t, layer]))
+        return best
+
+    def dps_vs(self, attacker: Unit, target: Unit) -> float:
+        """ Returns the dps of attacker against target, see damage_vs.
+
+        :param attacker:
+        :param target: """
+        damage, cooldown, _ = self.damage_vs(attacker, target)
+        return damage / cooldown if damage else 0
+
+    def dps_matrix(self, attackers: Iterable[Unit], targets: Iterable[Unit]) -> np.ndarray:
+        """ Returns the (len(attackers), len(targets)) array of the dps of each attacker against each target's health,
+        with the upgrade levels of the units.
+
+        :param attackers:
+        :param targets: """
+        attackers = list(attackers)
+        targets = list(targets)
+        a = self.attacker_indices([unit._proto.unit_type for unit in attackers])
+        attack_levels = np.minimum([unit._proto.attack_upgrade_level for unit in attackers], UPGRADE_LEVELS - 1)
+        t = self.table.indices([unit._proto.unit_type for unit in targets])
+        armor_levels = np.minimum([unit._proto.armor_upgrade_level for unit in targets], UPGRADE_LEVELS - 1)
+        flying = np.array([unit.is_flying for unit in targets], dtype=bool)
+        colossus = np.array([unit.type_id == UnitTypeId.COLOSSUS for unit in targets], dtype=bool)
+
+        a = a.astype(np.intp).reshape((-1, 1))
+        attack_levels = attack_levels.astype(np.intp).reshape((-1, 1))
+        t = t.astype(np.intp).reshape((1, -1))
+        armor_levels = armor_levels.astype(np.intp).reshape((1, -1))
+        layers = np.where(flying, LAYER_AIR, LAYER_GROUND).reshape((1, -1))
+
+        dps = self.dps[a, t, layers, attack_levels, armor_levels]
+        if colossus.any():
+            dps = np.where(colossus, np.maximum(dps, self.dps[a, t, LAYER_AIR, attack_levels, armor_levels]), dps)
+        return dps
+
+
+class DamageEngine:
+    """
+    Damage matrices of both sides of a fight, built once per game in BotAI._prepare_start and rebuilt by
+    BotAI when an upgrade of the bot completes. 'own' holds the bot's units attacking enemies,
+    'enemy' the enemy units attacking the bot's units.
+
+    Example::
+
+        damage, cooldown, attack_range = self.damage_engine.damage_vs(marine, zergling)
+        dps = self.damage_engine.own.dps_matrix(self.units, self.enemy_units)
+    """
+
+    def __init__(self, game_data: GameData, table: UnitTypeTable):
+        """
+        :param game_data:
+        :param table:
+        """
+        self._game_data = game_data
+        self._table = table
+        self.refresh(set())
+
+    def refresh(self, upgrades: Set[UpgradeId]):
+        """ Rebuilds the matrices for the bot's upgrades.
+
+        :param upgrades: """
+        self.own: DamageMatrix = DamageMatrix(self._game_data, self._table, own_attackers=True, upgrades=upgrades)
+        self.enemy: DamageMatrix = DamageMatrix(self._game_data, self._table, own_attackers=False, upgrades=upgrades)
+
+    def matrix_of(self, attacker: Unit) -> DamageMatrix:
+        return self.own if attacker.is_mine else self.enemy
+
+    def damage_vs(self, attacker: Unit, target: Unit) -> Tuple[float, float, float]:
+        """ See DamageMatrix.damage_vs
+
+        :param attacker:
+        :param target: """
+        return self.matrix_of(attacker).damage_vs(attacker, target)
+
+    def dps_vs(self, attacker: Unit, target: Unit) -> float:
+        """ See DamageMatrix.dps_vs
+
+        :param attacker:
+        :param target: """
+        return self.matrix_of(attacker).dps_vs(attacker, target)
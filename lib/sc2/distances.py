@@ -213,9 +213,11 @@ class DistanceCalculation:
         The following methods calculate the distances between all units once:
         method 1: Use scipy's pdist condensed matrix (1d array)
         method 2: Use scipy's cidst square matrix (2d array)
-        method 3: Use scipy's cidst square matrix (2d array) without asserts (careful: very weird error messages, but maybe slightly faster) """
-        assert 0 <= method <= 3, f"Selected method was: {method}"
-        if method == 0:
+        method 3: Use scipy's cidst square matrix (2d array) without asserts (careful: very weird error messages, but maybe slightly faster)
+        method 4: Use python's math.hypot for single distances, the Units queries of the root collections use a
+            per frame scipy cKDTree instead of a distance matrix, see spatial_index.py """
+        assert 0 <= method <= 4, f"Selected method was: {method}"
+        if method in {0, 4}:
             self._distance_squared_unit_to_unit = self._distance_squared_unit_to_unit_method0
         elif method == 1:
             self._distance_squared_unit_to_unit = self._distance_squared_unit_to_unit_method1
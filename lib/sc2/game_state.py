@@ -1,4 +1,5 @@
 from __future__ import annotations
+from collections import Counter
 from typing import Any, Dict, List, Optional, Set, Tuple, Union, TYPE_CHECKING
 
 from .constants import FakeEffectID, FakeEffectRadii
@@ -6,6 +7,7 @@ from .data import Alliance, DisplayType
 from .ids.effect_id import EffectId
 from .ids.unit_typeid import UnitTypeId
 from .ids.upgrade_id import UpgradeId
+from .map_state import MapStateDecoder, MapStateDiff
 from .pixel_map import PixelMap
 from .position import Point2, Point3
 from .power_source import PsionicMatrix
@@ -121,11 +123,43 @@ class EffectData:
         return f"{self.id} with radius {self.radius} at {self.positions}"
 
 
+class _LazyField:
+    """ Property of GameState that is built from the proto on first access and then stored on the instance,
+    so later reads in the same frame are plain attribute lookups. Counts in GameState.fields_materialized
+    how often each field was built. """
+
+    def __init__(self, f):
+        self.f = f
+        self.name = f.__name__
+        self.__doc__ = f.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.name] = self.f(instance)
+        GameState.fields_materialized[self.name] += 1
+        return value
+
+
 class GameState:
-    def __init__(self, response_observation):
+    # Field name: amount of game states that built the field, see _LazyField
+    fields_materialized: Counter = Counter()
+    # Amount of game states created, to compare fields_materialized against
+    states_created: int = 0
+
+    def __init__(self, response_observation, map_state_decoder: Optional[MapStateDecoder] = None):
         """
+        Fields that need decoding (score, psionic_matrix, upgrades, dead_units, visibility, creep, map_state_diff
+        and effects) are only built when they are first read.
+
+        With a map state decoder, visibility, creep and map_state_diff are built right away instead. The decoder
+        reuses its buffers every other step, so decoding an older state later would overwrite the maps of a newer
+        one. Their arrays stay valid until the next state with the same decoder is created.
+
         :param response_observation:
+        :param map_state_decoder: Decodes visibility and creep into reused buffers if given, see map_state.py
         """
+        GameState.states_created += 1
         self.response_observation = response_observation
         self.actions = response_observation.actions  # successful actions since last loop
         self.action_errors = response_observation.action_errors  # error actions since last loop
@@ -137,28 +171,59 @@ class GameState:
         self.player_result = response_observation.player_result
         self.chat = response_observation.chat
         self.common: Common = Common(self.observation.player_common)
-
-        # Area covered by Pylons and Warpprisms
-        self.psionic_matrix: PsionicMatrix = PsionicMatrix.from_proto(self.observation_raw.player.power_sources)
         self.game_loop: int = self.observation.game_loop  # 22.4 per second on faster game speed
-
-        # https://github.com/Blizzard/s2client-proto/blob/33f0ecf615aa06ca845ffe4739ef3133f37265a9/s2clientprotocol/score.proto#L31
-        self.score: ScoreDetails = ScoreDetails(self.observation.score)
         self.abilities = self.observation.abilities  # abilities of selected units
-        self.upgrades: Set[UpgradeId] = {UpgradeId(upgrade) for upgrade in self.observation_raw.player.upgrade_ids}
-
-        # Set of unit tags that died this step
-        self.dead_units: Set[int] = {dead_unit_tag for dead_unit_tag in self.observation_raw.event.dead_units}
-        # self.visibility[point]: 0=Hidden, 1=Fogged, 2=Visible
-        self.visibility: PixelMap = PixelMap(self.observation_raw.map_state.visibility, mirrored=False)
-        # self.creep[point]: 0=No creep, 1=creep
-        self.creep: PixelMap = PixelMap(self.observation_raw.map_state.creep, in_bits=True, mirrored=False)
-
-        # Effects like ravager bile shot, lurker attack, everything in effect_id.py
-        self.effects: Set[EffectData] = {EffectData(effect) for effect in self.observation_raw.effects}
-        """ Usage:
+
+        if map_state_decoder is not None:
+            # Decode in step order, see above. Stored like built lazy fields, which they replace.
+            map_state = self.observation_raw.map_state
+            self.visibility = map_state_decoder.decode("visibility", map_state.visibility, in_bits=False)
+            self.creep = map_state_decoder.decode("creep", map_state.creep, in_bits=True)
+            self.map_state_diff = map_state_decoder.diff()
+            GameState.fields_materialized.update(("visibility", "creep", "map_state_diff"))
+
+    @_LazyField
+    def psionic_matrix(self) -> PsionicMatrix:
+        """ Area covered by Pylons and Warpprisms """
+        return PsionicMatrix.from_proto(self.observation_raw.player.power_sources)
+
+    @_LazyField
+    def score(self) -> ScoreDetails:
+        """ https://github.com/Blizzard/s2client-proto/blob/33f0ecf615aa06ca845ffe4739ef3133f37265a9/s2clientprotocol/score.proto#L31 """
+        return ScoreDetails(self.observation.score)
+
+    @_LazyField
+    def upgrades(self) -> Set[UpgradeId]:
+        return {UpgradeId(upgrade) for upgrade in self.observation_raw.player.upgrade_ids}
+
+    @_LazyField
+    def dead_units(self) -> Set[int]:
+        """ Set of unit tags that died this step """
+        return {dead_unit_tag for dead_unit_tag in self.observation_raw.event.dead_units}
+
+    @_LazyField
+    def visibility(self) -> PixelMap:
+        """ self.visibility[point]: 0=Hidden, 1=Fogged, 2=Visible """
+        return PixelMap(self.observation_raw.map_state.visibility, mirrored=False)
+
+    @_LazyField
+    def creep(self) -> PixelMap:
+        """ self.creep[point]: 0=No creep, 1=creep """
+        return PixelMap(self.observation_raw.map_state.creep, in_bits=True, mirrored=False)
+
+    @_LazyField
+    def map_state_diff(self) -> Optional[MapStateDiff]:
+        """ Changes of visibility and creep since the previous step. None on the first step or without a map state
+        decoder. """
+        return None
+
+    @_LazyField
+    def effects(self) -> Set[EffectData]:
+        """ Effects like ravager bile shot, lurker attack, everything in effect_id.py
+        Usage:
         for effect in self.state.effects:
             if effect.id == EffectId.RAVAGERCORROSIVEBILECP:
                 positions = effect.positions
                 # dodge the ravager biles
         """
+        return {EffectData(effect) for effect in self.observation_raw.effects}
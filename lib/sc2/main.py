@@ -6,7 +6,6 @@ import json
 import os
 import mpyq
 import async_timeout
-from s2clientprotocol import sc2api_pb2 as sc_pb
 
 from .client import Client
 from .data import CreateGameError, Result
@@ -106,9 +105,8 @@ async def _play_game_ai(client, player_id, ai, realtime, step_time_limit, game_t
     if client._game_result:
         await ai.on_end(client._game_result[player_id])
         return client._game_result[player_id]
-    gs = GameState(state.observation)
-    proto_game_info = await client._execute(game_info=sc_pb.RequestGameInfo())
-    ai._prepare_step(gs, proto_game_info)
+    gs = GameState(state.observation, ai._map_state_decoder)
+    ai._prepare_step(gs)
     await ai.on_before_start()
     ai._prepare_first_step()
     try:
@@ -136,13 +134,16 @@ async def _play_game_ai(client, player_id, ai, realtime, step_time_limit, game_t
                     # print(f"return {client._game_result[player_id]}")
                     return client._game_result[player_id]
                 return client._game_result[player_id]
-            gs = GameState(state.observation)
-            logger.debug(f"Score: {gs.score.score}")
+            gs = GameState(state.observation, ai._map_state_decoder)
+            # Reading the score builds it, so only do so if it's logged
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Score: %s", gs.score.score)
 
             if game_time_limit and (gs.game_loop * 0.725 * (1 / 16)) > game_time_limit:
                 await ai.on_end(Result.Tie)
                 return Result.Tie
-            proto_game_info = await client._execute(game_info=sc_pb.RequestGameInfo())
+            # GameInfo is only requested when the pathing grid is due for a full refresh, see pathing_grid.py
+            proto_game_info = await ai._request_game_info_if_due(gs)
             ai._prepare_step(gs, proto_game_info)
 
         logger.debug(f"Running AI step, it={iteration} {gs.game_loop * 0.725 * (1 / 16):.2f}s")
@@ -267,9 +268,8 @@ async def _play_replay(client, ai, realtime=False, player_id=0):
     if client._game_result:
         await ai.on_end(client._game_result[player_id])
         return client._game_result[player_id]
-    gs = GameState(state.observation)
-    proto_game_info = await client._execute(game_info=sc_pb.RequestGameInfo())
-    ai._prepare_step(gs, proto_game_info)
+    gs = GameState(state.observation, ai._map_state_decoder)
+    ai._prepare_step(gs)
     ai._prepare_first_step()
     try:
         await ai.on_start()
@@ -297,10 +297,13 @@ async def _play_replay(client, ai, realtime=False, player_id=0):
                     # print(f"return {client._game_result[player_id]}")
                     return client._game_result[player_id]
                 return client._game_result[player_id]
-            gs = GameState(state.observation)
-            logger.debug(f"Score: {gs.score.score}")
+            gs = GameState(state.observation, ai._map_state_decoder)
+            # Reading the score builds it, so only do so if it's logged
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Score: %s", gs.score.score)
 
-            proto_game_info = await client._execute(game_info=sc_pb.RequestGameInfo())
+            # GameInfo is only requested when the pathing grid is due for a full refresh, see pathing_grid.py
+            proto_game_info = await ai._request_game_info_if_due(gs)
             ai._prepare_step(gs, proto_game_info)
 
         logger.debug(f"Running AI step, it={iteration} {gs.game_loop * 0.725 * (1 / 16):.2f}s")
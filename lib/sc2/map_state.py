@@ -0,0 +1,128 @@
+from __future__ import annotations
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .pixel_map import PixelMap
+
+# Row i holds the 8 bits of byte i, most significant first, like np.unpackbits
+_BITS_OF_BYTE: np.ndarray = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1)
+
+
+def decode_into(out: np.ndarray, proto, in_bits: bool):
+    """ Decodes the pixels of an ImageData proto into the (height, width) uint8 array 'out' without allocating.
+
+    :param out:
+    :param proto:
+    :param in_bits: """
+    raw = np.frombuffer(proto.data, dtype=np.uint8)
+    if in_bits:
+        np.take(_BITS_OF_BYTE, raw, axis=0, out=out.reshape((-1, 8)))
+    else:
+        np.copyto(out.reshape(-1), raw)
+
+
+class MapStateDiff:
+    """
+    Changes of visibility and creep between the previous step and the current one.
+    Each property is a (height, width) boolean array, computed on first access.
+    """
+
+    def __init__(self, previous_visibility: np.ndarray, visibility: np.ndarray,
+                 previous_creep: np.ndarray, creep: np.ndarray):
+        self._previous_visibility = previous_visibility
+        self._visibility = visibility
+        self._previous_creep = previous_creep
+        self._creep = creep
+        self._cache: Dict[str, np.ndarray] = {}
+
+    def _cached(self, name: str, compute) -> np.ndarray:
+        value = self._cache.get(name)
+        if value is None:
+            value = self._cache[name] = compute()
+        return value
+
+    @property
+    def newly_visible(self) -> np.ndarray:
+        """ Cells that are visible now but weren't on the previous step. """
+        return self._cached("newly_visible", lambda: (self._visibility == 2) & (self._previous_visibility != 2))
+
+    @property
+    def no_longer_visible(self) -> np.ndarray:
+        """ Cells that were visible on the previous step but aren't now. """
+        return self._cached("no_longer_visible", lambda: (self._visibility != 2) & (self._previous_visibility == 2))
+
+    @property
+    def creep_spread(self) -> np.ndarray:
+        """ Cells that got creep since the previous step. """
+        return self._cached("creep_spread", lambda: (self._creep != 0) & (self._previous_creep == 0))
+
+    @property
+    def creep_receded(self) -> np.ndarray:
+        """ Cells that lost their creep since the previous step. """
+        return self._cached("creep_receded", lambda: (self._creep == 0) & (self._previous_creep != 0))
+
+
+class MapStateDecoder:
+    """
+    Decodes the per step map state (visibility and creep) into preallocated buffers instead of allocating new arrays
+    and PixelMaps every step.
+
+    Each map has two buffers that are used alternately, so the pixel maps of the previous step stay valid for one more
+    step, which makes the diff between the two steps available. The PixelMap objects are reused too: their grid_id
+    stays the same and their version increases whenever they are refilled.
+    """
+
+    def __init__(self):
+        # Map name: the two pixel maps that are filled alternately
+        self._pixel_maps: Dict[str, List[PixelMap]] = {}
+        # Map name: index of the pixel map filled last
+        self._current: Dict[str, int] = {}
+        # Statistics
+        self.decodes: int = 0
+        self.allocations: int = 0
+
+    def decode(self, name: str, proto, in_bits: bool) -> PixelMap:
+        """ Decodes proto into the next buffer of the map called 'name' and returns its pixel map.
+
+        :param name:
+        :param proto:
+        :param in_bits: """
+        shape = (proto.size.y, proto.size.x)
+        pixel_maps = self._pixel_maps.get(name)
+        if pixel_maps is None or pixel_maps[0].data_numpy.shape != shape:
+            pixel_maps = self._pixel_maps[name] = [
+                PixelMap.from_array(np.zeros(shape, dtype=np.uint8), in_bits, proto.bits_per_pixel) for _ in range(2)
+            ]
+            self._current[name] = 1
+            self.allocations += 1
+
+        index = 1 - self._current[name]
+        pixel_map = pixel_maps[index]
+        decode_into(pixel_map.data_numpy, proto, in_bits)
+        pixel_map.mark_changed()
+        self._current[name] = index
+        self.decodes += 1
+        return pixel_map
+
+    def previous(self, name: str) -> Optional[PixelMap]:
+        """ Returns the pixel map of the map called 'name' of the step before the last decode, if there was one.
+
+        :param name: """
+        pixel_maps = self._pixel_maps.get(name)
+        if pixel_maps is None or pixel_maps[1 - self._current[name]].version == 0:
+            return None
+        return pixel_maps[1 - self._current[name]]
+
+    def diff(self) -> Optional[MapStateDiff]:
+        """ Returns the changes of visibility and creep since the previous step, or None on the first step. """
+        previous_visibility = self.previous("visibility")
+        previous_creep = self.previous("creep")
+        if previous_visibility is None or previous_creep is None:
+            return None
+        return MapStateDiff(
+            previous_visibility.data_numpy,
+            self._pixel_maps["visibility"][self._current["visibility"]].data_numpy,
+            previous_creep.data_numpy,
+            self._pixel_maps["creep"][self._current["creep"]].data_numpy,
+        )
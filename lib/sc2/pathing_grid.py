@@ -0,0 +1,176 @@
+from __future__ import annotations
+import math
+from typing import Dict, Iterable, Optional, Set, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from .ids.unit_typeid import UnitTypeId
+from .pixel_map import PixelMap
+
+if TYPE_CHECKING:
+    from .unit import Unit
+
+# Structures that do not block ground pathing
+NON_BLOCKING_STRUCTURES: Set[UnitTypeId] = {
+    UnitTypeId.CREEPTUMOR,
+    UnitTypeId.CREEPTUMORBURROWED,
+    UnitTypeId.CREEPTUMORQUEEN,
+    UnitTypeId.SUPPLYDEPOTLOWERED,
+}
+
+
+def has_exact_footprint(unit: Unit) -> bool:
+    """ Returns True if footprint_box is the exact footprint of the unit, not the radius fallback. """
+    if unit.is_mineral_field:
+        return True
+    creation_ability = unit._creation_ability
+    return creation_ability is not None and bool(creation_ability._proto.footprint_radius)
+
+
+def footprint_box(unit: Unit) -> Tuple[int, int, int, int]:
+    """ Returns the grid cells covered by a pathing blocker as (x0, y0, x1, y1), end exclusive.
+    Structures use the footprint of their creation ability, mineral fields are 2x1 and everything
+    else (rocks, geysers, morphed structures without a footprint) falls back to the unit radius. """
+    if unit.is_mineral_field:
+        half_x, half_y = 1, 0.5
+    else:
+        creation_ability = unit._creation_ability
+        half_size = creation_ability._proto.footprint_radius if creation_ability is not None else 0
+        if not half_size:
+            half_size = math.floor(unit.radius * 2) / 2
+        half_x = half_y = half_size
+    x, y = unit.position_tuple
+    return (
+        max(0, math.floor(x - half_x + 0.5)),
+        max(0, math.floor(y - half_y + 0.5)),
+        math.floor(x + half_x + 0.5),
+        math.floor(y + half_y + 0.5),
+    )
+
+
+class PathingGridTracker:
+    """
+    Keeps GameInfo.pathing_grid up to date without requesting GameInfo from the server every step.
+
+    After a full fetch, the tracker remembers the footprint of every pathing blocker (structures, rocks,
+    mineral fields and geysers). On the following steps, footprints of new blockers are cleared in place and
+    footprints of dead blockers get their cells back from the terrain layer: the grid without the tracked blockers.
+    Cells under new blockers keep the value they had before the blocker was stamped. Cells under the exact
+    footprints of blockers of the fetched grid were pathable, structures can only be placed there. Cells under
+    the approximated footprints of blockers of the fetched grid (rocks, geysers) are unknown, so their removal
+    requests a refetch on the next step instead of guessing.
+    The footprints are approximations, so the grid is also refetched from the server every 'refetch_interval'
+    game loops to correct any drift. Set 'refetch_interval' to None or 0 to never refetch on a timer.
+    """
+
+    def __init__(self, pathing_grid: PixelMap, refetch_interval: Optional[int] = None):
+        """
+        :param pathing_grid:
+        :param refetch_interval:
+        """
+        self.pathing_grid: PixelMap = pathing_grid
+        self.refetch_interval: Optional[int] = refetch_interval
+        self.initialized: bool = False
+        self.last_refetch_loop: int = 0
+        # Unit tag: footprint box of all blockers that are currently stamped into the grid
+        self._blockers: Dict[int, Tuple[int, int, int, int]] = {}
+        # Pathing grid values without the blockers above, 0 where unknown
+        self._terrain: Optional[np.ndarray] = None
+        # Tags of blockers of the fetched grid whose terrain is unknown, see above
+        self._unknown_terrain: Set[int] = set()
+        # Set when a blocker of unknown terrain was removed, see refetch_due
+        self._refetch_requested: bool = False
+        # Statistics, see BotAI.pathing_grid_stats
+        self.refetch_count: int = 0
+        self.refetches_skipped: int = 0
+        self.footprints_patched: int = 0
+        self.time_in_refetch: float = 0
+        self.time_in_update: float = 0
+        self.updates: int = 0
+
+    def refetch_due(self, game_loop: int) -> bool:
+        """ Returns True if a full GameInfo request should be sent this step. """
+        if not self.initialized:
+            return False
+        if self._refetch_requested:
+            return True
+        if not self.refetch_interval:
+            return False
+        return game_loop - self.last_refetch_loop >= self.refetch_interval
+
+    def reset(self, pathing_grid: PixelMap, blockers: Iterable[Unit], game_loop: int):
+        """ Takes a freshly fetched pathing grid as the new baseline.
+        The grid already contains the footprints of all current blockers, so they are only remembered.
+
+        :param pathing_grid:
+        :param blockers:
+        :param game_loop: """
+        self.pathing_grid = pathing_grid
+        self._terrain = pathing_grid.data_numpy.copy()
+        self._blockers = {}
+        self._unknown_terrain = set()
+        self._refetch_requested = False
+        for unit in blockers:
+            if not self._is_blocking(unit):
+                continue
+            x0, y0, x1, y1 = self._blockers[unit.tag] = footprint_box(unit)
+            if has_exact_footprint(unit):
+                self._terrain[y0:y1, x0:x1] = 1
+            else:
+                self._unknown_terrain.add(unit.tag)
+        # Exact footprints may overlap approximated ones, e.g. an extractor on a geyser
+        for tag in self._unknown_terrain:
+            x0, y0, x1, y1 = self._blockers[tag]
+            self._terrain[y0:y1, x0:x1] = 0
+        if self.initialized:
+            self.refetch_count += 1
+        self.initialized = True
+        self.last_refetch_loop = game_loop
+
+    def update(self, blockers: Iterable[Unit], dead_unit_tags: Set[int]) -> int:
+        """ Patches the footprints of blockers that appeared, died or stopped blocking (lifted, lowered) in place.
+        Blockers that merely left vision stay in the grid.
+        Returns the amount of footprints that were patched.
+
+        :param blockers:
+        :param dead_unit_tags: """
+        self.updates += 1
+        removed: Set[int] = {tag for tag in dead_unit_tags if tag in self._blockers}
+        added: Dict[int, Tuple[int, int, int, int]] = {}
+        for unit in blockers:
+            tag = unit.tag
+            if tag in removed:
+                continue
+            if self._is_blocking(unit):
+                if tag not in self._blockers:
+                    added[tag] = footprint_box(unit)
+            elif tag in self._blockers:
+                removed.add(tag)
+
+        if not added and not removed:
+            return 0
+
+        data = self.pathing_grid.data_numpy
+        if removed:
+            restored_boxes = [self._blockers.pop(tag) for tag in removed]
+            for x0, y0, x1, y1 in restored_boxes:
+                data[y0:y1, x0:x1] = self._terrain[y0:y1, x0:x1]
+            if not self._unknown_terrain.isdisjoint(removed):
+                self._unknown_terrain -= removed
+                self._refetch_requested = True
+            # Blockers may overlap, e.g. an extractor on a geyser, so stamp the remaining ones back in
+            for x0, y0, x1, y1 in self._blockers.values():
+                if any(x0 < rx1 and rx0 < x1 and y0 < ry1 and ry0 < y1 for rx0, ry0, rx1, ry1 in restored_boxes):
+                    data[y0:y1, x0:x1] = 0
+        for tag, (x0, y0, x1, y1) in added.items():
+            data[y0:y1, x0:x1] = 0
+            self._blockers[tag] = (x0, y0, x1, y1)
+
+        self.pathing_grid.mark_changed()
+        patched = len(added) + len(removed)
+        self.footprints_patched += patched
+        return patched
+
+    @staticmethod
+    def _is_blocking(unit: Unit) -> bool:
+        return not unit.is_flying and unit.type_id not in NON_BLOCKING_STRUCTURES
@@ -1,9 +1,17 @@
-from typing import Callable, FrozenSet, List, Set
+import itertools
+from typing import Callable, FrozenSet, List, Set, Tuple
 
 import numpy as np
+from scipy import ndimage
 
 from .position import Point2
 
+# Source of PixelMap.grid_id
+_grid_ids = itertools.count()
+
+# 8-connected neighbours, used to label groups of pixels
+_CONNECTIVITY = np.ones((3, 3), dtype=bool)
+
 
 class PixelMap:
     def __init__(self, proto, in_bits: bool = False, mirrored: bool = False):
@@ -16,32 +24,80 @@ class PixelMap:
         # Used for copying pixelmaps
         self._in_bits: bool = in_bits
         self._mirrored: bool = mirrored
+        self._bits_per_pixel: int = proto.bits_per_pixel
 
-        assert self.width * self.height == (8 if in_bits else 1) * len(
+        assert proto.size.x * proto.size.y == (8 if in_bits else 1) * len(
             self._proto.data
-        ), f"{self.width * self.height} {(8 if in_bits else 1)*len(self._proto.data)}"
+        ), f"{proto.size.x * proto.size.y} {(8 if in_bits else 1)*len(self._proto.data)}"
         buffer_data = np.frombuffer(self._proto.data, dtype=np.uint8)
         if in_bits:
             buffer_data = np.unpackbits(buffer_data)
         self.data_numpy = buffer_data.reshape(self._proto.size.y, self._proto.size.x)
         if mirrored:
             self.data_numpy = np.flipud(self.data_numpy)
+        # Unique per pixel map, copies included. Together with 'version' identifies the contents of the map.
+        self.grid_id: int = next(_grid_ids)
+        # Increased on every change of the map, see mark_changed
+        self.version: int = 0
+
+    @classmethod
+    def from_array(cls, data: np.ndarray, in_bits: bool = False, bits_per_pixel: int = 8) -> "PixelMap":
+        """ Creates a pixel map around a (height, width) uint8 array without a proto. The array is not copied.
+
+        :param data:
+        :param in_bits:
+        :param bits_per_pixel: """
+        pixel_map = cls.__new__(cls)
+        pixel_map._proto = None
+        pixel_map._in_bits = in_bits
+        pixel_map._mirrored = False
+        pixel_map._bits_per_pixel = bits_per_pixel
+        pixel_map.data_numpy = data
+        pixel_map.grid_id = next(_grid_ids)
+        pixel_map.version = 0
+        return pixel_map
+
+    @classmethod
+    def zeros_like(cls, other: "PixelMap") -> "PixelMap":
+        """ Creates a blank pixel map with the size and value range of 'other'. """
+        return cls.from_array(np.zeros_like(other.data_numpy), other._in_bits, other._bits_per_pixel)
+
+    def clone(self) -> "PixelMap":
+        """ Returns a writable copy of the current contents of the map. Only the array is copied, not the proto. """
+        return PixelMap.from_array(self.data_numpy.copy(), self._in_bits, self._bits_per_pixel)
+
+    def view(self) -> "PixelMap":
+        """ Returns a read-only pixel map sharing this map's array, so it sees later writes to this map.
+        Its version doesn't follow those writes, so don't use views as keys of caches. """
+        data = self.data_numpy.view()
+        data.flags.writeable = False
+        return PixelMap.from_array(data, self._in_bits, self._bits_per_pixel)
+
+    def __deepcopy__(self, memo):
+        clone = self.clone()
+        memo[id(self)] = clone
+        return clone
+
+    def mark_changed(self):
+        """ Increases the version of the map. Has to be called after writing to 'data_numpy' directly,
+        so caches keyed by (grid_id, version) see the change. __setitem__ calls it by itself. """
+        self.version += 1
 
     @property
     def width(self):
-        return self._proto.size.x
+        return self.data_numpy.shape[1]
 
     @property
     def height(self):
-        return self._proto.size.y
+        return self.data_numpy.shape[0]
 
     @property
     def bits_per_pixel(self):
-        return self._proto.bits_per_pixel
+        return self._bits_per_pixel
 
     @property
     def bytes_per_pixel(self):
-        return self._proto.bits_per_pixel // 8
+        return self._bits_per_pixel // 8
 
     def __getitem__(self, pos):
         """ Example usage: is_pathable = self._game_info.pathing_grid[Point2((20, 20))] != 0 """
@@ -56,6 +112,65 @@ class PixelMap:
         assert 0 <= value <= 254 * self._in_bits + 1, f"value is {value}, it should be between 0 and {254 * self._in_bits + 1}"
         assert isinstance(value, int), f"value is of type {type(value)}, it should be an integer"
         self.data_numpy[pos[1], pos[0]] = value
+        self.version += 1
+
+    def fill(self, value: int):
+        """ Sets every pixel to value. """
+        self._check_value(value)
+        self.data_numpy.fill(value)
+        self.version += 1
+
+    def set_where(self, mask: np.ndarray, value: int):
+        """ Sets the pixels where the (height, width) boolean array mask is True to value.
+
+        :param mask:
+        :param value: """
+        self._check_value(value)
+        self.data_numpy[mask] = value
+        self.version += 1
+
+    def set_points(self, xs: np.ndarray, ys: np.ndarray, value: int):
+        """ Sets the pixels at the given x and y index arrays to value. All indices have to be inside the map.
+
+        :param xs:
+        :param ys:
+        :param value: """
+        self._check_value(value)
+        self.data_numpy[ys, xs] = value
+        self.version += 1
+
+    def _check_value(self, value: int):
+        assert 0 <= value <= 254 * self._in_bits + 1, f"value is {value}, it should be between 0 and {254 * self._in_bits + 1}"
+        assert isinstance(value, int), f"value is of type {type(value)}, it should be an integer"
+
+    def get_unchecked(self, x: int, y: int) -> int:
+        """ Like self[x, y], but without bounds and type checks. Only for callers that already know the pixel is inside the map. """
+        return self.data_numpy.item(y, x)
+
+    def contains_many(self, points: np.ndarray) -> np.ndarray:
+        """ Returns a boolean array telling for each (x, y) pixel of an (n, 2) array whether it's inside the map.
+
+        :param points: """
+        points = np.asarray(points, dtype=int).reshape((-1, 2))
+        return (points[:, 0] >= 0) & (points[:, 0] < self.width) & (points[:, 1] >= 0) & (points[:, 1] < self.height)
+
+    def sample(self, points: np.ndarray, default: int = 0) -> np.ndarray:
+        """ Returns the values of the (x, y) pixels of an (n, 2) array at once. Pixels outside the map get 'default'.
+
+        :param points:
+        :param default: """
+        points = np.asarray(points, dtype=int).reshape((-1, 2))
+        inside = self.contains_many(points)
+        values = np.full(len(points), default, dtype=int)
+        values[inside] = self.data_numpy[points[inside, 1], points[inside, 0]]
+        return values
+
+    def is_set_many(self, points: np.ndarray) -> np.ndarray:
+        """ Vectorized is_set: returns a boolean array of whether each (x, y) pixel of an (n, 2) array is set.
+        Pixels outside the map are not set.
+
+        :param points: """
+        return self.sample(points) != 0
 
     def is_set(self, p):
         return self[p] != 0
@@ -64,47 +179,60 @@ class PixelMap:
         return not self.is_set(p)
 
     def copy(self):
-        return PixelMap(self._proto, in_bits=self._in_bits, mirrored=self._mirrored)
+        return self.clone()
+
+    def mask(self, pred: Callable[[int], bool]) -> np.ndarray:
+        """ Returns a (height, width) boolean array of the pixels whose value satisfies pred.
+        pred is called once per distinct value, not once per pixel. """
+        values = np.unique(self.data_numpy)
+        matching = [value for value in values.tolist() if pred(value)]
+        return np.isin(self.data_numpy, matching)
+
+    def label(self, pred: Callable[[int], bool]) -> Tuple[np.ndarray, int]:
+        """ Labels the 8-connected groups of pixels that satisfy pred.
+        Returns a (height, width) int array of group labels, 0 for pixels outside any group, and the amount of groups. """
+        return ndimage.label(self.mask(pred), structure=_CONNECTIVITY)
+
+    def flood_fill_mask(self, start_point: Point2, pred: Callable[[int], bool]) -> np.ndarray:
+        """ Returns a (height, width) boolean array of the 8-connected pixels satisfying pred that can be reached from start_point.
+        Empty if start_point is outside the map or doesn't satisfy pred. """
+        x, y = start_point
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return np.zeros(self.data_numpy.shape, dtype=bool)
+        labels, _ = self.label(pred)
+        start_label = labels[y, x]
+        if not start_label:
+            return np.zeros(self.data_numpy.shape, dtype=bool)
+        return labels == start_label
 
     def flood_fill(self, start_point: Point2, pred: Callable[[int], bool]) -> Set[Point2]:
-        nodes: Set[Point2] = set()
-        queue: List[Point2] = [start_point]
-
-        while queue:
-            x, y = queue.pop()
-
-            if not (0 <= x < self.width and 0 <= y < self.height):
-                continue
-
-            if Point2((x, y)) in nodes:
-                continue
-
-            if pred(self[x, y]):
-                nodes.add(Point2((x, y)))
-                queue += [Point2((x + a, y + b)) for a in [-1, 0, 1] for b in [-1, 0, 1] if not (a == 0 and b == 0)]
-        return nodes
+        """ Set version of flood_fill_mask. """
+        ys, xs = np.nonzero(self.flood_fill_mask(start_point, pred))
+        return {Point2(p) for p in zip(xs.tolist(), ys.tolist())}
 
     def flood_fill_all(self, pred: Callable[[int], bool]) -> Set[FrozenSet[Point2]]:
+        """ Set version of label: one frozenset of points per group. """
+        labels, count = self.label(pred)
+        if not count:
+            return set()
+        ys, xs = np.nonzero(labels)
+        group_labels = labels[ys, xs]
+        # Sort the pixels by group, then split them at the group boundaries
+        order = np.argsort(group_labels, kind="stable")
+        splits = np.searchsorted(group_labels[order], np.arange(2, count + 1))
         groups: Set[FrozenSet[Point2]] = set()
-
-        for x in range(self.width):
-            for y in range(self.height):
-                if any((x, y) in g for g in groups):
-                    continue
-
-                if pred(self[x, y]):
-                    groups.add(frozenset(self.flood_fill(Point2((x, y)), pred)))
-
+        for group_xs, group_ys in zip(np.split(xs[order], splits), np.split(ys[order], splits)):
+            groups.add(frozenset(Point2(p) for p in zip(group_xs.tolist(), group_ys.tolist())))
         return groups
 
     def print(self, wide=False):
         for y in range(self.height):
             for x in range(self.width):
-                print("#" if self.is_set((x, y)) else " ", end=(" " if wide else ""))
+                print("#" if self.get_unchecked(x, y) else " ", end=(" " if wide else ""))
             print("")
 
     def save_image(self, filename):
-        data = [(0, 0, self[x, y]) for y in range(self.height) for x in range(self.width)]
+        data = [(0, 0, self.get_unchecked(x, y)) for y in range(self.height) for x in range(self.width)]
         from PIL import Image
 
         im = Image.new("RGB", (self.width, self.height))
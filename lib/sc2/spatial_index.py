@@ -0,0 +1,60 @@
+from __future__ import annotations
+from typing import Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class SpatialIndex:
+    """
+    KD-tree over the positions of one group of units of a single frame.
+    Used by Units when 'distance_calculation_method' is 4: the root collections of BotAI (all_units, units,
+    structures, enemy_units, enemy_structures) build one on their first distance query of a frame,
+    so radius and nearest neighbour queries no longer scan every unit and no n*n distance matrix is allocated.
+
+    All returned indices are positions inside the indexed group, in ascending order unless stated otherwise.
+    Radius checks are strict ('<'), like the Units distance functions.
+    """
+
+    def __init__(self, positions: np.ndarray):
+        """
+        :param positions: (n, 2) array of unit positions
+        """
+        self.positions: np.ndarray = positions
+        self.tree: cKDTree = cKDTree(positions)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def within(self, point: Tuple[float, float], distance: float) -> np.ndarray:
+        """ Returns the indices of all points that are closer than distance to point.
+
+        :param point:
+        :param distance: """
+        candidates = np.asarray(self.tree.query_ball_point(point, distance), dtype=np.intp)
+        if not candidates.size:
+            return candidates
+        difference = self.positions[candidates] - point
+        candidates = candidates[np.einsum("ij,ij->i", difference, difference) < distance * distance]
+        candidates.sort()
+        return candidates
+
+    def nearest(self, point: Tuple[float, float], k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns (distances, indices) of the k points closest to point, sorted by distance.
+
+        :param point:
+        :param k: """
+        k = min(k, len(self))
+        if k <= 0:
+            return np.empty(0), np.empty(0, dtype=np.intp)
+        distances, indices = self.tree.query(point, k=k)
+        return np.atleast_1d(distances), np.atleast_1d(indices)
+
+    def nearest_distances(self, points: np.ndarray, distance_upper_bound: float = np.inf) -> np.ndarray:
+        """ Returns the distance of each of the given points to the closest indexed point.
+        Points without an indexed point closer than 'distance_upper_bound' get infinity.
+
+        :param points: (m, 2) array
+        :param distance_upper_bound: """
+        distances, _ = self.tree.query(points, k=1, distance_upper_bound=distance_upper_bound)
+        return distances
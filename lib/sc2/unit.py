@@ -63,6 +63,9 @@ if TYPE_CHECKING:
     from .bot_ai import BotAI
     from .game_data import AbilityData, UnitTypeData
 
+# Keys of Unit.cache that only depend on the unit type, kept when a pooled unit is reused
+_TYPE_CACHE_KEYS = ("type_id", "_type_data", "_creation_ability")
+
 
 class UnitOrder:
     @classmethod
@@ -99,6 +102,25 @@ class Unit:
         # Used by property_immutable_cache
         self.cache = {}
         self.game_loop: int = bot_object.state.game_loop
+        # Row of this unit in the UnitStore of its frame, set by BotAI._prepare_units, see unit_store.py
+        self._store_index: int = -1
+
+    def _reuse(self, proto_data, game_loop: int):
+        """ Turns this unit into the unit of a new frame, see unit_pool.py.
+        Cached properties that only depend on the unit type are kept if the type didn't change.
+
+        :param proto_data:
+        :param game_loop: """
+        cache = self.cache
+        if proto_data.unit_type == self._proto.unit_type:
+            static = [(key, cache[key]) for key in _TYPE_CACHE_KEYS if key in cache]
+            cache.clear()
+            cache.update(static)
+        else:
+            cache.clear()
+        self._proto = proto_data
+        self.game_loop = game_loop
+        self._store_index = -1
 
     def __repr__(self) -> str:
         """ Returns string of this form: Unit(name='SCV', tag=4396941328). """
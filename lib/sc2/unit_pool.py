@@ -0,0 +1,70 @@
+from __future__ import annotations
+import sys
+from typing import Dict, TYPE_CHECKING
+
+from .unit import Unit
+
+if TYPE_CHECKING:
+    from .bot_ai import BotAI
+
+
+def _refcount(obj) -> int:
+    return sys.getrefcount(obj)
+
+
+def _unreferenced_refcount() -> int:
+    """ Reference count _refcount reports for an object that is only held by a local variable of its caller. """
+    probe = object()
+    return _refcount(probe)
+
+
+# Reference count of a pooled unit nothing outside of UnitPool.get refers to
+_UNREFERENCED: int = _unreferenced_refcount()
+
+
+class UnitPool:
+    """
+    Reuses the Unit objects of persistent tags across frames instead of creating new ones every step.
+
+    A unit is only reused two frames after it was handed out, so the units of the previous frame
+    (e.g. in BotAI._units_previous_map, which the events compare against) are never changed.
+    It is also only reused if nothing else refers to it anymore, so units that are kept across frames,
+    like UnitCached snapshots or units in stale property caches, keep the data of their own frame.
+    """
+
+    def __init__(self):
+        # Units handed out this frame by tag
+        self._units: Dict[int, Unit] = {}
+        # Units handed out in the previous frame by tag, never reused
+        self._previous: Dict[int, Unit] = {}
+        # Units handed out two frames ago by tag, reused if unreferenced
+        self._spare: Dict[int, Unit] = {}
+        # Statistics
+        self.created: int = 0
+        self.reused: int = 0
+
+    def start_frame(self):
+        """ Has to be called before the units of a new frame are requested with get. """
+        self._spare = self._previous
+        self._previous = self._units
+        self._units = {}
+
+    def get(self, proto, bot_object: BotAI) -> Unit:
+        """ Returns a Unit of proto for the current frame, reusing the unit of its tag from two frames ago if possible.
+
+        :param proto:
+        :param bot_object: """
+        unit = self._spare.pop(proto.tag, None)
+        if unit is not None and _refcount(unit) <= _UNREFERENCED:
+            unit._reuse(proto, bot_object.state.game_loop)
+            self.reused += 1
+        else:
+            unit = Unit(proto, bot_object)
+            self.created += 1
+        self._units[proto.tag] = unit
+        return unit
+
+    def clear(self):
+        self._units = {}
+        self._previous = {}
+        self._spare = {}
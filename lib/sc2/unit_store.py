@@ -0,0 +1,68 @@
+from __future__ import annotations
+from typing import List, TYPE_CHECKING
+
+import numpy as np
+
+from .constants import IS_CLOAKED, IS_SNAPSHOT
+
+if TYPE_CHECKING:
+    from .unit import Unit
+
+# Bits of UnitStore.flags
+FLAG_STRUCTURE = 1
+FLAG_FLYING = 2
+FLAG_BURROWED = 4
+FLAG_SNAPSHOT = 8
+FLAG_CLOAKED = 16
+FLAG_HALLUCINATION = 32
+
+
+class UnitStore:
+    """
+    Struct-of-arrays copy of all units of one frame, built once in BotAI._prepare_units.
+    Row i of every column belongs to self.all_units[i], which is also stored as 'unit._store_index' on the unit.
+    Units objects use these rows to answer distance queries with single vectorized operations.
+
+    Example::
+
+        store = self._unit_store
+        enemy_rows = self.enemy_units._store_indices
+        if enemy_rows is not None:
+            total_enemy_health = store.health[enemy_rows].sum()
+    """
+
+    def __init__(self, units: List[Unit], game_loop: int):
+        """
+        :param units:
+        :param game_loop:
+        """
+        self.game_loop: int = game_loop
+        amount = len(units)
+        self.positions: np.ndarray = np.fromiter(
+            (coord for unit in units for coord in unit.position_tuple), dtype=np.float64, count=2 * amount
+        ).reshape((amount, 2))
+        self.radius: np.ndarray = np.fromiter((unit._proto.radius for unit in units), dtype=np.float64, count=amount)
+        self.type_id: np.ndarray = np.fromiter((unit._proto.unit_type for unit in units), dtype=np.int32, count=amount)
+        self.alliance: np.ndarray = np.fromiter((unit._proto.alliance for unit in units), dtype=np.int8, count=amount)
+        self.health: np.ndarray = np.fromiter((unit._proto.health for unit in units), dtype=np.float64, count=amount)
+        self.shield: np.ndarray = np.fromiter((unit._proto.shield for unit in units), dtype=np.float64, count=amount)
+        self.flags: np.ndarray = np.fromiter((self._flags_of(unit) for unit in units), dtype=np.int32, count=amount)
+
+    def __len__(self) -> int:
+        return len(self.type_id)
+
+    @staticmethod
+    def _flags_of(unit: Unit) -> int:
+        proto = unit._proto
+        return (
+            FLAG_STRUCTURE * unit.is_structure
+            | FLAG_FLYING * proto.is_flying
+            | FLAG_BURROWED * proto.is_burrowed
+            | FLAG_SNAPSHOT * (proto.display_type == IS_SNAPSHOT)
+            | FLAG_CLOAKED * (proto.cloak in IS_CLOAKED)
+            | FLAG_HALLUCINATION * proto.is_hallucination
+        )
+
+    def has_flag(self, flag: int) -> np.ndarray:
+        """ Returns a boolean column that is True for all rows that have the flag set. """
+        return (self.flags & flag) != 0
@@ -0,0 +1,176 @@
+from __future__ import annotations
+from typing import Dict, Iterable, Union, TYPE_CHECKING
+
+import numpy as np
+
+from .constants import TARGET_AIR, TARGET_GROUND, UNIT_BATTLECRUISER, UNIT_ORACLE
+from .ids.unit_typeid import UnitTypeId
+
+if TYPE_CHECKING:
+    from .game_data import GameData, UnitTypeData
+
+# Values of UnitTypeTable.unit_class
+CLASS_NONE = 0
+CLASS_MELEE = 1
+CLASS_RANGED = 2
+CLASS_SPELLCASTER = 3
+
+# Units that attack ground with less range than this are melee
+MELEE_RANGE = 1.5
+
+# Units whose strength lies in their abilities rather than their weapon
+SPELLCASTER_TYPES = {
+    UnitTypeId.HIGHTEMPLAR,
+    UnitTypeId.SENTRY,
+    UnitTypeId.ORACLE,
+    UnitTypeId.GHOST,
+    UnitTypeId.RAVEN,
+    UnitTypeId.INFESTOR,
+    UnitTypeId.INFESTORBURROWED,
+    UnitTypeId.VIPER,
+}
+
+# Name: dtype of every column of UnitTypeTable
+COLUMNS = {
+    "ground_dps": np.float64,
+    "ground_range": np.float64,
+    "air_dps": np.float64,
+    "air_range": np.float64,
+    "can_attack_ground": bool,
+    "can_attack_air": bool,
+    "is_melee": bool,
+    "unit_class": np.int8,
+    "movement_speed": np.float64,
+    "armor": np.float64,
+    "sight_range": np.float64,
+    "attributes": np.int32,
+    "mineral_cost": np.int32,
+    "vespene_cost": np.int32,
+    "supply": np.float64,
+}
+
+
+class UnitTypeTable:
+    """
+    Static attributes of all unit types, built once from GameData by BotAI._prepare_start.
+    Every column (see COLUMNS) is a NumPy array with one row per unit type, indexed by a dense type index,
+    plus a last row of zeros for types that aren't in the game data. Values don't include upgrades,
+    like the Unit properties of the same name. Attributes are a bit mask with bit 'Attribute.value' set per attribute.
+    Unit radius isn't part of the game data, use the radius column of UnitStore instead.
+
+    Example::
+
+        table = self.unit_type_table
+        zergling_range = table.get("ground_range", UnitTypeId.ZERGLING)
+        enemy_dps = self.enemy_units.type_column("ground_dps")
+    """
+
+    def __init__(self, game_data: GameData):
+        """
+        :param game_data:
+        """
+        type_datas = [game_data.units[unit_id] for unit_id in sorted(game_data.units)]
+        self.unknown_index: int = len(type_datas)
+        self.type_ids: np.ndarray = np.array([type_data._proto.unit_id for type_data in type_datas], dtype=np.int32)
+
+        # Raw type id: dense index, one entry past the highest id for lookups of unknown ids
+        self._index_of_type: np.ndarray = np.full(
+            (int(self.type_ids.max()) + 2 if len(type_datas) else 1), self.unknown_index, dtype=np.int32
+        )
+        self._index_of_type[self.type_ids] = np.arange(len(type_datas), dtype=np.int32)
+
+        rows = [self._row_of(type_data) for type_data in type_datas]
+        self._columns: Dict[str, np.ndarray] = {}
+        for name, dtype in COLUMNS.items():
+            column = np.zeros(len(type_datas) + 1, dtype=dtype)
+            column[: len(type_datas)] = [row[name] for row in rows]
+            column.flags.writeable = False
+            self._columns[name] = column
+            setattr(self, name, column)
+
+    @staticmethod
+    def _row_of(type_data: UnitTypeData) -> Dict[str, Union[float, int, bool]]:
+        """ Computes the attributes of one unit type, with the same rules as the Unit properties. """
+        proto = type_data._proto
+        type_id = proto.unit_id
+        weapons = list(proto.weapons)
+        ground_weapon = next((weapon for weapon in weapons if weapon.type in TARGET_GROUND), None)
+        air_weapon = next((weapon for weapon in weapons if weapon.type in TARGET_AIR), None)
+
+        can_attack_ground = ground_weapon is not None or type_id in {UNIT_BATTLECRUISER.value, UNIT_ORACLE.value}
+        can_attack_air = air_weapon is not None or type_id == UNIT_BATTLECRUISER.value
+        if type_id == UNIT_ORACLE.value:
+            ground_range = 4
+        elif type_id == UNIT_BATTLECRUISER.value:
+            ground_range = 6
+        else:
+            ground_range = ground_weapon.range if ground_weapon else 0
+        air_range = 6 if type_id == UNIT_BATTLECRUISER.value else (air_weapon.range if air_weapon else 0)
+        is_melee = can_attack_ground and ground_range < MELEE_RANGE
+
+        if type_id in {unit_type.value for unit_type in SPELLCASTER_TYPES}:
+            unit_class = CLASS_SPELLCASTER
+        elif is_melee:
+            unit_class = CLASS_MELEE
+        elif can_attack_ground or can_attack_air:
+            unit_class = CLASS_RANGED
+        else:
+            unit_class = CLASS_NONE
+
+        attributes = 0
+        for attribute in proto.attributes:
+            attributes |= 1 << attribute
+
+        return {
+            "ground_dps": (ground_weapon.damage * ground_weapon.attacks) / ground_weapon.speed if ground_weapon else 0,
+            "ground_range": ground_range,
+            "air_dps": (air_weapon.damage * air_weapon.attacks) / air_weapon.speed if air_weapon else 0,
+            "air_range": air_range,
+            "can_attack_ground": can_attack_ground,
+            "can_attack_air": can_attack_air,
+            "is_melee": is_melee,
+            "unit_class": unit_class,
+            "movement_speed": proto.movement_speed,
+            "armor": proto.armor,
+            "sight_range": proto.sight_range,
+            "attributes": attributes,
+            "mineral_cost": proto.mineral_cost,
+            "vespene_cost": proto.vespene_cost,
+            "supply": proto.food_required,
+        }
+
+    def index(self, type_id: Union[UnitTypeId, int]) -> int:
+        """ Returns the dense index of a unit type, or unknown_index if it isn't in the game data.
+
+        :param type_id: """
+        type_id = int(getattr(type_id, "value", type_id))
+        if 0 <= type_id < len(self._index_of_type):
+            return int(self._index_of_type[type_id])
+        return self.unknown_index
+
+    def indices(self, type_ids: Union[np.ndarray, Iterable[int]]) -> np.ndarray:
+        """ Vectorized index: returns the dense indices of an array of raw type ids.
+
+        :param type_ids: """
+        type_ids = np.asarray(type_ids, dtype=np.int64)
+        return self._index_of_type[np.clip(type_ids, 0, len(self._index_of_type) - 1)]
+
+    def column(self, name: str) -> np.ndarray:
+        """ Returns the read-only column called 'name', see COLUMNS.
+
+        :param name: """
+        return self._columns[name]
+
+    def get(self, name: str, type_id: Union[UnitTypeId, int]):
+        """ Returns the value of column 'name' for one unit type as a Python scalar.
+
+        :param name:
+        :param type_id: """
+        return self._columns[name][self.index(type_id)].item()
+
+    def gather(self, name: str, type_ids: Union[np.ndarray, Iterable[int]]) -> np.ndarray:
+        """ Returns the values of column 'name' for an array of raw type ids.
+
+        :param name:
+        :param type_ids: """
+        return self._columns[name][self.indices(type_ids)]
@@ -7,6 +7,7 @@ from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union, TYPE_
 
 from .ids.unit_typeid import UnitTypeId
 from .position import Point2, Point3
+from .spatial_index import SpatialIndex
 from .unit import Unit
 import numpy as np
 
@@ -14,6 +15,10 @@ warnings.simplefilter("once")
 
 if TYPE_CHECKING:
     from .bot_ai import BotAI
+    from .unit_store import UnitStore
+
+# Groups smaller than this are queried with plain python loops, which beat numpy's per call overhead
+VECTORIZED_QUERY_MIN_UNITS = 4
 
 
 class Units(list):
@@ -30,6 +35,18 @@ class Units(list):
         """
         super().__init__(units)
         self._bot_object = bot_object
+        # (UnitStore, rows of these units in it or None, amount of units) cached by self._store_indices
+        self._cached_store_indices: Optional[Tuple[UnitStore, Optional[np.ndarray], int]] = None
+        # Set on the root collections by BotAI._prepare_units if distance_calculation_method is 4, see self._spatial_index
+        self._spatial_index_enabled: bool = False
+        # (self._cached_store_indices it was built for, SpatialIndex)
+        self._cached_spatial_index: Optional[Tuple[tuple, SpatialIndex]] = None
+        # (amount of units, tag: position in this list) cached by self._tag_index
+        self._cached_tag_index: Optional[Tuple[int, Dict[int, int]]] = None
+        # Set on the root collections by BotAI._prepare_units, see self._type_index
+        self._type_index_enabled: bool = False
+        # (amount of units, raw type id: positions in this list, memoized type selections) cached by self._type_index
+        self._cached_type_index: Optional[Tuple[int, Dict[int, List[int]], Dict[Any, List[int]]]] = None
 
     def __call__(self, *args, **kwargs):
         return UnitSelection(self, *args, **kwargs)
@@ -41,34 +58,25 @@ class Units(list):
         return self.subgroup(self)
 
     def __or__(self, other: Units) -> Units:
-        return Units(
-            chain(
-                iter(self),
-                (other_unit for other_unit in other if other_unit.tag not in (self_unit.tag for self_unit in self)),
-            ),
+        self_tags = self._tag_index
+        units = Units(
+            chain(iter(self), (other_unit for other_unit in other if other_unit.tag not in self_tags)),
             self._bot_object,
         )
+        # The union of two root collections, e.g. 'self.units | self.structures', is indexed by type as well
+        units._type_index_enabled = self._type_index_enabled and getattr(other, "_type_index_enabled", False)
+        return units
 
     def __add__(self, other: Units) -> Units:
-        return Units(
-            chain(
-                iter(self),
-                (other_unit for other_unit in other if other_unit.tag not in (self_unit.tag for self_unit in self)),
-            ),
-            self._bot_object,
-        )
+        return self | other
 
     def __and__(self, other: Units) -> Units:
-        return Units(
-            (other_unit for other_unit in other if other_unit.tag in (self_unit.tag for self_unit in self)),
-            self._bot_object,
-        )
+        self_tags = self._tag_index
+        return Units((other_unit for other_unit in other if other_unit.tag in self_tags), self._bot_object)
 
     def __sub__(self, other: Units) -> Units:
-        return Units(
-            (self_unit for self_unit in self if self_unit.tag not in (other_unit.tag for other_unit in other)),
-            self._bot_object,
-        )
+        other_tags = other._tag_index if isinstance(other, Units) else {other_unit.tag for other_unit in other}
+        return Units((self_unit for self_unit in self if self_unit.tag not in other_tags), self._bot_object)
 
     def __hash__(self):
         return hash(unit.tag for unit in self)
@@ -85,11 +93,81 @@ class Units(list):
     def exists(self) -> bool:
         return bool(self)
 
+    @property
+    def _tag_index(self) -> Dict[int, int]:
+        """ Returns a dict of tag: position of the first unit with that tag in this list.
+        It is built on first use and dropped when the list is changed in place. """
+        cached = self._cached_tag_index
+        if cached is not None and cached[0] == len(self):
+            return cached[1]
+        tag_index = {}
+        for index, unit in enumerate(self):
+            tag_index.setdefault(unit.tag, index)
+        self._cached_tag_index = (len(self), tag_index)
+        return tag_index
+
+    @property
+    def _type_index(self) -> Optional[Dict[int, List[int]]]:
+        """ Returns a dict of raw unit type id: positions of the units of that type in this list,
+        or None if this is not a root collection of the current frame.
+        It is built on first use and dropped when the list is changed in place. """
+        if not self._type_index_enabled:
+            return None
+        cached = self._cached_type_index
+        if cached is not None and cached[0] == len(self):
+            return cached[1]
+        type_index: Dict[int, List[int]] = {}
+        for index, unit in enumerate(self):
+            type_index.setdefault(unit._proto.unit_type, []).append(index)
+        self._cached_type_index = (len(self), type_index, {})
+        return type_index
+
+    def _positions_of_types(self, type_ids: Set[int], exclude: bool = False) -> Optional[List[int]]:
+        """ Returns the sorted positions of all units whose raw type id is in type_ids (or not in it if exclude),
+        memoized until the list is changed in place. Returns None if this collection has no type index.
+
+        :param type_ids:
+        :param exclude: """
+        type_index = self._type_index
+        if type_index is None:
+            return None
+        memo = self._cached_type_index[2]
+        key = (frozenset(type_ids), exclude)
+        positions = memo.get(key)
+        if positions is None:
+            if exclude:
+                buckets = [bucket for type_id, bucket in type_index.items() if type_id not in type_ids]
+            else:
+                buckets = [type_index[type_id] for type_id in type_ids if type_id in type_index]
+            if len(buckets) == 1:
+                positions = buckets[0]
+            else:
+                positions = sorted(chain.from_iterable(buckets))
+            memo[key] = positions
+        return positions
+
+    def _subgroup_of_positions(self, positions: List[int]) -> Units:
+        """ Creates a subgroup of the units at the given positions of this group that keeps their store rows.
+
+        :param positions: """
+        group = self.subgroup([self[i] for i in positions])
+        group._inherit_store_indices(self, positions)
+        return group
+
+    def _inherit_store_indices(self, parent: Units, positions: List[int]):
+        """ Takes the store rows of the units at the given positions of parent, if parent already resolved them.
+
+        :param parent:
+        :param positions: """
+        cached = parent._cached_store_indices
+        if cached is not None and cached[1] is not None and cached[2] == len(parent):
+            self._cached_store_indices = (cached[0], cached[1][positions], len(self))
+
     def find_by_tag(self, tag) -> Optional[Unit]:
-        for unit in self:
-            if unit.tag == tag:
-                return unit
-        return None
+        index = self._tag_index.get(tag)
+        if index is None:
+            return None
+        return self[index]
 
     def by_tag(self, tag):
         unit = self.find_by_tag(tag)
@@ -125,7 +203,162 @@ class Units(list):
         else:
             return self.subgroup(random.sample(self, n))
 
-    # TODO: append, insert, remove, pop and extend functions should reset the cache for Units.positions because the number of units in the list has changed
+    @property
+    def _store_indices(self) -> Optional[np.ndarray]:
+        """ Returns the rows of these units in the UnitStore of the current frame (see unit_store.py),
+        or None if any unit is not from the current frame, e.g. a unit that was remembered from an earlier step. """
+        store: UnitStore = getattr(self._bot_object, "_unit_store", None)
+        if store is None:
+            return None
+        cached = self._cached_store_indices
+        if cached is not None and cached[0] is store and cached[2] == len(self):
+            return cached[1]
+        game_loop = store.game_loop
+        indices = np.fromiter(
+            (unit._store_index if unit.game_loop == game_loop else -1 for unit in self), dtype=np.intp, count=len(self)
+        )
+        if indices.size and indices.min() < 0:
+            indices = None
+        self._cached_store_indices = (store, indices, len(self))
+        return indices
+
+    def _store_positions(self) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """ Returns the store rows and the (n, 2) position array of these units,
+        or (None, None) if the group is too small or can't be vectorized. """
+        if len(self) < VECTORIZED_QUERY_MIN_UNITS:
+            return None, None
+        indices = self._store_indices
+        if indices is None:
+            return None, None
+        return indices, self._bot_object._unit_store.positions[indices]
+
+    def type_ids_array(self) -> np.ndarray:
+        """ Returns the raw type ids of these units as an int array, read from the UnitStore if possible. """
+        indices = self._store_indices
+        if indices is not None:
+            return self._bot_object._unit_store.type_id[indices]
+        return np.fromiter((unit._proto.unit_type for unit in self), dtype=np.int32, count=len(self))
+
+    def type_column(self, name: str) -> np.ndarray:
+        """ Returns a static per-type attribute of every unit, gathered from BotAI.unit_type_table.
+        See unit_type_table.py for the available columns. Example: total_dps = self.enemy_units.type_column("ground_dps").sum()
+
+        :param name: """
+        return self._bot_object.unit_type_table.gather(name, self.type_ids_array())
+
+    def _distances_squared_to(
+        self, position: Union[Unit, Point2, Point3]
+    ) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """ Returns the store rows of these units and their squared distances to position as arrays,
+        or (None, None) if the group can't be vectorized. """
+        indices, positions = self._store_positions()
+        if indices is None:
+            return None, None
+        x, y = self._position_tuple_of(position)
+        dx = positions[:, 0] - x
+        dy = positions[:, 1] - y
+        return indices, dx * dx + dy * dy
+
+    @staticmethod
+    def _position_tuple_of(position: Union[Unit, Point2, Point3]) -> Tuple[float, float]:
+        if isinstance(position, Unit):
+            return position.position_tuple
+        return position[0], position[1]
+
+    @property
+    def _spatial_index(self) -> Optional[SpatialIndex]:
+        """ Returns the KD-tree over this group, built on first use and kept for the rest of the frame.
+        Only root collections of BotAI have one, and only if distance_calculation_method is 4, see spatial_index.py """
+        if not self._spatial_index_enabled:
+            return None
+        indices, positions = self._store_positions()
+        if indices is None:
+            return None
+        cached = self._cached_spatial_index
+        if cached is not None and cached[0] is self._cached_store_indices:
+            return cached[1]
+        spatial_index = SpatialIndex(positions)
+        self._cached_spatial_index = (self._cached_store_indices, spatial_index)
+        return spatial_index
+
+    def _distances_squared_to_group(self, other: Units) -> Optional[np.ndarray]:
+        """ Returns the (len(self), len(other)) matrix of squared distances, or None if it can't be vectorized. """
+        indices, positions = self._store_positions()
+        if indices is None:
+            return None
+        other_indices = other._store_indices
+        if other_indices is None:
+            return None
+        other_positions = self._bot_object._unit_store.positions[other_indices]
+        difference = positions[:, np.newaxis, :] - other_positions[np.newaxis, :, :]
+        return np.einsum("ijk,ijk->ij", difference, difference)
+
+    def _subgroup_of_rows(self, selected: np.ndarray, indices: np.ndarray) -> Units:
+        """ Creates a subgroup of the units at positions 'selected' of this group that keeps their store rows.
+
+        :param selected:
+        :param indices: """
+        group = self.subgroup([self[i] for i in selected.tolist()])
+        group._cached_store_indices = (self._bot_object._unit_store, indices[selected], len(group))
+        return group
+
+    def _invalidate_caches(self):
+        """ Drops the cached store rows, KD-tree, tag index and type index, after the list was changed in place. """
+        self._cached_store_indices = None
+        self._cached_spatial_index = None
+        self._cached_tag_index = None
+        self._cached_type_index = None
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._invalidate_caches()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._invalidate_caches()
+
+    def __iadd__(self, other):
+        result = super().__iadd__(other)
+        self._invalidate_caches()
+        return result
+
+    def __imul__(self, other):
+        result = super().__imul__(other)
+        self._invalidate_caches()
+        return result
+
+    def append(self, unit):
+        super().append(unit)
+        self._invalidate_caches()
+
+    def extend(self, units):
+        super().extend(units)
+        self._invalidate_caches()
+
+    def insert(self, index, unit):
+        super().insert(index, unit)
+        self._invalidate_caches()
+
+    def pop(self, index=-1):
+        unit = super().pop(index)
+        self._invalidate_caches()
+        return unit
+
+    def remove(self, unit):
+        super().remove(unit)
+        self._invalidate_caches()
+
+    def clear(self):
+        super().clear()
+        self._invalidate_caches()
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._invalidate_caches()
+
+    def reverse(self):
+        super().reverse()
+        self._invalidate_caches()
     # @property_immutable_cache
     # def positions(self) -> np.ndarray:
     #     flat_units_positions = (coord for unit in self for coord in unit.position)
@@ -172,6 +405,13 @@ class Units(list):
 
         :param position: """
         assert self, "Units object is empty"
+        spatial_index = self._spatial_index
+        if spatial_index is not None:
+            distances, _ = spatial_index.nearest(self._position_tuple_of(position))
+            return float(distances[0])
+        indices, distances_squared = self._distances_squared_to(position)
+        if indices is not None:
+            return float(distances_squared.min()) ** 0.5
         if isinstance(position, Unit):
             return min(self._bot_object._distance_squared_unit_to_unit(unit, position) for unit in self) ** 0.5
         return min(self._bot_object._distance_units_to_pos(self, position))
@@ -191,6 +431,9 @@ class Units(list):
 
         :param position: """
         assert self, "Units object is empty"
+        indices, distances_squared = self._distances_squared_to(position)
+        if indices is not None:
+            return float(distances_squared.max()) ** 0.5
         if isinstance(position, Unit):
             return max(self._bot_object._distance_squared_unit_to_unit(unit, position) for unit in self) ** 0.5
         return max(self._bot_object._distance_units_to_pos(self, position))
@@ -209,6 +452,13 @@ class Units(list):
 
         :param position: """
         assert self, "Units object is empty"
+        spatial_index = self._spatial_index
+        if spatial_index is not None:
+            _, nearest = spatial_index.nearest(self._position_tuple_of(position))
+            return self[int(nearest[0])]
+        indices, distances_squared = self._distances_squared_to(position)
+        if indices is not None:
+            return self[int(distances_squared.argmin())]
         if isinstance(position, Unit):
             return min(
                 (unit1 for unit1 in self),
@@ -232,6 +482,9 @@ class Units(list):
 
         :param position: """
         assert self, "Units object is empty"
+        indices, distances_squared = self._distances_squared_to(position)
+        if indices is not None:
+            return self[int(distances_squared.argmax())]
         if isinstance(position, Unit):
             return max(
                 (unit1 for unit1 in self),
@@ -257,6 +510,14 @@ class Units(list):
         """
         if not self:
             return self
+        spatial_index = self._spatial_index
+        if spatial_index is not None:
+            return self._subgroup_of_rows(
+                spatial_index.within(self._position_tuple_of(position), distance), self._store_indices
+            )
+        indices, distances_squared = self._distances_squared_to(position)
+        if indices is not None:
+            return self._subgroup_of_rows(np.flatnonzero(distances_squared < distance ** 2), indices)
         if isinstance(position, Unit):
             distance_squared = distance ** 2
             return self.subgroup(
@@ -284,6 +545,9 @@ class Units(list):
         """
         if not self:
             return self
+        indices, distances_squared = self._distances_squared_to(position)
+        if indices is not None:
+            return self._subgroup_of_rows(np.flatnonzero(distance ** 2 < distances_squared), indices)
         if isinstance(position, Unit):
             distance_squared = distance ** 2
             return self.subgroup(
@@ -314,6 +578,11 @@ class Units(list):
         """
         if not self:
             return self
+        indices, distances_squared = self._distances_squared_to(position)
+        if indices is not None:
+            return self._subgroup_of_rows(
+                np.flatnonzero((distance1 ** 2 < distances_squared) & (distances_squared < distance2 ** 2)), indices
+            )
         if isinstance(position, Unit):
             distance1_squared = distance1 ** 2
             distance2_squared = distance2 ** 2
@@ -344,6 +613,10 @@ class Units(list):
         """
         if not self:
             return self
+        spatial_index = self._spatial_index
+        if spatial_index is not None:
+            _, nearest = spatial_index.nearest(self._position_tuple_of(position), k=n)
+            return self.subgroup([self[i] for i in nearest.tolist()])
         return self.subgroup(self._list_sorted_by_distance_to(position)[:n])
 
     def furthest_n_units(self, position: Union[Unit, Point2, np.ndarray], n: int) -> Units:
@@ -376,6 +649,15 @@ class Units(list):
         if not self:
             return self
         distance_squared = distance ** 2
+        if self._spatial_index_enabled or other_units._spatial_index_enabled:
+            selected = self._in_distance_of_group_indexed(other_units, distance)
+            if selected is not None:
+                return self._subgroup_of_rows(selected, self._store_indices)
+        distances_squared = self._distances_squared_to_group(other_units)
+        if distances_squared is not None:
+            return self._subgroup_of_rows(
+                np.flatnonzero((distances_squared < distance_squared).any(axis=1)), self._store_indices
+            )
         if len(self) == 1:
             if any(
                 self._bot_object._distance_squared_unit_to_unit(self[0], target) < distance_squared
@@ -394,6 +676,19 @@ class Units(list):
             )
         )
 
+    def _in_distance_of_group_indexed(self, other_units: Units, distance: float) -> Optional[np.ndarray]:
+        """ Returns the positions of the units of this group that are closer than distance to any unit of other_units
+        using a KD-tree over other_units, without building the len(self) * len(other_units) distance matrix.
+        Returns None if one of the groups can't be vectorized. """
+        indices = self._store_indices
+        other_indices = other_units._store_indices
+        if indices is None or other_indices is None:
+            return None
+        positions = self._bot_object._unit_store.positions
+        other_index = other_units._spatial_index or SpatialIndex(positions[other_indices])
+        distances = other_index.nearest_distances(positions[indices], distance_upper_bound=distance)
+        return np.flatnonzero(distances < distance)
+
     def in_closest_distance_to_group(self, other_units: Units) -> Unit:
         """
         Returns unit in shortest distance from any unit in self to any unit in group.
@@ -403,6 +698,9 @@ class Units(list):
         :param other_units: """
         assert self, "Units object is empty"
         assert other_units, "Given units object is empty"
+        distances_squared = self._distances_squared_to_group(other_units)
+        if distances_squared is not None:
+            return self[int(distances_squared.min(axis=1).argmin())]
         return min(
             self,
             key=lambda self_unit: min(
@@ -468,6 +766,11 @@ class Units(list):
 
     def _list_sorted_by_distance_to(self, position: Union[Unit, Point2], reverse: bool = False) -> List[Unit]:
         """ This function should be a bit faster than using units.sorted(key=lambda u: u.distance_to(position)) """
+        indices, distances_squared = self._distances_squared_to(position)
+        if indices is not None:
+            # A stable sort of the negated distances keeps the order of equally distant units like sorted(reverse=True)
+            order = np.argsort(-distances_squared if reverse else distances_squared, kind="stable")
+            return [self[i] for i in order.tolist()]
         if isinstance(position, Unit):
             return sorted(
                 self, key=lambda unit: self._bot_object._distance_squared_unit_to_unit(unit, position), reverse=reverse
@@ -492,7 +795,8 @@ class Units(list):
 
         :param other:
         """
-        return self.filter(lambda unit: unit.tag in other)
+        tag_index = self._tag_index
+        return self.subgroup([self[index] for index in sorted({tag_index[tag] for tag in other if tag in tag_index})])
 
     def tags_not_in(self, other: Union[Set[int], List[int], Dict[int, Any]]) -> Units:
         """
@@ -507,6 +811,8 @@ class Units(list):
 
         :param other:
         """
+        if not isinstance(other, (set, frozenset, dict)):
+            other = set(other)
         return self.filter(lambda unit: unit.tag not in other)
 
     def of_type(self, other: Union[UnitTypeId, Set[UnitTypeId], List[UnitTypeId], Dict[UnitTypeId, Any]]) -> Units:
@@ -523,6 +829,9 @@ class Units(list):
             other = {other}
         elif isinstance(other, list):
             other = set(other)
+        positions = self._positions_of_types({type_id.value for type_id in other})
+        if positions is not None:
+            return self._subgroup_of_positions(positions)
         return self.filter(lambda unit: unit.type_id in other)
 
     def exclude_type(self, other: Union[UnitTypeId, Set[UnitTypeId], List[UnitTypeId], Dict[UnitTypeId, Any]]) -> Units:
@@ -539,6 +848,9 @@ class Units(list):
             other = {other}
         elif isinstance(other, list):
             other = set(other)
+        positions = self._positions_of_types({type_id.value for type_id in other}, exclude=True)
+        if positions is not None:
+            return self._subgroup_of_positions(positions)
         return self.filter(lambda unit: unit.type_id not in other)
 
     def same_tech(self, other: Set[UnitTypeId]) -> Units:
@@ -574,6 +886,16 @@ class Units(list):
         for unitType in other:
             for same in unit_data[unitType.value]._proto.tech_alias:
                 tech_alias_types.add(same)
+        type_index = self._type_index
+        if type_index is not None:
+            # Decide once per present unit type instead of once per unit
+            matching_types = {
+                type_id
+                for type_id in type_index
+                if type_id in tech_alias_types
+                or any(same in tech_alias_types for same in unit_data[type_id]._proto.tech_alias)
+            }
+            return self._subgroup_of_positions(self._positions_of_types(matching_types))
         return self.filter(
             lambda unit: unit._proto.unit_type in tech_alias_types
             or any(same in tech_alias_types for same in unit._type_data._proto.tech_alias)
@@ -607,6 +929,15 @@ class Units(list):
         for unitType in other:
             unit_alias_types.add(unit_data[unitType.value]._proto.unit_alias)
         unit_alias_types.discard(0)
+        type_index = self._type_index
+        if type_index is not None:
+            # Decide once per present unit type instead of once per unit
+            matching_types = {
+                type_id
+                for type_id in type_index
+                if type_id in unit_alias_types or unit_data[type_id]._proto.unit_alias in unit_alias_types
+            }
+            return self._subgroup_of_positions(self._positions_of_types(matching_types))
         return self.filter(
             lambda unit: unit._proto.unit_type in unit_alias_types
             or unit._type_data._proto.unit_alias in unit_alias_types
@@ -616,6 +947,9 @@ class Units(list):
     def center(self) -> Point2:
         """ Returns the central position of all units. """
         assert self, f"Units object is empty"
+        indices, positions = self._store_positions()
+        if indices is not None:
+            return Point2(positions.mean(axis=0).tolist())
         amount = self.amount
         return Point2(
             (
@@ -718,7 +1052,16 @@ class Units(list):
 
 class UnitSelection(Units):
     def __init__(self, parent, selection=None):
-        if isinstance(selection, (UnitTypeId)):
+        if isinstance(selection, (UnitTypeId, set)) and parent._type_index_enabled:
+            if isinstance(selection, set):
+                assert all(isinstance(t, UnitTypeId) for t in selection), f"Not all ids in selection are of type UnitTypeId"
+                type_ids = {type_id.value for type_id in selection}
+            else:
+                type_ids = {selection.value}
+            positions = parent._positions_of_types(type_ids)
+            super().__init__((parent[i] for i in positions), parent._bot_object)
+            self._inherit_store_indices(parent, positions)
+        elif isinstance(selection, (UnitTypeId)):
             super().__init__((unit for unit in parent if unit.type_id == selection), parent._bot_object)
         elif isinstance(selection, set):
             assert all(isinstance(t, UnitTypeId) for t in selection), f"Not all ids in selection are of type UnitTypeId"
@@ -0,0 +1,140 @@
+"""
+Game data and units for tests that need a bot, built from protos instead of a running client
+"""
+
+import sys, os
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/.."))
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/../lib/"))
+
+from types import SimpleNamespace
+
+from s2clientprotocol import data_pb2, raw_pb2, sc2api_pb2
+
+from lib.sc2.damage_matrix import DamageEngine
+from lib.sc2.game_data import GameData
+from lib.sc2.ids.unit_typeid import UnitTypeId
+from lib.sc2.unit import Unit
+from lib.sc2.unit_type_table import UnitTypeTable
+
+GAME_LOOP = 100
+
+GROUND = data_pb2.Weapon.Ground
+AIR = data_pb2.Weapon.Air
+ANY = data_pb2.Weapon.Any
+
+LIGHT = data_pb2.Light
+ARMORED = data_pb2.Armored
+BIOLOGICAL = data_pb2.Biological
+MECHANICAL = data_pb2.Mechanical
+STRUCTURE = data_pb2.Structure
+
+# Unit type: (attributes, armor, movement speed, weapons as (target, damage, attacks, range, cooldown, bonuses))
+UNIT_TYPES = {
+    UnitTypeId.ZERGLING: ([LIGHT, BIOLOGICAL], 0, 4.13, [(GROUND, 5, 1, 0.1, 0.497, [])]),
+    UnitTypeId.ROACH: ([ARMORED, BIOLOGICAL], 1, 3.15, [(GROUND, 16, 1, 4, 1.43, [])]),
+    UnitTypeId.HYDRALISK: ([LIGHT, BIOLOGICAL], 0, 3.15, [(ANY, 12, 1, 5, 0.59, [])]),
+    UnitTypeId.MUTALISK: ([LIGHT, BIOLOGICAL], 0, 5.6, [(ANY, 9, 1, 3, 1.09, [])]),
+    UnitTypeId.ULTRALISK: ([ARMORED, BIOLOGICAL], 2, 4.13, [(GROUND, 35, 1, 1, 0.61, [])]),
+    UnitTypeId.MARINE: ([LIGHT, BIOLOGICAL], 0, 3.15, [(ANY, 6, 1, 5, 0.61, [])]),
+    UnitTypeId.MARAUDER: ([ARMORED, BIOLOGICAL], 1, 3.15, [(GROUND, 10, 1, 6, 1.07, [(ARMORED, 10)])]),
+    UnitTypeId.THOR: ([ARMORED, MECHANICAL], 1, 2.62, [(GROUND, 30, 2, 7, 0.91, []),
+                                                      (AIR, 6, 4, 10, 2.14, [(LIGHT, 6)])]),
+    UnitTypeId.STALKER: ([ARMORED, MECHANICAL], 1, 4.13, [(ANY, 13, 1, 6, 1.34, [(ARMORED, 5)])]),
+    UnitTypeId.ZEALOT: ([LIGHT, BIOLOGICAL], 1, 3.15, [(GROUND, 8, 2, 0.1, 0.86, [])]),
+    UnitTypeId.PROBE: ([LIGHT, MECHANICAL], 0, 3.94, [(GROUND, 5, 1, 0.1, 1.07, [])]),
+    UnitTypeId.DRONE: ([LIGHT, BIOLOGICAL], 0, 3.94, [(GROUND, 5, 1, 0.1, 1.07, [])]),
+    UnitTypeId.SPINECRAWLER: ([ARMORED, BIOLOGICAL, STRUCTURE], 2, 0, [(GROUND, 25, 1, 7, 1.32, [(ARMORED, 5)])]),
+    UnitTypeId.PHOTONCANNON: ([ARMORED, STRUCTURE], 1, 0, [(ANY, 20, 1, 7, 1.25, [])]),
+    UnitTypeId.PYLON: ([ARMORED, STRUCTURE], 1, 0, []),
+    UnitTypeId.BANELING: ([BIOLOGICAL], 0, 3.5, []),
+    UnitTypeId.ADEPTPHASESHIFT: ([LIGHT], 0, 4.13, []),
+}
+
+# Unit type: (health, shield, flying)
+VITALS = {
+    UnitTypeId.ZERGLING: (35, 0, False),
+    UnitTypeId.ROACH: (145, 0, False),
+    UnitTypeId.HYDRALISK: (90, 0, False),
+    UnitTypeId.MUTALISK: (120, 0, True),
+    UnitTypeId.ULTRALISK: (500, 0, False),
+    UnitTypeId.MARINE: (45, 0, False),
+    UnitTypeId.MARAUDER: (125, 0, False),
+    UnitTypeId.THOR: (400, 0, False),
+    UnitTypeId.STALKER: (80, 80, False),
+    UnitTypeId.ZEALOT: (100, 50, False),
+    UnitTypeId.PROBE: (20, 20, False),
+    UnitTypeId.DRONE: (40, 0, False),
+    UnitTypeId.SPINECRAWLER: (300, 0, False),
+    UnitTypeId.PHOTONCANNON: (150, 150, False),
+    UnitTypeId.PYLON: (200, 200, False),
+    UnitTypeId.BANELING: (30, 0, False),
+    UnitTypeId.ADEPTPHASESHIFT: (1, 0, False),
+}
+
+
+def make_game_data() -> GameData:
+    data = sc2api_pb2.ResponseData()
+    for unit_type, (attributes, armor, movement_speed, weapons) in UNIT_TYPES.items():
+        proto = data.units.add()
+        proto.unit_id = unit_type.value
+        proto.name = unit_type.name
+        proto.available = True
+        proto.attributes.extend(attributes)
+        proto.armor = armor
+        proto.movement_speed = movement_speed
+        for target, damage, attacks, weapon_range, cooldown, bonuses in weapons:
+            weapon = proto.weapons.add()
+            weapon.type = target
+            weapon.damage = damage
+            weapon.attacks = attacks
+            weapon.range = weapon_range
+            weapon.speed = cooldown
+            for attribute, bonus in bonuses:
+                damage_bonus = weapon.damage_bonus.add()
+                damage_bonus.attribute = attribute
+                damage_bonus.bonus = bonus
+    return GameData(data)
+
+
+def make_bot(upgrades=frozenset()):
+    """
+    Returns an object with the attributes of BotAI that units, clustering and the damage engine use
+    """
+    game_data = make_game_data()
+    table = UnitTypeTable(game_data)
+    damage_engine = DamageEngine(game_data, table)
+    damage_engine.refresh(set(upgrades))
+    return SimpleNamespace(
+        state=SimpleNamespace(game_loop=GAME_LOOP, upgrades=set(upgrades)),
+        _game_data=game_data,
+        _unit_store=None,
+        unit_type_table=table,
+        damage_engine=damage_engine,
+    )
+
+
+def make_proto(tag=1, unit_type: UnitTypeId = UnitTypeId.MARINE, position=(0, 0), alliance=1, health=None,
+               shield=None, attack_upgrade_level=0, armor_upgrade_level=0, height=0) -> raw_pb2.Unit:
+    health_max, shield_max, flying = VITALS[unit_type]
+    proto = raw_pb2.Unit()
+    proto.tag = tag
+    proto.unit_type = unit_type.value
+    proto.alliance = alliance
+    proto.pos.x, proto.pos.y = position
+    proto.pos.z = height
+    proto.radius = 0.5
+    proto.build_progress = 1
+    proto.health_max = health_max
+    proto.health = health_max if health is None else health
+    proto.shield_max = shield_max
+    proto.shield = shield_max if shield is None else shield
+    proto.is_flying = flying
+    proto.attack_upgrade_level = attack_upgrade_level
+    proto.armor_upgrade_level = armor_upgrade_level
+    return proto
+
+
+def make_unit(bot, unit_type: UnitTypeId, position=(0, 0), tag=1, alliance=1, health=None, shield=None,
+              attack_upgrade_level=0, armor_upgrade_level=0, height=0) -> Unit:
+    return Unit(make_proto(tag, unit_type, position, alliance, health, shield, attack_upgrade_level,
+                           armor_upgrade_level, height), bot)
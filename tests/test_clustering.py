@@ -5,10 +5,16 @@ sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/../lib/"))
 import functools
 import unittest
 import random
+from types import SimpleNamespace
+from unittest import mock
 
+from lib.sc2.ids.unit_typeid import UnitTypeId
 from lib.sc2.position import Point2
 
 import lambdanaut.clustering as clustering
+import lambdanaut.const2 as const2
+
+from fixtures import make_bot, make_unit
 
 
 class TestClustering(unittest.TestCase):
@@ -35,19 +41,23 @@ class TestClustering(unittest.TestCase):
         self.assertIn(p2, cluster)
         self.assertIn(p3, cluster)
         self.assertEqual(cluster.position, p2)
+        self.assertAlmostEqual(cluster.radius, p2.distance_to(p3))
+        self.assertEqual(clustering.Cluster(p2).radius, 0)
 
     def test_k_means(self):
+        random.seed(0)
         points = self.get_random_points()
 
-        clusters = clustering.get_fresh_clusters(points, n=5)
+        clusters = clustering.get_fresh_clusters(points, k=5)
 
         clustering.k_means_update(clusters, points)
 
         self.assertEqual(len(clusters), 5)
 
-        for cluster in clusters:
+        # Clusters merged into a close neighbour are left empty, on a point of the merged data
+        for cluster in filter(None, clusters):
             average_of_cluster = functools.reduce(lambda x, y: x + y, cluster) / len(cluster)
-            self.assertEqual(cluster.position, average_of_cluster)
+            self.assertAlmostEqual(cluster.position.distance_to(average_of_cluster), 0)
 
         points = self.get_random_points()
 
@@ -55,6 +65,176 @@ class TestClustering(unittest.TestCase):
 
         self.assertEqual(len(clusters), 5)
 
+    def test_k_means_warm_start(self):
+        blobs = [
+            [Point2((random.randint(0, 10), random.randint(0, 10))) for i in range(20)],
+            [Point2((random.randint(50, 60), random.randint(50, 60))) for i in range(20)],
+            [Point2((random.randint(100, 110), random.randint(0, 10))) for i in range(20)],
+        ]
+        points = [point for blob in blobs for point in blob]
+
+        # Clusters that already sit on the center of their blob
+        clusters = [
+            clustering.Cluster(functools.reduce(lambda x, y: x + y, blob) / len(blob), blob)
+            for blob in blobs]
+
+        clustering.k_means_update(clusters, points, max_iterations=1)
+
+        for cluster, blob in zip(clusters, blobs):
+            average_of_blob = functools.reduce(lambda x, y: x + y, blob) / len(blob)
+            self.assertAlmostEqual(cluster.position.distance_to(average_of_blob), 0)
+            self.assertEqual(list(cluster), blob)
+
+
+def make_army(blobs, seed=0):
+    """
+    Objects with the tag and position IncrementalClustering reads, 10 around each blob center
+    """
+    rng = random.Random(seed)
+    return [SimpleNamespace(tag=len(blobs) * i + j, position=Point2((x + rng.uniform(-2, 2), y + rng.uniform(-2, 2))))
+            for i in range(10) for j, (x, y) in enumerate(blobs)]
+
+
+def move(unit, offset):
+    return SimpleNamespace(tag=unit.tag, position=unit.position + Point2(offset))
+
+
+class TestIncrementalClustering(unittest.TestCase):
+    BLOBS = [(20, 20), (80, 20), (50, 90)]
+
+    def setUp(self):
+        random.seed(0)
+        self.army = make_army(self.BLOBS)
+        # Warm started on the blobs, so the first full update can't merge two of them
+        self.clusters = clustering.get_fresh_clusters(self.army, k=3)
+        for cluster, blob in zip(self.clusters, self.BLOBS):
+            cluster.position = Point2(blob)
+        self.updater = clustering.IncrementalClustering(self.clusters)
+        # The first update is a full one
+        self.updater.update(self.army)
+
+    def cluster_of(self, tag):
+        clusters = [cluster for cluster in self.clusters if any(unit.tag == tag for unit in cluster)]
+        self.assertEqual(len(clusters), 1)
+        return clusters[0]
+
+    def test_clusters_are_stable(self):
+        clusters = list(self.clusters)
+        ids = [cluster.id for cluster in clusters]
+        members = [{unit.tag for unit in cluster} for cluster in clusters]
+
+        army = self.army
+        for _ in range(5):
+            army = [move(unit, (0.5, -0.5)) for unit in army]
+            self.updater.update(army)
+
+        self.assertEqual(len(self.clusters), 3)
+        for cluster, old_cluster, old_id, old_members in zip(self.clusters, clusters, ids, members):
+            self.assertIs(cluster, old_cluster)
+            self.assertEqual(cluster.id, old_id)
+            self.assertEqual({unit.tag for unit in cluster}, old_members)
+
+    def test_reassigns_only_moved_units(self):
+        unit = self.army[0]
+        cluster = self.cluster_of(unit.tag)
+
+        # Moving less than the threshold keeps the unit where it was, even without anybody else moving
+        threshold = clustering.MOVE_THRESHOLD
+        army = [move(unit, (threshold * 0.9, 0))] + self.army[1:]
+        self.updater.update(army)
+        self.assertEqual(self.updater.reassigned, 0)
+        self.assertIs(self.cluster_of(unit.tag), cluster)
+
+        # Moving into another blob reassigns only that unit
+        army = [SimpleNamespace(tag=unit.tag, position=Point2(self.BLOBS[1]))] + self.army[1:]
+        self.updater.update(army)
+        self.assertEqual(self.updater.reassigned, 1)
+        self.assertIs(self.cluster_of(unit.tag), self.cluster_of(self.army[1].tag))
+
+    def test_far_units_seed_empty_clusters(self):
+        # Two blobs leave one of three clusters empty, the two clusters in the first blob are merged
+        army = make_army(self.BLOBS[:2])
+        clusters = clustering.get_fresh_clusters(army, k=3)
+        for cluster, position in zip(clusters, [self.BLOBS[0], self.BLOBS[1], (24, 20)]):
+            cluster.position = Point2(position)
+        updater = clustering.IncrementalClustering(clusters)
+        updater.update(army)
+        empty = [cluster for cluster in clusters if not cluster]
+        self.assertEqual(len(empty), 1)
+
+        far_unit = SimpleNamespace(tag=1000, position=Point2((50, 150)))
+        updater.update(army + [far_unit])
+        self.assertEqual(list(empty[0]), [far_unit])
+        self.assertEqual(empty[0].position, far_unit.position)
+
+    def test_emptied_army_clears_clusters(self):
+        self.updater.update([])
+        self.assertTrue(all(not cluster for cluster in self.clusters))
+        self.assertEqual(len(self.clusters), 3)
+
+    def test_full_update_interval(self):
+        updater = clustering.IncrementalClustering(self.clusters, full_update_interval=4)
+        with mock.patch.object(clustering, 'k_means_update', wraps=clustering.k_means_update) as k_means_update:
+            for _ in range(9):
+                updater.update(self.army)
+        # Updates 0, 4 and 8 are full updates
+        self.assertEqual(k_means_update.call_count, 3)
+
+
+def per_unit_strength_terms(units, ignore_workers, ignore_defensive_structures):
+    """
+    The unit filters and sums of the original per-unit `Lambdanaut.relative_army_strength`
+    """
+    units = [u for u in units
+             if (not u.is_structure or u.can_attack_ground or u.can_attack_air)
+             and (not ignore_defensive_structures or u not in const2.DEFENSIVE_STRUCTURES)
+             and (ignore_workers or u.type_id not in const2.WORKERS)
+             and u not in const2.RELATIVE_ARMY_STRENGTH_TO_IGNORE]
+
+    def adjusted_dps(u):
+        default_dps = const2.DEFAULT_DPS_MAP.get(u.type_id)
+        if default_dps is not None:
+            return default_dps
+        if u.ground_dps > 0 >= u.air_dps:
+            return u.ground_dps
+        elif u.air_dps > 0 >= u.ground_dps:
+            return u.air_dps
+        return (u.ground_dps + u.air_dps) / 2
+
+    melee = [u for u in units if u.ground_range < 1.5 and u.can_attack_ground]
+    ranged = [u for u in units if not (u.ground_range < 1.5 and u.can_attack_ground)]
+
+    return (
+        len(melee),
+        len(ranged),
+        sum(adjusted_dps(u) for u in melee),
+        sum(adjusted_dps(u) for u in ranged),
+        sum(u.health + u.shield for u in units),
+        sum(u.position3d.z for u in units) / len(units) if units else 0,
+    )
+
+
+class TestClusterStats(unittest.TestCase):
+    def test_strength_terms_match_per_unit_computation(self):
+        rng = random.Random(0)
+        bot = make_bot()
+        unit_types = [UnitTypeId.ZERGLING, UnitTypeId.ROACH, UnitTypeId.MARINE, UnitTypeId.STALKER,
+                      UnitTypeId.ZEALOT, UnitTypeId.PROBE, UnitTypeId.DRONE, UnitTypeId.SPINECRAWLER,
+                      UnitTypeId.PHOTONCANNON, UnitTypeId.PYLON, UnitTypeId.BANELING, UnitTypeId.ADEPTPHASESHIFT,
+                      UnitTypeId.MUTALISK, UnitTypeId.THOR]
+
+        for trial in range(30):
+            units = [make_unit(bot, rng.choice(unit_types), (rng.uniform(0, 50), rng.uniform(0, 50)), tag=tag,
+                               health=rng.uniform(1, 30), height=rng.uniform(8, 12))
+                     for tag in range(1, rng.randint(0, 25) + 1)]
+            stats = clustering.get_stats(units)
+
+            for ignore_workers in (False, True):
+                for ignore_defensive_structures in (False, True):
+                    self.assertEqual(
+                        stats.strength_terms(ignore_workers, ignore_defensive_structures),
+                        per_unit_strength_terms(units, ignore_workers, ignore_defensive_structures))
+
 
 if __name__ == '__main__':
     unittest.main()
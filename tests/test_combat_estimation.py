@@ -0,0 +1,152 @@
+import sys, os
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/.."))
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/../lib/"))
+
+import math
+import unittest
+
+import numpy as np
+
+from lib.sc2.ids.unit_typeid import UnitTypeId
+from lib.sc2.position import Point2
+from lib.sc2.units import Units
+
+import lambdanaut.clustering as clustering
+from lambdanaut.combat_estimation import CombatEstimator, lanchester
+
+from fixtures import make_bot, make_unit
+
+
+def relative_army_strength_pairwise(terms_1, terms_2, ignore_height_difference=True):
+    """
+    The original Lambdanaut.relative_army_strength, from the point where the units are summed up
+    """
+    u1_melee, u1_ranged, u1_melee_dps, u1_ranged_dps, u1_health, u1_avg_height = terms_1
+    u2_melee, u2_ranged, u2_melee_dps, u2_ranged_dps, u2_health, u2_avg_height = terms_2
+    u1 = u1_melee + u1_ranged
+    u2 = u2_melee + u2_ranged
+
+    if u1_melee_dps == 0 and u1_ranged_dps == 0 and u2_melee_dps == 0 and u2_ranged_dps == 0:
+        return 0
+
+    if u1_health == 0 and u2_health == 0:
+        return 0
+    if u1_health == 0 or not u1:
+        return -u2
+    elif u2_health == 0 or not u2:
+        return u1
+
+    u1_avg_health = u1_health / u1
+    u2_avg_health = u2_health / u2
+
+    u1_melee_avg_dps = u1_melee_dps / u1_melee if u1_melee_dps else 0
+    u1_ranged_avg_dps = u1_ranged_dps / u1_ranged if u1_ranged else 0
+
+    u2_melee_avg_dps = u2_melee_dps / u2_melee if u2_melee_dps else 0
+    u2_ranged_avg_dps = u2_ranged_dps / u2_ranged if u2_ranged else 0
+
+    if not ignore_height_difference:
+        if u1_avg_height * 0.85 > u2_avg_height:
+            u1_ranged_avg_dps *= 1.5
+        elif u2_avg_height * 0.85 > u1_avg_height:
+            u2_ranged_avg_dps *= 1.5
+
+    u1_loss_rate = (u1_melee_avg_dps + u1_ranged_avg_dps) / u2_avg_health
+    u2_loss_rate = (u2_melee_avg_dps + u2_ranged_avg_dps) / u1_avg_health
+
+    power_m = 1.2
+    power_r = 1.6
+
+    u1_melee_powered = u1_melee ** power_m
+    u1_ranged_powered = u1_ranged ** power_r
+
+    u2_melee_powered = u2_melee ** power_m
+    u2_ranged_powered = u2_ranged ** power_r
+
+    u1_term = u1_loss_rate * (u1_melee_powered + u1_ranged_powered)
+    u2_term = u2_loss_rate * (u2_melee_powered + u2_ranged_powered)
+
+    if u1_term > u2_term:
+        return math.sqrt((u1_melee_powered + u1_ranged_powered)
+                         - u2_loss_rate / u1_loss_rate * (u2_melee_powered + u2_ranged_powered))
+    elif u2_term > u1_term:
+        return -math.sqrt((u2_melee_powered + u2_ranged_powered)
+                          - u1_loss_rate / u2_loss_rate * (u1_melee_powered + u1_ranged_powered))
+
+    return 0
+
+
+def random_terms(rng, groups):
+    """
+    Strength terms of random groups, including groups without melee or ranged units, dps or health
+    """
+    melee_count = rng.randint(0, 15, groups) * (rng.uniform(size=groups) > 0.2)
+    ranged_count = rng.randint(0, 15, groups) * (rng.uniform(size=groups) > 0.2)
+    melee_dps = melee_count * rng.uniform(5, 20, groups) * (rng.uniform(size=groups) > 0.1)
+    ranged_dps = ranged_count * rng.uniform(5, 20, groups) * (rng.uniform(size=groups) > 0.1)
+    health = (melee_count + ranged_count) * rng.uniform(20, 200, groups) * (rng.uniform(size=groups) > 0.05)
+    height = rng.choice([8, 10, 12], groups)
+    return np.stack([melee_count, ranged_count, melee_dps, ranged_dps, health, height], axis=1).astype(float)
+
+
+class TestLanchester(unittest.TestCase):
+    def check(self, terms_1, terms_2, ignore_height_difference):
+        matrix = lanchester(terms_1, terms_2, ignore_height_difference)
+        self.assertEqual(matrix.shape, (len(terms_1), len(terms_2)))
+        for i, group_1 in enumerate(terms_1.tolist()):
+            for j, group_2 in enumerate(terms_2.tolist()):
+                expected = relative_army_strength_pairwise(group_1, group_2, ignore_height_difference)
+                self.assertAlmostEqual(matrix[i, j], expected, places=9, msg=(group_1, group_2))
+
+    def test_matches_pairwise_formula(self):
+        rng = np.random.RandomState(0)
+        for ignore_height_difference in (True, False):
+            self.check(random_terms(rng, 40), random_terms(rng, 30), ignore_height_difference)
+
+    def test_hand_checked(self):
+        # 10 ranged units with 10 dps and 50 health against 5 of the same: sqrt(10^1.6 - 5^1.6)
+        terms_1 = np.array([[0, 10, 0, 100, 500, 0]], dtype=float)
+        terms_2 = np.array([[0, 5, 0, 50, 250, 0]], dtype=float)
+        self.assertAlmostEqual(lanchester(terms_1, terms_2)[0, 0], math.sqrt(10 ** 1.6 - 5 ** 1.6))
+        self.assertAlmostEqual(lanchester(terms_2, terms_1)[0, 0], -math.sqrt(10 ** 1.6 - 5 ** 1.6))
+        self.assertEqual(lanchester(terms_1, terms_1)[0, 0], 0)
+
+
+class TestCombatEstimator(unittest.TestCase):
+    def setUp(self):
+        self.bot = make_bot()
+        self.estimator = CombatEstimator(self.bot)
+        self.marines = Units([make_unit(self.bot, UnitTypeId.MARINE, tag=tag) for tag in range(1, 9)], self.bot)
+        self.zerglings = Units([make_unit(self.bot, UnitTypeId.ZERGLING, tag=tag, alliance=4)
+                                for tag in range(10, 22)], self.bot)
+
+    def test_memoizes_units_by_identity(self):
+        strength = self.estimator.relative_strength(self.marines, self.zerglings)
+        self.assertEqual(self.estimator.relative_strength(self.marines, self.zerglings), strength)
+        self.assertEqual((self.estimator.evaluations, self.estimator.memo_hits), (1, 1))
+
+        # An equal but different group is evaluated again
+        marines = Units(list(self.marines), self.bot)
+        self.assertEqual(self.estimator.relative_strength(marines, self.zerglings), strength)
+        self.assertEqual((self.estimator.evaluations, self.estimator.memo_hits), (2, 1))
+
+    def test_memoizes_clusters_by_stats(self):
+        cluster = clustering.Cluster(Point2((0, 0)), self.marines)
+        strength = self.estimator.relative_strength(cluster, self.zerglings)
+        self.assertEqual(self.estimator.relative_strength(cluster, self.zerglings), strength)
+        self.assertEqual(self.estimator.memo_hits, 1)
+
+        # A changed cluster gets new stats
+        cluster.pop()
+        self.assertNotEqual(self.estimator.relative_strength(cluster, self.zerglings), strength)
+        self.assertEqual(self.estimator.evaluations, 2)
+
+    def test_memo_lasts_one_frame(self):
+        self.estimator.relative_strength(self.marines, self.zerglings)
+        self.bot.state.game_loop += 1
+        self.estimator.relative_strength(self.marines, self.zerglings)
+        self.assertEqual((self.estimator.evaluations, self.estimator.memo_hits), (2, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
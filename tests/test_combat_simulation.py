@@ -0,0 +1,158 @@
+import sys, os
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/.."))
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/../lib/"))
+
+import math
+import unittest
+
+import numpy as np
+
+from lib.sc2.ids.unit_typeid import UnitTypeId
+
+from lambdanaut.combat_simulation import CombatSimulator, CombatTables, _Side, simulate_units
+
+from fixtures import make_bot, make_unit
+
+ENEMY = 4
+
+
+def make_army(bot, unit_type, amount, first_tag=1, alliance=1, **kwargs):
+    return [make_unit(bot, unit_type, tag=first_tag + i, alliance=alliance, **kwargs) for i in range(amount)]
+
+
+class TestSide(unittest.TestCase):
+    def setUp(self):
+        bot = make_bot()
+        self.tables = CombatTables.from_units(bot, make_army(bot, UnitTypeId.MARINE, 1))
+
+    def make_side(self, count, health):
+        return _Side(self.tables, np.array([[0]]), np.array([[count]], dtype=float), np.array([[health]], dtype=float),
+                     np.array([[0]], dtype=float))
+
+    def test_damaged_units_are_alive(self):
+        # 10 marines at 20 of 45 health are 10 marines, not the 5 that 200 health would make at full health
+        side = self.make_side(10, 200)
+        self.assertEqual(side.alive().tolist(), [[10]])
+
+    def test_focused_damage_kills_whole_units(self):
+        side = self.make_side(10, 200)
+        hit = np.array([[0]])
+
+        # 50 damage kills the first marine at 20 health, the second one and leaves the third one at 10
+        side.take_damage(hit, np.array([[50.]]))
+        self.assertEqual(side.alive().tolist(), [[8]])
+        self.assertAlmostEqual(side.front_health[0, 0], 10)
+
+        side.take_damage(hit, np.array([[9.]]))
+        self.assertEqual(side.alive().tolist(), [[8]])
+        side.take_damage(hit, np.array([[1.]]))
+        self.assertEqual(side.alive().tolist(), [[7]])
+
+        side.take_damage(hit, np.array([[1000.]]))
+        self.assertEqual(side.alive().tolist(), [[0]])
+        self.assertEqual(side.health_pool.tolist(), [[0]])
+
+
+    def test_shields_of_the_focused_unit_only(self):
+        bot = make_bot()
+        tables = CombatTables.from_units(bot, make_army(bot, UnitTypeId.ZEALOT, 1))
+        side = _Side(tables, np.array([[0]]), np.array([[2]], dtype=float), None, None)
+        hit = np.array([[0]])
+
+        # 120 damage takes the 50 shields and 70 health of the first zealot, the second one keeps its shields
+        side.take_damage(hit, np.array([[120.]]))
+        self.assertEqual(side.alive().tolist(), [[2]])
+        self.assertAlmostEqual(side.front_shield[0, 0], 0)
+        self.assertAlmostEqual(side.front_health[0, 0], 30)
+        self.assertAlmostEqual(side.shield_pool[0, 0], 50)
+        self.assertAlmostEqual(side.health_pool[0, 0], 130)
+
+        # 40 damage kills the first zealot and takes 10 shields of the second one
+        side.take_damage(hit, np.array([[40.]]))
+        self.assertEqual(side.alive().tolist(), [[1]])
+        self.assertAlmostEqual(side.front_shield[0, 0], 40)
+        self.assertAlmostEqual(side.front_health[0, 0], 100)
+        self.assertAlmostEqual(side.shield_pool[0, 0], 40)
+
+        side.take_damage(hit, np.array([[140.]]))
+        self.assertEqual(side.alive().tolist(), [[0]])
+        self.assertEqual(side.shield_pool.tolist(), [[0]])
+        self.assertEqual(side.health_pool.tolist(), [[0]])
+
+
+class TestCombatSimulator(unittest.TestCase):
+    def setUp(self):
+        self.bot = make_bot()
+
+    def test_damaged_units_keep_fighting(self):
+        marines = make_army(self.bot, UnitTypeId.MARINE, 10, health=20)
+        pylon = make_army(self.bot, UnitTypeId.PYLON, 1, first_tag=100, alliance=ENEMY)
+        result = simulate_units(self.bot, marines, pylon)
+        self.assertEqual(result.winner.tolist(), [1])
+        self.assertEqual(result.remaining_1.tolist(), [[10]])
+        self.assertEqual(result.win_ratio.tolist(), [1])
+
+    def test_ultralisk_kills_zerglings_one_after_another(self):
+        ultralisk = make_army(self.bot, UnitTypeId.ULTRALISK, 1)
+        zerglings = make_army(self.bot, UnitTypeId.ZERGLING, 4, first_tag=10, alliance=ENEMY)
+        time_step = 0.25
+        result = simulate_units(self.bot, ultralisk, zerglings, start_distance=0, time_step=time_step)
+
+        # One 35 damage attack per 0.61 seconds, a zergling dies for every 35 damage
+        damage_per_step = 35 / 0.61 * time_step
+        steps = math.ceil(4 * 35 / damage_per_step)
+        self.assertEqual(result.winner.tolist(), [1])
+        self.assertEqual(result.remaining_1.tolist(), [[1]])
+        self.assertEqual(result.remaining_2.tolist(), [[0]])
+        self.assertAlmostEqual(result.duration[0], steps * time_step)
+
+    def test_zealots_against_zerglings(self):
+        # A zealot kills a zergling every 2.2 seconds, three zerglings take its 150 health and shields in about 6
+        zealot = make_army(self.bot, UnitTypeId.ZEALOT, 1)
+        zerglings = make_army(self.bot, UnitTypeId.ZERGLING, 3, first_tag=10, alliance=ENEMY)
+        result = simulate_units(self.bot, zealot, zerglings, start_distance=0)
+        self.assertEqual(result.winner.tolist(), [1])
+        self.assertEqual(result.remaining_1.tolist(), [[1]])
+
+        zerglings = make_army(self.bot, UnitTypeId.ZERGLING, 6, first_tag=10, alliance=ENEMY)
+        result = simulate_units(self.bot, zealot, zerglings, start_distance=0)
+        self.assertEqual(result.winner.tolist(), [2])
+        self.assertEqual(result.remaining_2.tolist(), [[5]])
+
+        # Six zerglings focus one of two zealots and kill it after about 4 seconds, while the second one
+        # keeps its shields. Stripping the shields of both first would save the focused zealot.
+        zealots = make_army(self.bot, UnitTypeId.ZEALOT, 2)
+        zerglings = make_army(self.bot, UnitTypeId.ZERGLING, 6, first_tag=10, alliance=ENEMY)
+        result = simulate_units(self.bot, zealots, zerglings, start_distance=0)
+        self.assertEqual(result.winner.tolist(), [1])
+        self.assertEqual(result.remaining_1.tolist(), [[1]])
+
+    def test_mirror_matchup_is_a_draw(self):
+        bot = self.bot
+        tables = CombatTables.from_units(bot, make_army(bot, UnitTypeId.ZERGLING, 1))
+        simulator = CombatSimulator(tables)
+        counts = np.array([[5], [20]], dtype=float)
+        types = np.zeros((2, 1), dtype=np.intp)
+        result = simulator.simulate(types, counts, types, counts)
+        self.assertEqual(result.winner.tolist(), [0, 0])
+        self.assertEqual(result.remaining_1.tolist(), result.remaining_2.tolist())
+
+    def test_batch_matches_single_fights(self):
+        bot = self.bot
+        units = make_army(bot, UnitTypeId.MARINE, 1) + make_army(bot, UnitTypeId.ZERGLING, 1, first_tag=2) \
+            + make_army(bot, UnitTypeId.ROACH, 1, first_tag=3)
+        tables = CombatTables.from_units(bot, units)
+        simulator = CombatSimulator(tables)
+        armies_1 = [{UnitTypeId.MARINE.value: 8}, {UnitTypeId.ROACH.value: 3, UnitTypeId.MARINE.value: 2}, {}]
+        armies_2 = [{UnitTypeId.ZERGLING.value: 12}, {UnitTypeId.ZERGLING.value: 20}, {UnitTypeId.ROACH.value: 1}]
+        batch = simulator.simulate(*tables.slots(armies_1), *tables.slots(armies_2))
+        for i, (army_1, army_2) in enumerate(zip(armies_1, armies_2)):
+            single = simulator.simulate(*tables.slots([army_1]), *tables.slots([army_2]))
+            self.assertEqual(batch.winner[i], single.winner[0])
+            self.assertAlmostEqual(batch.win_ratio[i], single.win_ratio[0])
+            self.assertAlmostEqual(batch.duration[i], single.duration[0])
+        self.assertEqual(batch.winner[2], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
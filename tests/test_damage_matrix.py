@@ -0,0 +1,58 @@
+import sys, os
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/.."))
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/../lib/"))
+
+import itertools
+import unittest
+
+from lib.sc2.damage_matrix import UPGRADE_LEVELS
+from lib.sc2.ids.upgrade_id import UpgradeId
+
+from fixtures import UNIT_TYPES, make_bot, make_unit
+
+OWN = 1
+ENEMY = 4
+
+ATTACKERS = [unit_type for unit_type, (_, _, _, weapons) in UNIT_TYPES.items() if weapons]
+
+
+class TestDamageMatrix(unittest.TestCase):
+    """
+    The damage matrices against Unit.calculate_damage_vs_target for every pair of fixture types and upgrade level
+    """
+
+    def check_side(self, attacker_alliance, target_alliance, upgrades=frozenset()):
+        bot = make_bot(upgrades)
+        engine = bot.damage_engine
+        for attacker_type, target_type in itertools.product(ATTACKERS, UNIT_TYPES):
+            for attack_level, armor_level in itertools.product(range(UPGRADE_LEVELS), repeat=2):
+                attacker = make_unit(bot, attacker_type, tag=1, alliance=attacker_alliance,
+                                     attack_upgrade_level=attack_level)
+                # Targets without shields, whose shield armor is used instead
+                target = make_unit(bot, target_type, tag=2, alliance=target_alliance, shield=0,
+                                   armor_upgrade_level=armor_level)
+                with self.subTest(attacker=attacker_type, target=target_type, attack=attack_level, armor=armor_level):
+                    expected = attacker.calculate_damage_vs_target(target)
+                    damage, cooldown, attack_range = engine.damage_vs(attacker, target)
+                    self.assertAlmostEqual(damage, expected[0], places=4)
+                    if expected[0]:
+                        self.assertAlmostEqual(cooldown, expected[1], places=4)
+                        self.assertAlmostEqual(attack_range, expected[2], places=4)
+                        dps = engine.matrix_of(attacker).dps_matrix([attacker], [target])[0, 0]
+                        self.assertAlmostEqual(dps, expected[0] / expected[1], places=3)
+
+    def test_own_attackers(self):
+        self.check_side(OWN, ENEMY)
+
+    def test_enemy_attackers(self):
+        self.check_side(ENEMY, OWN)
+
+    def test_unit_upgrades(self):
+        # Zergling attack speed for own attackers, ultralisk armor for own targets
+        upgrades = {UpgradeId.ZERGLINGATTACKSPEED, UpgradeId.CHITINOUSPLATING}
+        self.check_side(OWN, ENEMY, upgrades)
+        self.check_side(ENEMY, OWN, upgrades)
+
+
+if __name__ == '__main__':
+    unittest.main()
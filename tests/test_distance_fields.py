@@ -0,0 +1,103 @@
+import sys, os
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/.."))
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/../lib/"))
+
+import math
+import unittest
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from lib.sc2.pixel_map import PixelMap
+from lib.sc2.position import Point2
+
+from lambdanaut.distance_fields import DistanceFields
+from lambdanaut.pathfinding import DIAGONAL_COST
+
+STEPS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+
+
+def step_cost(a, b):
+    return DIAGONAL_COST if a[0] != b[0] and a[1] != b[1] else 1
+
+
+def brute_force_distances(pathable: np.ndarray, target) -> np.ndarray:
+    """
+    (height, width) dijkstra distances to target over the 8-connected pathable cells, built cell by cell
+    """
+    height, width = pathable.shape
+    rows, columns, costs = [], [], []
+    for y, x in np.argwhere(pathable).tolist():
+        for dx, dy in STEPS:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < width and 0 <= ny < height and pathable[ny, nx]:
+                rows.append(y * width + x)
+                columns.append(ny * width + nx)
+                costs.append(step_cost((x, y), (nx, ny)))
+    graph = csr_matrix((costs, (rows, columns)), shape=(width * height, width * height))
+    return dijkstra(graph, indices=target[1] * width + target[0]).reshape((height, width))
+
+
+def random_grid(rng, height=14, width=18) -> np.ndarray:
+    """
+    Pathing grid values: set cells are pathable
+    """
+    return (rng.uniform(size=(height, width)) > 0.3).astype(np.uint8)
+
+
+class TestDistanceFields(unittest.TestCase):
+    def test_distances_and_paths(self):
+        rng = np.random.RandomState(0)
+        for trial in range(5):
+            grid = random_grid(rng)
+            fields = DistanceFields(PixelMap.from_array(grid))
+            pathable = np.argwhere(grid != 0)
+            target_y, target_x = pathable[rng.randint(len(pathable))].tolist()
+            field = fields.field(Point2((target_x, target_y)))
+
+            expected = brute_force_distances(grid != 0, (target_x, target_y))
+            np.testing.assert_allclose(field.distances, expected, rtol=1e-6)
+
+            height, width = grid.shape
+            for y in range(height):
+                for x in range(width):
+                    start = Point2((x, y))
+                    path = field.path(start)
+                    if math.isinf(expected[y, x]):
+                        self.assertIsNone(path)
+                        self.assertIsNone(field.next_step(start))
+                        continue
+
+                    self.assertEqual(path[0], start)
+                    self.assertEqual(path[-1], Point2((target_x, target_y)))
+                    cost = 0
+                    for a, b in zip(path, path[1:]):
+                        self.assertTrue(grid[int(b.y), int(b.x)])
+                        self.assertIn((b.x - a.x, b.y - a.y), STEPS)
+                        cost += step_cost(a, b)
+                    self.assertAlmostEqual(cost, expected[y, x], places=3)
+
+            self.assertIs(fields.field(Point2((target_x, target_y))), field)
+
+    def test_unpathable_target_snaps_to_nearest_pathable_cell(self):
+        grid = np.zeros((10, 10), dtype=np.uint8)
+        grid[:, 6:] = 1
+        fields = DistanceFields(PixelMap.from_array(grid))
+        field = fields.field(Point2((3, 4)))
+
+        self.assertEqual(field.distance(Point2((6, 4))), 0)
+        self.assertAlmostEqual(field.distance(Point2((8, 4))), 2)
+        self.assertEqual(field.path(Point2((9, 4)))[-1], Point2((6, 4)))
+        self.assertEqual(field.distance(Point2((3, 4))), np.inf)
+        self.assertEqual(field.distance(Point2((30, 4))), np.inf)
+
+    def test_target_without_pathable_cells_nearby(self):
+        fields = DistanceFields(PixelMap.from_array(np.zeros((5, 5), dtype=np.uint8)))
+        field = fields.field(Point2((2, 2)))
+        self.assertTrue(np.isinf(field.distances).all())
+        self.assertIsNone(field.path(Point2((1, 1))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import sys, os
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/.."))
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/../lib/"))
+
+import unittest
+
+import numpy as np
+from s2clientprotocol import sc2api_pb2
+
+from lib.sc2.game_state import GameState
+from lib.sc2.map_state import MapStateDecoder
+
+WIDTH = 16
+HEIGHT = 8
+
+
+def make_observation(game_loop, visibility: np.ndarray, creep: np.ndarray):
+    observation = sc2api_pb2.ResponseObservation()
+    observation.observation.game_loop = game_loop
+    map_state = observation.observation.raw_data.map_state
+    for image, data, bits in ((map_state.visibility, visibility.tobytes(), 8),
+                              (map_state.creep, np.packbits(creep).tobytes(), 1)):
+        image.size.x = WIDTH
+        image.size.y = HEIGHT
+        image.bits_per_pixel = bits
+        image.data = data
+    return observation
+
+
+class TestGameStateMapState(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.visibilities = [rng.randint(0, 3, size=(HEIGHT, WIDTH)).astype(np.uint8) for _ in range(3)]
+        self.creeps = [rng.randint(0, 2, size=(HEIGHT, WIDTH)).astype(np.uint8) for _ in range(3)]
+        self.observations = [make_observation(i, visibility, creep)
+                             for i, (visibility, creep) in enumerate(zip(self.visibilities, self.creeps))]
+
+    def test_matches_decoding_without_decoder(self):
+        decoder = MapStateDecoder()
+        for observation, visibility, creep in zip(self.observations, self.visibilities, self.creeps):
+            state = GameState(observation, decoder)
+            plain_state = GameState(observation)
+            np.testing.assert_array_equal(state.visibility.data_numpy, visibility)
+            np.testing.assert_array_equal(state.creep.data_numpy, creep)
+            np.testing.assert_array_equal(plain_state.visibility.data_numpy, visibility)
+            np.testing.assert_array_equal(plain_state.creep.data_numpy, creep)
+            self.assertIsNone(plain_state.map_state_diff)
+
+    def test_reading_an_older_state_keeps_the_newer_maps(self):
+        decoder = MapStateDecoder()
+        first = GameState(self.observations[0], decoder)
+        second = GameState(self.observations[1], decoder)
+
+        # Read the older state after the newer one was created, then the newer one
+        np.testing.assert_array_equal(first.visibility.data_numpy, self.visibilities[0])
+        np.testing.assert_array_equal(second.visibility.data_numpy, self.visibilities[1])
+        np.testing.assert_array_equal(second.creep.data_numpy, self.creeps[1])
+
+        self.assertIsNone(first.map_state_diff)
+        diff = second.map_state_diff
+        np.testing.assert_array_equal(
+            diff.newly_visible, (self.visibilities[1] == 2) & (self.visibilities[0] != 2))
+        np.testing.assert_array_equal(
+            diff.creep_receded, (self.creeps[1] == 0) & (self.creeps[0] != 0))
+
+    def test_diff_between_consecutive_steps(self):
+        decoder = MapStateDecoder()
+        # Steps that don't read their maps still count as previous steps
+        for observation in self.observations[:2]:
+            GameState(observation, decoder)
+        third = GameState(self.observations[2], decoder)
+        np.testing.assert_array_equal(
+            third.map_state_diff.creep_spread, (self.creeps[2] != 0) & (self.creeps[1] == 0))
+        np.testing.assert_array_equal(
+            third.map_state_diff.no_longer_visible, (self.visibilities[2] != 2) & (self.visibilities[1] == 2))
+        self.assertEqual(decoder.allocations, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import sys, os
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/.."))
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/../lib/"))
+
+import math
+import unittest
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from lambdanaut.pathfinding import DIAGONAL_COST, Pathfinder
+
+STEPS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+
+
+def step_cost(a, b):
+    return DIAGONAL_COST if a[0] != b[0] and a[1] != b[1] else 1
+
+
+def grid_graph(data: np.ndarray) -> csr_matrix:
+    """
+    Directed graph of the moves Pathfinder allows: into empty cells, and between set cells
+    """
+    height, width = data.shape
+    rows, columns, costs = [], [], []
+    for y in range(height):
+        for x in range(width):
+            for dx, dy in STEPS:
+                nx, ny = x + dx, y + dy
+                if not (0 <= nx < width and 0 <= ny < height):
+                    continue
+                if data[ny, nx] and not data[y, x]:
+                    continue
+                rows.append(y * width + x)
+                columns.append(ny * width + nx)
+                costs.append(step_cost((x, y), (nx, ny)))
+    return csr_matrix((costs, (rows, columns)), shape=(width * height, width * height))
+
+
+def path_cost(path: np.ndarray) -> float:
+    return sum(step_cost(a, b) for a, b in zip(path.tolist(), path[1:].tolist()))
+
+
+class TestPathfinder(unittest.TestCase):
+    def test_costs_match_dijkstra(self):
+        rng = np.random.RandomState(0)
+        for trial in range(10):
+            data = (rng.uniform(size=(12, 15)) < 0.3).astype(np.uint8)
+            height, width = data.shape
+            pathfinder = Pathfinder.from_array(data)
+            graph = grid_graph(data)
+
+            empty = np.argwhere(data == 0)
+            for start in empty[rng.choice(len(empty), 3, replace=False)].tolist():
+                start = (start[1], start[0])
+                distances = dijkstra(graph, indices=start[1] * width + start[0])
+                for goal_y in range(height):
+                    for goal_x in range(width):
+                        path = pathfinder.find_path_array(start, (goal_x, goal_y))
+                        expected = distances[goal_y * width + goal_x]
+                        if math.isinf(expected):
+                            self.assertIsNone(path)
+                            continue
+
+                        self.assertEqual(tuple(path[0]), start)
+                        self.assertEqual(tuple(path[-1]), (goal_x, goal_y))
+                        for a, b in zip(path.tolist(), path[1:].tolist()):
+                            self.assertIn((b[0] - a[0], b[1] - a[1]), STEPS)
+                            self.assertTrue(graph[a[1] * width + a[0], b[1] * width + b[0]])
+                        self.assertAlmostEqual(path_cost(path), expected, places=6)
+
+    def test_blocked_goal(self):
+        data = np.zeros((5, 5), dtype=np.uint8)
+        data[2, 2] = 1
+        pathfinder = Pathfinder.from_array(data)
+        self.assertIsNone(pathfinder.find_path_array((0, 0), (2, 2)))
+
+        # Walled in goal
+        data = np.zeros((5, 5), dtype=np.uint8)
+        data[1:4, 1:4] = 1
+        data[2, 2] = 0
+        self.assertIsNone(Pathfinder.from_array(data).find_path_array((0, 0), (2, 2)))
+
+    def test_leaves_set_start(self):
+        data = np.zeros((5, 5), dtype=np.uint8)
+        data[0:2, 0:2] = 1
+        path = Pathfinder.from_array(data).find_path_array((0, 0), (3, 3))
+        self.assertEqual(path.tolist(), [[0, 0], [1, 1], [2, 2], [3, 3]])
+
+    def test_off_grid(self):
+        pathfinder = Pathfinder.from_array(np.zeros((5, 5), dtype=np.uint8))
+        self.assertIsNone(pathfinder.find_path_array((-1, 2), (3, 3)))
+        self.assertIsNone(pathfinder.find_path_array((5, 2), (3, 3)))
+        self.assertIsNone(pathfinder.find_path_array((2, 2), (2, 7)))
+        self.assertEqual(pathfinder.find_path_array((2, 2), (2, 2)).tolist(), [[2, 2]])
+
+
+if __name__ == '__main__':
+    unittest.main()
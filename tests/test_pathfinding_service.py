@@ -0,0 +1,108 @@
+import sys, os
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/.."))
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/../lib/"))
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+import threading
+import unittest
+
+import numpy as np
+
+from lib.sc2.pixel_map import PixelMap
+
+from lambdanaut.pathfinding import Pathfinder
+import lambdanaut.pathfinding_service as pathfinding_service
+
+
+def make_pixel_map():
+    # Wall in column 5 with a gap at the top
+    data = np.zeros((10, 10), dtype=np.uint8)
+    data[1:, 5] = 1
+    return PixelMap.from_array(data)
+
+
+class TestPathfindingService(unittest.TestCase):
+    def setUp(self):
+        self.service = pathfinding_service.PathfindingService(max_workers=2)
+        self.pixel_map = make_pixel_map()
+
+    def tearDown(self):
+        self.service.shutdown()
+
+    def block_workers(self):
+        """
+        Runs searches on a single thread of this process that is blocked until the returned event is set,
+        so requests stay queued
+        """
+        gate = threading.Event()
+        self.service._executor = ThreadPoolExecutor(max_workers=1)
+        self.service._executor.submit(gate.wait)
+        return gate
+
+    def test_submit_and_result(self):
+        self.service.start()
+        request = self.service.submit(self.pixel_map, (0, 9), (9, 9))
+
+        async def wait_for_path():
+            return await asyncio.wait_for(request, 30)
+
+        path = asyncio.run(wait_for_path())
+        self.assertTrue(request.done())
+        self.assertIsNone(request.exception())
+        np.testing.assert_array_equal(request.result(), path)
+        np.testing.assert_array_equal(path, Pathfinder(self.pixel_map).find_path_array((0, 9), (9, 9)))
+
+    def test_deadline_expiry(self):
+        gate = self.block_workers()
+        request = self.service.submit(self.pixel_map, (0, 9), (9, 9), deadline=10)
+        no_deadline = self.service.submit(self.pixel_map, (0, 9), (9, 9))
+
+        self.service.expire(10)
+        self.assertFalse(request.done())
+
+        self.service.expire(11)
+        self.assertTrue(request.done())
+        self.assertTrue(request.cancelled())
+        self.assertIsNone(request.result())
+        self.assertEqual(self.service.expired, 1)
+
+        gate.set()
+        self.service._executor.shutdown(wait=True)
+        self.assertIsNotNone(no_deadline.result())
+        self.assertIsNone(request.result())
+
+    def test_completed(self):
+        path = np.array([[0, 0], [1, 1]])
+        request = pathfinding_service.PathfindingService.completed(path)
+        self.assertTrue(request.done())
+        self.assertIs(request.result(), path)
+
+        request = pathfinding_service.PathfindingService.completed(None)
+        self.assertTrue(request.done())
+        self.assertIsNone(request.result())
+
+    def test_frees_retired_grids(self):
+        gate = self.block_workers()
+        request = self.service.submit(self.pixel_map, (0, 9), (9, 9), deadline=10)
+        old_name = self.service._grids[self.pixel_map.grid_id].name
+
+        # A new version of the map gets a new shared grid, the old one is kept while the request reads it
+        self.pixel_map.mark_changed()
+        self.service.submit(self.pixel_map, (0, 9), (9, 9))
+        self.assertNotEqual(self.service._grids[self.pixel_map.grid_id].name, old_name)
+        self.service.expire(10)
+        self.assertEqual(len(self.service._retired_grids), 1)
+
+        self.service.expire(11)
+        self.assertTrue(request.cancelled())
+        self.assertEqual(self.service._retired_grids, [])
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=old_name)
+
+        gate.set()
+
+
+if __name__ == '__main__':
+    unittest.main()
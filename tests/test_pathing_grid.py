@@ -0,0 +1,134 @@
+import sys, os
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/.."))
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/../lib/"))
+
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from lib.sc2.ids.unit_typeid import UnitTypeId
+from lib.sc2.pathing_grid import PathingGridTracker, footprint_box
+from lib.sc2.pixel_map import PixelMap
+
+
+def make_blocker(tag, type_id, position, footprint_radius=0, radius=0, is_mineral_field=False, is_flying=False):
+    """
+    An object with the unit fields the tracker reads.
+    A footprint radius of 0 has no creation ability, like rocks and geysers.
+    """
+    creation_ability = SimpleNamespace(_proto=SimpleNamespace(footprint_radius=footprint_radius)) \
+        if footprint_radius else None
+    return SimpleNamespace(tag=tag, type_id=type_id, position_tuple=position, radius=radius,
+                           is_mineral_field=is_mineral_field, is_flying=is_flying,
+                           _creation_ability=creation_ability)
+
+
+def stamp(data, *blockers):
+    for blocker in blockers:
+        x0, y0, x1, y1 = footprint_box(blocker)
+        data[y0:y1, x0:x1] = 0
+
+
+class TestPathingGridTracker(unittest.TestCase):
+    def setUp(self):
+        # Pathable 20x20 map with a cliff in column 10
+        self.terrain = np.ones((20, 20), dtype=np.uint8)
+        self.terrain[:, 10] = 0
+        self.geyser = make_blocker(1, UnitTypeId.VESPENEGEYSER, (5.5, 5.5), radius=1.8125)
+        self.extractor = make_blocker(2, UnitTypeId.EXTRACTOR, (5.5, 5.5), footprint_radius=1.5)
+        # Rocks whose approximated footprint hangs over the cliff
+        self.rocks = make_blocker(3, UnitTypeId.DESTRUCTIBLEROCK6X6, (11, 15), radius=2)
+
+    def make_tracker(self, blockers, refetch_interval=None):
+        data = self.terrain.copy()
+        stamp(data, *blockers)
+        tracker = PathingGridTracker(None, refetch_interval=refetch_interval)
+        tracker.reset(PixelMap.from_array(data), blockers, game_loop=100)
+        return tracker
+
+    def test_extractor_on_geyser(self):
+        tracker = self.make_tracker([self.geyser])
+        grid = tracker.pathing_grid.data_numpy
+        before = grid.copy()
+
+        self.assertEqual(tracker.update([self.geyser, self.extractor], set()), 1)
+        np.testing.assert_array_equal(grid, before)
+
+        # The geyser is still there after the extractor dies
+        self.assertEqual(tracker.update([self.geyser], {self.extractor.tag}), 1)
+        np.testing.assert_array_equal(grid, before)
+
+    def test_extractor_on_geyser_of_fetched_grid(self):
+        tracker = self.make_tracker([self.geyser, self.extractor])
+        grid = tracker.pathing_grid.data_numpy
+        before = grid.copy()
+
+        tracker.update([self.geyser], {self.extractor.tag})
+        np.testing.assert_array_equal(grid, before)
+        self.assertFalse(tracker.refetch_due(101))
+
+    def test_removed_blocker_restores_original_cells(self):
+        depot = make_blocker(4, UnitTypeId.SUPPLYDEPOT, (10, 3), footprint_radius=1)
+        tracker = self.make_tracker([])
+        grid = tracker.pathing_grid.data_numpy
+
+        tracker.update([depot], set())
+        self.assertFalse(grid[2:4, 9:11].any())
+
+        # The cliff under the footprint stays unpathable
+        tracker.update([], {depot.tag})
+        np.testing.assert_array_equal(grid, self.terrain)
+
+    def test_lowered_depot(self):
+        depot = make_blocker(4, UnitTypeId.SUPPLYDEPOT, (3, 15), footprint_radius=1)
+        tracker = self.make_tracker([depot])
+        grid = tracker.pathing_grid.data_numpy
+        blocked = grid.copy()
+
+        depot.type_id = UnitTypeId.SUPPLYDEPOTLOWERED
+        self.assertEqual(tracker.update([depot], set()), 1)
+        np.testing.assert_array_equal(grid, self.terrain)
+        self.assertEqual(tracker.update([depot], set()), 0)
+
+        depot.type_id = UnitTypeId.SUPPLYDEPOT
+        self.assertEqual(tracker.update([depot], set()), 1)
+        np.testing.assert_array_equal(grid, blocked)
+
+    def test_removed_rocks_request_refetch(self):
+        tracker = self.make_tracker([self.rocks], refetch_interval=448)
+        grid = tracker.pathing_grid.data_numpy
+        before = grid.copy()
+
+        # The cells under the rocks of the fetched grid are unknown, so they stay unpathable until the refetch
+        tracker.update([], {self.rocks.tag})
+        np.testing.assert_array_equal(grid, before)
+        self.assertTrue(tracker.refetch_due(101))
+
+        fetched = self.terrain.copy()
+        tracker.reset(PixelMap.from_array(fetched), [], game_loop=101)
+        self.assertFalse(tracker.refetch_due(102))
+
+    def test_refetch_due(self):
+        tracker = PathingGridTracker(None, refetch_interval=448)
+        self.assertFalse(tracker.refetch_due(1000))
+
+        tracker = self.make_tracker([], refetch_interval=448)
+        self.assertFalse(tracker.refetch_due(547))
+        self.assertTrue(tracker.refetch_due(548))
+
+        tracker = self.make_tracker([])
+        self.assertFalse(tracker.refetch_due(10000))
+
+    def test_ignores_flying_and_non_blocking(self):
+        tracker = self.make_tracker([])
+        grid = tracker.pathing_grid.data_numpy
+
+        barracks = make_blocker(5, UnitTypeId.BARRACKSFLYING, (3, 3), footprint_radius=1.5, is_flying=True)
+        tumor = make_blocker(6, UnitTypeId.CREEPTUMORBURROWED, (15, 15), footprint_radius=1)
+        self.assertEqual(tracker.update([barracks, tumor], set()), 0)
+        np.testing.assert_array_equal(grid, self.terrain)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import sys, os
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/.."))
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/../lib/"))
+
+import unittest
+
+import numpy as np
+
+from lib.sc2.pixel_map import PixelMap
+from lib.sc2.position import Point2
+
+
+def flood_fill_all_per_pixel(data: np.ndarray, pred):
+    """
+    The original per-pixel flood_fill_all: 8-connected groups of the pixels satisfying pred
+    """
+    height, width = data.shape
+    groups = set()
+    seen = set()
+    for x in range(width):
+        for y in range(height):
+            if (x, y) in seen or not pred(data[y, x]):
+                continue
+            nodes = set()
+            queue = [(x, y)]
+            while queue:
+                px, py = queue.pop()
+                if not (0 <= px < width and 0 <= py < height) or (px, py) in nodes or not pred(data[py, px]):
+                    continue
+                nodes.add((px, py))
+                queue += [(px + a, py + b) for a in (-1, 0, 1) for b in (-1, 0, 1) if a or b]
+            seen |= nodes
+            groups.add(frozenset(Point2(p) for p in nodes))
+    return groups
+
+
+class TestPixelMap(unittest.TestCase):
+    def test_flood_fill_all(self):
+        rng = np.random.RandomState(0)
+        for density in (0.2, 0.5, 0.8):
+            data = (rng.uniform(size=(20, 30)) < density).astype(np.uint8)
+            pixel_map = PixelMap.from_array(data)
+            self.assertEqual(pixel_map.flood_fill_all(lambda value: value != 0),
+                             flood_fill_all_per_pixel(data, lambda value: value != 0))
+
+    def test_flood_fill_all_without_matches(self):
+        pixel_map = PixelMap.from_array(np.zeros((10, 10), dtype=np.uint8))
+        self.assertEqual(pixel_map.flood_fill_all(lambda value: value != 0), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import sys, os
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/.."))
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/../lib/"))
+
+import contextlib
+import io
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from lambdanaut.combat_simulation import CombatTables
+from lambdanaut.learning import simulate_combat_data
+from lambdanaut.learning.generate_combat_data import BUILDS_TO_GENERATE
+
+# The smallest build, to keep the runs short
+BUILDS = [min(BUILDS_TO_GENERATE, key=lambda build: len(build[0]) * len(build[1]))]
+
+
+def make_tables() -> CombatTables:
+    """
+    Tables with random numbers for every type of the builds, as TrainingBot would save them
+    """
+    type_ids = sorted({unit.value for unit_types1, unit_types2 in BUILDS for unit in unit_types1 + unit_types2})
+    types = len(type_ids)
+    rng = np.random.RandomState(0)
+    return CombatTables(
+        type_ids=np.array(type_ids, dtype=np.int32),
+        health=rng.uniform(30, 300, types),
+        shield=np.where(rng.uniform(size=types) < 0.3, rng.uniform(20, 100, types), 0),
+        flying=rng.uniform(size=types) < 0.2,
+        speed=rng.uniform(2, 4, types),
+        range=rng.uniform(0.1, 7, types),
+        splash=np.ones(types),
+        dps_1=rng.uniform(0, 20, (types, types)),
+        shield_dps_1=rng.uniform(0, 20, (types, types)),
+        dps_2=rng.uniform(0, 20, (types, types)),
+        shield_dps_2=rng.uniform(0, 20, (types, types)),
+    )
+
+
+class TestSimulateCombatData(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.tables_filepath = os.path.join(self.directory, 'combat_tables.npz')
+        make_tables().save(self.tables_filepath)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_main(self, name, workers):
+        """
+        Runs a fresh simulation into its own shards directory and returns the bytes of its output
+        """
+        out_filepath = os.path.join(self.directory, name + '.json')
+        with mock.patch.object(simulate_combat_data, 'BUILDS_TO_GENERATE', BUILDS), \
+                mock.patch.object(simulate_combat_data, 'TABLES_FILE', self.tables_filepath), \
+                mock.patch.object(simulate_combat_data, 'SHARDS_DIR', os.path.join(self.directory, name)), \
+                mock.patch.object(simulate_combat_data, 'SHARD_SIZE', 200), \
+                contextlib.redirect_stdout(io.StringIO()):
+            simulate_combat_data.main(['--workers', str(workers), '--out', out_filepath])
+        with open(out_filepath, 'rb') as f:
+            return f.read()
+
+    def test_output_is_independent_of_workers(self):
+        single = self.run_main('single', workers=1)
+        several = self.run_main('several', workers=3)
+        self.assertGreater(len(single), 2)
+        self.assertEqual(single, several)
+
+
+if __name__ == '__main__':
+    unittest.main()
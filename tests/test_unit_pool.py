@@ -0,0 +1,83 @@
+import sys, os
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/.."))
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/../lib/"))
+
+import unittest
+
+from lib.sc2.ids.unit_typeid import UnitTypeId
+from lib.sc2.unit_pool import UnitPool
+
+from fixtures import make_bot, make_proto
+
+
+class TestUnitPool(unittest.TestCase):
+    def setUp(self):
+        self.bot = make_bot()
+        self.pool = UnitPool()
+
+    def get(self, game_loop, x=10, **proto_kwargs):
+        """
+        Starts a frame and returns the unit of a proto in it
+        """
+        self.bot.state.game_loop = game_loop
+        self.pool.start_frame()
+        return self.pool.get(make_proto(position=(x, 20), **proto_kwargs), self.bot)
+
+    def fill_caches(self, unit):
+        unit.type_id, unit.position, unit.ground_range, unit.orders
+        unit._store_index = 5
+
+    def test_reuses_unreferenced_units_of_two_frames_ago(self):
+        unit = self.get(1, x=10, health=45)
+        self.fill_caches(unit)
+        first_id = id(unit)
+        del unit
+
+        # Units of the previous frame are never changed
+        previous = self.get(2, x=11, health=40)
+        self.assertNotEqual(id(previous), first_id)
+        del previous
+
+        proto = make_proto(position=(12, 20), health=30)
+        self.pool.start_frame()
+        self.bot.state.game_loop = 3
+        unit = self.pool.get(proto, self.bot)
+        self.assertEqual(id(unit), first_id)
+        self.assertEqual(self.pool.reused, 1)
+
+        # Nothing of the old frame is left, only the caches of the unit type are kept
+        self.assertEqual(set(unit.cache), {"type_id", "_type_data"})
+        self.assertIs(unit._proto, proto)
+        self.assertEqual(unit.game_loop, 3)
+        self.assertEqual(unit._store_index, -1)
+        self.assertEqual(unit.position.x, 12)
+        self.assertEqual(unit.health, 30)
+        self.assertEqual(unit.type_id, UnitTypeId.MARINE)
+
+    def test_referenced_units_keep_their_frame(self):
+        kept = self.get(1, x=10, health=45)
+        self.fill_caches(kept)
+        self.get(2, x=11)
+        unit = self.get(3, x=12, health=30)
+
+        self.assertIsNot(unit, kept)
+        self.assertEqual(self.pool.reused, 0)
+        self.assertEqual(kept.position.x, 10)
+        self.assertEqual(kept.health, 45)
+        self.assertEqual(kept.game_loop, 1)
+
+    def test_type_changes_drop_type_caches(self):
+        unit = self.get(1, unit_type=UnitTypeId.ZERGLING)
+        self.fill_caches(unit)
+        del unit
+        self.get(2, unit_type=UnitTypeId.ZERGLING)
+        unit = self.get(3, unit_type=UnitTypeId.BANELING)
+
+        self.assertEqual(self.pool.reused, 1)
+        self.assertEqual(unit.cache, {})
+        self.assertEqual(unit.type_id, UnitTypeId.BANELING)
+        self.assertEqual(unit.ground_range, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
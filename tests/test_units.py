@@ -0,0 +1,168 @@
+import sys, os
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/.."))
+sys.path.append(os.path.realpath(os.path.dirname(__file__)+"/../lib/"))
+
+import math
+import random
+import unittest
+
+from lib.sc2.ids.unit_typeid import UnitTypeId
+from lib.sc2.position import Point2
+from lib.sc2.unit_store import UnitStore
+from lib.sc2.units import Units
+
+from fixtures import GAME_LOOP, make_bot, make_unit
+
+UNIT_TYPES = [UnitTypeId.ZERGLING, UnitTypeId.ROACH, UnitTypeId.MARINE, UnitTypeId.STALKER]
+
+
+def make_units(amount=40, seed=0, spatial_index=False, type_index=False):
+    """
+    Returns a root collection of random units of the current frame, with its UnitStore, like BotAI._prepare_units
+    """
+    rng = random.Random(seed)
+    bot = make_bot()
+    units = Units([], bot)
+    for tag in range(1, amount + 1):
+        unit = make_unit(bot, rng.choice(UNIT_TYPES), (rng.uniform(0, 100), rng.uniform(0, 100)), tag=tag)
+        unit._store_index = len(units)
+        units.append(unit)
+    bot._unit_store = UnitStore(units, GAME_LOOP)
+    units._spatial_index_enabled = spatial_index
+    units._type_index_enabled = type_index
+    return units
+
+
+def distance(unit, position):
+    return math.hypot(unit.position_tuple[0] - position[0], unit.position_tuple[1] - position[1])
+
+
+class TestUnitsTagIndex(unittest.TestCase):
+    def test_find_by_tag(self):
+        units = make_units()
+        for unit in units:
+            self.assertIs(units.find_by_tag(unit.tag), unit)
+        self.assertIsNone(units.find_by_tag(10 ** 9))
+
+    def test_tags_in(self):
+        units = make_units()
+        tags = [5, 3, 3, 17, 10 ** 9, 5]
+        selected = units.tags_in(tags)
+        self.assertEqual([unit.tag for unit in selected], [unit.tag for unit in units if unit.tag in set(tags)])
+
+    def test_set_operations(self):
+        units = make_units()
+        first = units.subgroup(units[:25])
+        second = units.subgroup(units[15:])
+        self.assertEqual([unit.tag for unit in first | second], [unit.tag for unit in units])
+        self.assertEqual([unit.tag for unit in first & second], [unit.tag for unit in units[15:25]])
+        self.assertEqual([unit.tag for unit in first - second], [unit.tag for unit in units[:15]])
+
+    def test_in_place_changes_invalidate_caches(self):
+        units = make_units(spatial_index=True, type_index=True)
+        other = make_units(seed=1)
+        replacement = other[0]
+        replacement._proto.tag = 10 ** 6
+
+        # Build the caches, then replace a unit without changing the length
+        self.assertIsNotNone(units.find_by_tag(units[0].tag))
+        units.closest_to(Point2((50, 50)))
+        units(UnitTypeId.ZERGLING)
+        old_tag = units[0].tag
+        units[0] = replacement
+
+        self.assertIsNone(units.find_by_tag(old_tag))
+        self.assertIs(units.find_by_tag(replacement.tag), replacement)
+        self.assertIsNone(units._cached_store_indices)
+        self.assertIsNone(units._cached_spatial_index)
+
+        units.find_by_tag(replacement.tag)
+        units[1:3] = [units[2], units[1]]
+        self.assertEqual(units.find_by_tag(units[1].tag), units[1])
+        units.reverse()
+        self.assertEqual(units.find_by_tag(units[0].tag), units[0])
+
+
+class TestUnitsTypeIndex(unittest.TestCase):
+    def assertSameUnits(self, units, expected):
+        self.assertEqual([unit.tag for unit in units], [unit.tag for unit in expected])
+
+    def test_selections(self):
+        units = make_units(type_index=True)
+        self.assertIsNotNone(units._type_index)
+        for unit_type in UNIT_TYPES:
+            expected = [unit for unit in units if unit.type_id == unit_type]
+            self.assertSameUnits(units(unit_type), expected)
+            self.assertSameUnits(units.of_type(unit_type), expected)
+            self.assertSameUnits(units.exclude_type(unit_type), [unit for unit in units if unit.type_id != unit_type])
+
+        selection = {UnitTypeId.ZERGLING, UnitTypeId.STALKER}
+        expected = [unit for unit in units if unit.type_id in selection]
+        self.assertSameUnits(units(selection), expected)
+        self.assertSameUnits(units.of_type(selection), expected)
+        # Memoized selections give the same result again
+        self.assertSameUnits(units.of_type(selection), expected)
+        self.assertSameUnits(units(UnitTypeId.HYDRALISK), [])
+
+    def test_selections_keep_store_rows(self):
+        units = make_units(type_index=True)
+        units._store_indices
+        zerglings = units(UnitTypeId.ZERGLING)
+        self.assertEqual(zerglings._store_indices.tolist(), [unit._store_index for unit in zerglings])
+
+
+class TestUnitsDistances(unittest.TestCase):
+    """
+    Vectorized and KD-tree distance queries against brute-force distances
+    """
+
+    def setUp(self):
+        self.position = Point2((40.5, 60.25))
+
+    def check_queries(self, units):
+        position = self.position
+        distances = [distance(unit, position) for unit in units]
+
+        self.assertIs(units.closest_to(position), units[distances.index(min(distances))])
+        self.assertIs(units.furthest_to(position), units[distances.index(max(distances))])
+        self.assertAlmostEqual(units.closest_distance_to(position), min(distances))
+        self.assertAlmostEqual(units.furthest_distance_to(position), max(distances))
+
+        for radius in (0, 5, 20, 200):
+            self.assertEqual({unit.tag for unit in units.closer_than(radius, position)},
+                             {unit.tag for unit, d in zip(units, distances) if d < radius})
+            self.assertEqual({unit.tag for unit in units.further_than(radius, position)},
+                             {unit.tag for unit, d in zip(units, distances) if d > radius})
+
+        nearest = sorted(zip(distances, units), key=lambda pair: pair[0])[:5]
+        self.assertEqual({unit.tag for unit in units.closest_n_units(position, 5)},
+                         {unit.tag for _, unit in nearest})
+
+        self.assertIs(units.closest_to(units[3]), units[3])
+
+        center = units.center
+        self.assertAlmostEqual(center.x, sum(unit.position_tuple[0] for unit in units) / len(units))
+        self.assertAlmostEqual(center.y, sum(unit.position_tuple[1] for unit in units) / len(units))
+
+    def test_vectorized(self):
+        self.check_queries(make_units())
+
+    def test_spatial_index(self):
+        units = make_units(spatial_index=True)
+        self.check_queries(units)
+        self.assertIsNotNone(units._cached_spatial_index)
+
+    def test_in_distance_of_group(self):
+        for spatial_index in (False, True):
+            units = make_units(spatial_index=spatial_index)
+            group_1 = units.subgroup(units[:20])
+            group_2 = units.subgroup(units[20:])
+            group_1._inherit_store_indices(units, list(range(20)))
+            for radius in (3, 10, 30):
+                expected = [unit.tag for unit in group_1
+                            if any(distance(unit, other.position_tuple) < radius for other in group_2)]
+                self.assertEqual([unit.tag for unit in group_1.in_distance_of_group(group_2, radius)], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()